@@ -71,6 +71,18 @@ def run():
 
         st.markdown("***")
 
+        for metric in key_metrics:
+            metric.time_grain = time_grain
+            metric.time_period = time_period["name"]
+            metric.show_incomplete_periods = show_incomplete_periods.get("name")
+
+        # Fetch all key metrics concurrently, with one query per source model
+        MiniMetric.prefetch(
+            key_metrics,
+            max_workers=configuration.tile_prefetch_workers,
+            timeout=configuration.tile_timeout,
+        )
+
         col1, col2, col3 = st.columns(3)
 
         for i in range(0, len(key_metrics), 3):
@@ -78,27 +90,12 @@ def run():
             for index, metric in enumerate(chunk):
                 if index == 0:
                     with col1:
-                        metric.time_grain = time_grain
-                        metric.time_period = time_period["name"]
-                        metric.show_incomplete_periods = show_incomplete_periods.get(
-                            "name"
-                        )
                         metric.render()
                 if index == 1:
                     with col2:
-                        metric.time_grain = time_grain
-                        metric.time_period = time_period["name"]
-                        metric.show_incomplete_periods = show_incomplete_periods.get(
-                            "name"
-                        )
                         metric.render()
                 if index == 2:
                     with col3:
-                        metric.time_grain = time_grain
-                        metric.time_period = time_period["name"]
-                        metric.show_incomplete_periods = show_incomplete_periods.get(
-                            "name"
-                        )
                         metric.render()
 
     with how_to_tab:
@@ -1,6 +1,7 @@
 import duckdb
 from dataclasses import dataclass
 import logging
+import sys
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
 
@@ -31,7 +32,7 @@ class SampleDB:
         # Load Data
         logging.info("Loading Data...")
         con.sql(
-            "CREATE TABLE IF NOT EXISTS sales.opportunities AS FROM read_csv_auto('db/sample_data/opportunities.csv')"
+            "CREATE TABLE IF NOT EXISTS sales.opportunities AS SELECT *, CURRENT_TIMESTAMP::TIMESTAMP AS UPDATED_AT FROM read_csv_auto('db/sample_data/opportunities.csv')"
         )
         con.sql(
             "CREATE TABLE IF NOT EXISTS core.calendar AS FROM read_csv_auto('db/sample_data/calendar.csv')"
@@ -39,6 +40,47 @@ class SampleDB:
         con.sql("SELECT * FROM sales.opportunities LIMIT 5").show()
         con.sql("SELECT * FROM core.calendar LIMIT 5").show()
 
+    def load(self, csv_path: str = "db/sample_data/opportunities.csv"):
+        """
+        Upsert opportunities from a CSV file with the columns of opportunities.csv.
+        New and changed rows are stamped with UPDATED_AT, so loading a CSV of late or corrected
+        opportunities exercises an incremental rollup refresh, see metric_atlas.RollupStore.
+        """
+        logging.info(f"Loading {csv_path}...")
+        con = duckdb.connect(self.file_path)
+        con.sql(
+            "ALTER TABLE sales.opportunities ADD COLUMN IF NOT EXISTS UPDATED_AT TIMESTAMP"
+        )
+
+        # Stage with the table's column types so unchanged rows compare equal
+        con.sql(
+            "CREATE OR REPLACE TEMP TABLE staged_opportunities AS SELECT * EXCLUDE (UPDATED_AT) FROM sales.opportunities LIMIT 0"
+        )
+        con.sql(
+            f"INSERT INTO staged_opportunities SELECT * FROM read_csv_auto('{csv_path}')"
+        )
+        con.sql(
+            """
+            CREATE OR REPLACE TEMP TABLE changed_opportunities AS
+            SELECT * FROM staged_opportunities
+            EXCEPT
+            SELECT * EXCLUDE (UPDATED_AT) FROM sales.opportunities
+            """
+        )
+        con.sql(
+            "DELETE FROM sales.opportunities WHERE OPPORUNITY_ID IN (SELECT OPPORUNITY_ID FROM changed_opportunities)"
+        )
+        con.sql(
+            "INSERT INTO sales.opportunities SELECT *, CURRENT_TIMESTAMP::TIMESTAMP FROM changed_opportunities"
+        )
+
+        changed = con.sql("SELECT COUNT(*) FROM changed_opportunities").fetchall()[0][0]
+        logging.info(f"Upserted {changed} opportunities.")
+        con.close()
+
 
 if __name__ == "__main__":
-    SampleDB().init()
+    if len(sys.argv) > 2 and sys.argv[1] == "--load":
+        SampleDB().load(sys.argv[2])
+    else:
+        SampleDB().init()
@@ -1,5 +1,24 @@
+import copy
+import os
 from dataclasses import dataclass
-import yaml
+from functools import lru_cache
+from metric_atlas.helpers.loaders import load_yaml
+
+
+@lru_cache(maxsize=8)
+def parse_config(path, mtime_ns):
+    # Keyed by modification time, so an edited config.yml is parsed again
+    with open(path, "rb") as f:
+        return load_yaml(f.read())
+
+
+def load_config(path):
+    """
+    Returns the parsed config file, parsed once per modification of the file.
+    Params: path(str), the path of the config file
+    Returns: dict, a copy callers are free to change
+    """
+    return copy.deepcopy(parse_config(path, os.stat(path).st_mtime_ns))
 
 
 @dataclass
@@ -15,17 +34,66 @@ class Config:
     sidebar_links: list[dict] = None
     how_to_videos: list[dict] = None
     enable_sample_data_mode: bool = True
+    snowflake_pool_size: int = 4
+    snowflake_pool_timeout: int = 30
+    enable_rollups: bool = False
+    rollup_path: str = "db/rollups"
+    rollup_late_arriving_days: int = 3
+    result_cache_max_entries: int = 256
+    result_cache_ttl: int = 600
+    result_cache_backend: str = None
+    result_cache_path: str = None
+    tile_prefetch_workers: int = 4
+    tile_timeout: int = 30
+    profile_sample_rows: int = 10000
+    profile_workers: int = 1
+    profile_cache_entries: int = 32
+    filter_catalog_refresh: int = 300
+    filter_option_limit: int = 1000
+    enable_local_grains: bool = True
+    enable_filter_cube: bool = True
+    filter_cube_max_rows: int = 1000000
+    slice_top_n: int = 10
     metric_categories: list[dict] = None
     home_page_key_metrics: list[dict] = None
 
     def __post_init__(self):
         # Load Config
-        with open(self.config_file_path, "r") as f:
-            config = yaml.safe_load(f)
+        config = load_config(self.config_file_path)
 
         self.enable_sample_data_mode = config.get("app").get(
             "enable_sample_data_mode", True
         )
+        self.snowflake_pool_size = config.get("app").get("snowflake_pool_size", 4)
+        self.snowflake_pool_timeout = config.get("app").get(
+            "snowflake_pool_timeout", 30
+        )
+        self.enable_rollups = config.get("app").get("enable_rollups", False)
+        self.rollup_path = config.get("app").get("rollup_path", "db/rollups")
+        self.rollup_late_arriving_days = config.get("app").get(
+            "rollup_late_arriving_days", 3
+        )
+        self.result_cache_max_entries = config.get("app").get(
+            "result_cache_max_entries", 256
+        )
+        self.result_cache_ttl = config.get("app").get("result_cache_ttl", 600)
+        self.result_cache_backend = config.get("app").get("result_cache_backend", None)
+        self.result_cache_path = config.get("app").get("result_cache_path", None)
+        self.tile_prefetch_workers = config.get("app").get("tile_prefetch_workers", 4)
+        self.tile_timeout = config.get("app").get("tile_timeout", 30)
+        self.profile_sample_rows = config.get("app").get("profile_sample_rows", 10000)
+        self.profile_workers = config.get("app").get("profile_workers", 1)
+        self.profile_cache_entries = config.get("app").get("profile_cache_entries", 32)
+        self.filter_catalog_refresh = config.get("app").get(
+            "filter_catalog_refresh", 300
+        )
+        self.filter_option_limit = config.get("app").get("filter_option_limit", 1000)
+        self.enable_local_grains = config.get("app").get("enable_local_grains", True)
+        self.enable_filter_cube = config.get("app").get("enable_filter_cube", True)
+        self.filter_cube_max_rows = config.get("app").get(
+            "filter_cube_max_rows", 1000000
+        )
+        self.slice_top_n = config.get("app").get("slice_top_n", 10)
         self.logo_url = config.get("app").get("logo_url", None)
         self.name = config.get("app").get("name", None)
         self.sidebar_links = config.get("app").get("sidebar_links", None)
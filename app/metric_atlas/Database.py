@@ -1,7 +1,13 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
 import streamlit as st
-import snowflake.connector
-import duckdb
+from metric_atlas.Config import Config
+from metric_atlas.helpers.queries.connections import (
+    duckdb_connection_manager,
+    snowflake_pool,
+)
+from metric_atlas.helpers.queries.single_flight import query_flight
+from metric_atlas.helpers.queries.async_queries import call
 
 
 @dataclass
@@ -16,38 +22,59 @@ class Database:
         elif self.connection_type == "snowflake":
             self.connection_parameters = st.secrets["snowflake"]
 
-    @st.cache_resource(show_spinner=False)
+    @contextmanager
     def connection(self):
         if self.connection_type == "duckdb":
-            connection = duckdb.connect(self.connection_parameters["path"])
+            yield duckdb_connection_manager(self.connection_parameters["path"]).cursor()
 
         elif self.connection_type == "snowflake":
-            connection = snowflake.connector.connect(
-                **self.connection_parameters, client_session_keep_alive=True
+            configuration = Config()
+            pool = snowflake_pool(
+                dict(self.connection_parameters),
+                size=configuration.snowflake_pool_size,
+                timeout=configuration.snowflake_pool_timeout,
             )
 
-        return connection
+            with pool.connection() as connection:
+                yield connection
 
     @st.cache_data(ttl=600, show_spinner=False)
     def execute_query(self, query, data_frame=True):
-        connection = self.connection()
+        # Concurrent cache misses for the same query share one execution
+        data, shared = query_flight().do(
+            ("database", self.connection_type, query, data_frame),
+            lambda: self.run_query(query, data_frame),
+        )
 
-        if self.connection_type == "duckdb":
-            if data_frame is True:
-                data = connection.sql(query).df()
-            else:
-                data = connection.sql(query).fetchall()
+        if shared:
+            data = data.copy() if data_frame is True else list(data)
 
-        elif self.connection_type == "snowflake":
-            cur = connection.cursor(snowflake.connector.DictCursor)
+        return data
+
+    async def execute(self, query, data_frame=True):
+        # Runs execute_query() in a worker thread, see async_queries.gather()
+        return await call(self.execute_query, query, data_frame)
 
-            try:
+    def run_query(self, query, data_frame=True):
+        with self.connection() as connection:
+            if self.connection_type == "duckdb":
                 if data_frame is True:
-                    data = cur.execute(query).fetch_pandas_all()
+                    data = connection.sql(query).df()
                 else:
-                    data = cur.execute(query).fetchall()
-            finally:
-                cur.close()
+                    data = connection.sql(query).fetchall()
+
+            elif self.connection_type == "snowflake":
+                import snowflake.connector
+
+                cur = connection.cursor(snowflake.connector.DictCursor)
+
+                try:
+                    if data_frame is True:
+                        data = cur.execute(query).fetch_pandas_all()
+                    else:
+                        data = cur.execute(query).fetchall()
+                finally:
+                    cur.close()
 
         return data
 
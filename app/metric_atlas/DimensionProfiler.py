@@ -0,0 +1,252 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+import pandas as pd
+import streamlit as st
+import streamlit.components.v1 as components
+from metric_atlas.Config import Config
+
+
+@dataclass
+class ProfileJob:
+    """
+    A data class for the profile report of a dimension that is computed in the background.
+    """
+
+    key: tuple
+    rows: int
+    stage: str = "Waiting for a worker"
+    progress: float = 0.0
+    html: str = None
+    error: str = None
+    future: Future = field(default=None, repr=False)
+
+
+@dataclass
+class DimensionProfiler:
+    """
+    Profiles dimensions on a background thread pool and keeps the report HTML of the most recent
+    profiles, keyed by metric, dimension and a hash of the profiled rows. At most ``max_entries``
+    profiles are queued or running at once, so running jobs, which are never evicted, can't grow
+    the jobs past it.
+    """
+
+    max_workers: int = 1
+    max_entries: int = 32
+    jobs: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    executor: ThreadPoolExecutor = field(default=None, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="dimension-profiler"
+        )
+
+    @staticmethod
+    def sample(data_frame, max_rows):
+        """
+        A method that returns a bounded, repeatable sample of the rows to profile.
+        Args:
+            data_frame: The rows to profile.
+            max_rows: The maximum number of rows to profile.
+        Returns:
+            The data frame, or a sample of max_rows rows of it.
+        """
+        if max_rows is None or len(data_frame) <= max_rows:
+            return data_frame
+
+        return data_frame.sample(n=max_rows, random_state=0)
+
+    @staticmethod
+    def key(metric, dimension, data_frame):
+        """
+        A method that returns the key a profile is cached under.
+        Args:
+            metric: The metric the rows were queried for.
+            dimension: The profiled dimension.
+            data_frame: The profiled rows.
+        Returns:
+            A tuple of the metric category and name, the dimension and the data version, a hash of
+            the profiled rows.
+        """
+        row_hashes = pd.util.hash_pandas_object(data_frame, index=False)
+        data_version = hashlib.sha256(row_hashes.values.tobytes()).hexdigest()
+
+        return (metric.category, metric.name, dimension.name, data_version)
+
+    def job(self, key):
+        """
+        A method that returns the profile job of a key.
+        Args:
+            self: The class instance.
+            key: The key of the profile, see key().
+        Returns:
+            The ProfileJob, None if the profile was never requested or was evicted.
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                self.jobs.move_to_end(key)
+
+            return job
+
+    def submit(self, key, data_frame, title=None):
+        """
+        A method that starts profiling rows in the background unless they are already profiled or
+        being profiled.
+        Args:
+            self: The class instance.
+            key: The key of the profile, see key().
+            data_frame: The rows to profile, see sample().
+            title: The title of the report.
+        Returns:
+            The ProfileJob, with an error and not started when max_entries profiles are pending.
+        """
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.error is None:
+                self.jobs.move_to_end(key)
+                return job
+
+            pending = sum(not job.future.done() for job in self.jobs.values())
+            if pending >= self.max_entries:
+                return ProfileJob(
+                    key=key,
+                    rows=len(data_frame),
+                    stage="Failed",
+                    error="Too many profiles are running, try again once they finish.",
+                )
+
+            job = ProfileJob(key=key, rows=len(data_frame))
+            self.jobs[key] = job
+            job.future = self.executor.submit(self.run, job, data_frame, title)
+
+            # Evict the least recently used reports, jobs that are still running are kept
+            for evicted_key in list(self.jobs):
+                if len(self.jobs) <= self.max_entries:
+                    break
+                if self.jobs[evicted_key].future.done():
+                    del self.jobs[evicted_key]
+
+            return job
+
+    def run(self, job, data_frame, title=None):
+        """
+        A method that profiles rows and stores the report HTML on the job.
+        Args:
+            self: The class instance.
+            job: The ProfileJob to update.
+            data_frame: The rows to profile.
+            title: The title of the report.
+        """
+        try:
+            job.stage, job.progress = "Loading the profiler", 0.1
+            # Imported on use, profiling pulls in ydata-profiling, matplotlib and scipy
+            try:
+                from ydata_profiling import ProfileReport
+            except ImportError:
+                from pandas_profiling import ProfileReport
+
+            job.stage, job.progress = f"Profiling {job.rows:,} rows", 0.2
+            report = ProfileReport(
+                data_frame, title=title or "Profiling Report", progress_bar=False
+            )
+            report.config.html.inline = True
+            report.config.html.minify_html = True
+            report.config.html.use_local_assets = True
+            report.config.html.navbar_show = False
+            report.config.html.full_width = True
+            report.get_description()
+
+            job.stage, job.progress = "Rendering the report", 0.8
+            job.html = report.to_html()
+
+            job.stage, job.progress = "Done", 1.0
+        except Exception as error:
+            print(error)
+            job.stage, job.error = "Failed", str(error)
+
+
+@st.cache_resource(show_spinner=False)
+def dimension_profiler(max_workers=1, max_entries=32):
+    return DimensionProfiler(max_workers=max_workers, max_entries=max_entries)
+
+
+def render_progress(job, key, poll_interval=1):
+    """
+    Renders the progress of a running profile. With fragments (Streamlit 1.37+) only the progress
+    bar reruns every poll_interval seconds, and the page reruns once the report is ready. Without
+    them a Refresh button reruns the page on demand, rather than rerunning every tab in a loop.
+    Params: job(ProfileJob), the running profile
+            key(str), the prefix of the widget keys
+            poll_interval(float), the seconds between progress updates
+    Returns: None
+    """
+    fragment = getattr(st, "fragment", None)
+
+    if fragment is None:
+        st.progress(job.progress, text=f"{job.stage}...")
+        st.button("Refresh", key=f"{key}-refresh")
+        return
+
+    @fragment(run_every=poll_interval)
+    def progress():
+        if job.html is not None or job.error is not None:
+            st.rerun()
+
+        st.progress(job.progress, text=f"{job.stage}...")
+
+    progress()
+
+
+def render_dimension_profile(
+    slice_data, metric, dimension, key="profile-dimension", poll_interval=1
+):
+    """
+    Renders the profile of a dimension once it is requested, profiling runs in the background so
+    reruns aren't blocked by it, see render_progress().
+    Params: slice_data(pd.DataFrame), the metric sliced by the dimension
+            metric(Metric), the metric
+            dimension(MetricDimension), the dimension to profile
+            key(str), the prefix of the widget keys
+            poll_interval(float), the seconds between progress updates
+    Returns: None
+    """
+    configuration = Config()
+    profiler = dimension_profiler(
+        max_workers=configuration.profile_workers,
+        max_entries=configuration.profile_cache_entries,
+    )
+
+    data_frame = profiler.sample(
+        slice_data[[dimension.label]], configuration.profile_sample_rows
+    )
+    profile_key = profiler.key(metric, dimension, data_frame)
+    job = profiler.job(profile_key)
+
+    if job is None or job.error is not None:
+        if job is not None:
+            st.warning(f"Unable to profile {dimension.label}. {job.error}")
+
+        if len(data_frame) < len(slice_data):
+            st.caption(
+                f"Profiles a sample of {len(data_frame):,} of {len(slice_data):,} rows."
+            )
+
+        if not st.button(f"Profile {dimension.label}", key=f"{key}-start"):
+            return
+
+        job = profiler.submit(
+            profile_key, data_frame, title=f"{metric.label} by {dimension.label}"
+        )
+        if job.error is not None:
+            st.warning(f"Unable to profile {dimension.label}. {job.error}")
+            return
+
+    if job.html is None:
+        render_progress(job, key, poll_interval)
+        return
+
+    components.html(job.html, height=600, scrolling=True)
@@ -0,0 +1,175 @@
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+import streamlit as st
+from metric_atlas.helpers.queries import queries as query_helpers
+from metric_atlas.helpers.queries.result_cache import configured_result_cache, query_key
+from metric_atlas.helpers.queries.single_flight import query_flight
+
+
+@dataclass
+class FilterValues:
+    """
+    A data class for the distinct values of a filter field and the number of rows of each, with an
+    index for case insensitive prefix search.
+    """
+
+    values: list = field(default_factory=list)
+    counts: list = field(default_factory=list)
+    search_keys: list = field(default_factory=list, init=False, repr=False)
+    search_values: list = field(default_factory=list, init=False, repr=False)
+    value_set: frozenset = field(default_factory=frozenset, init=False, repr=False)
+
+    def __post_init__(self):
+        index = sorted((value.casefold(), value) for value in self.values)
+        self.search_keys = [key for key, _ in index]
+        self.search_values = [value for _, value in index]
+        self.value_set = frozenset(self.values)
+
+    def search(self, prefix="", limit=None):
+        """
+        A method that finds the values that start with a prefix, ignoring case.
+        Args:
+            self: The class instance.
+            prefix: The start of the values.
+            limit: The maximum number of values to return, all of them when None.
+        Returns:
+            A list of the matching values in alphabetical order.
+        """
+        prefix = prefix.casefold()
+        start = bisect_left(self.search_keys, prefix)
+
+        matches = []
+        for key, value in zip(self.search_keys[start:], self.search_values[start:]):
+            if not key.startswith(prefix) or (limit and len(matches) >= limit):
+                break
+            matches.append(value)
+
+        return matches
+
+
+@dataclass
+class CatalogEntry:
+    """
+    A data class for the filter values of a model and the version of the data they were read from.
+    """
+
+    fields: dict
+    data_version: str = None
+    checked_at: float = 0.0
+
+
+@dataclass
+class FilterCatalog:
+    """
+    The distinct values of the filter fields of each model, read in one pass over the model with
+    GROUPING SETS, see options_query.sql, and served from memory.
+
+    The version of a model's data is checked at most every ``refresh_interval`` seconds and the
+    values are read again when it changed. The query results are kept in the result cache, so
+    processes that share a cache backend share the catalog.
+    """
+
+    refresh_interval: int = 300
+    entries: dict = field(default_factory=dict, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def field_values(self, schema, model, fields) -> dict:
+        """
+        A method that returns the values of the filter fields of a model.
+        Args:
+            self: The class instance.
+            schema: The schema of the model.
+            model: The name of the model.
+            fields: The names of the filter fields.
+        Returns:
+            A dict of FilterValues keyed by field name.
+        """
+        key = (schema, model, tuple(sorted(fields)))
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is not None and now - entry.checked_at < self.refresh_interval:
+            return entry.fields
+
+        data_version = query_helpers.data_version("warehouse", schema, model)
+        is_unchanged = entry is not None and data_version == entry.data_version
+        is_unchanged = is_unchanged and data_version is not None
+        if is_unchanged:
+            entry.checked_at = now
+            return entry.fields
+
+        entry = self.build(schema, model, key[2], data_version)
+        entry.checked_at = now
+
+        with self.lock:
+            self.entries[key] = entry
+
+        return entry.fields
+
+    def build(self, schema, model, fields, data_version=None) -> CatalogEntry:
+        """
+        A method that reads the values of the filter fields of a model.
+        Args:
+            self: The class instance.
+            schema: The schema of the model.
+            model: The name of the model.
+            fields: The names of the filter fields.
+            data_version: The version of the model's data, see queries.data_version().
+        Returns:
+            A CatalogEntry.
+        """
+        query, params = query_helpers.generate_options_query(
+            schema, model, [{"name": name} for name in fields]
+        )
+        key = query_key(query, params)
+        cache = configured_result_cache()
+
+        # The values stay cached until the data changes, or expire when its version is unknown
+        table, _ = query_flight().do(
+            key,
+            lambda: cache.get_or_compute(
+                key,
+                lambda: query_helpers.execute_query(query, params, arrow=True),
+                data_version=data_version,
+                is_closed=data_version is not None,
+            ),
+        )
+
+        values = {name: ([], []) for name in fields}
+        for dimension, option, count in zip(
+            table.column("dimension").to_pylist(),
+            table.column("select_option").to_pylist(),
+            table.column("row_count").to_pylist(),
+        ):
+            values[dimension][0].append(option)
+            values[dimension][1].append(count)
+
+        return CatalogEntry(
+            fields={name: FilterValues(*values[name]) for name in fields},
+            data_version=data_version,
+        )
+
+    def options(self, schema, model, fields) -> dict:
+        """
+        A method that returns the options of the filter fields of a model.
+        Args:
+            self: The class instance.
+            schema: The schema of the model.
+            model: The name of the model.
+            fields: The names of the filter fields.
+        Returns:
+            A dict of lists of values in alphabetical order keyed by field name.
+        """
+        return {
+            name: values.values
+            for name, values in self.field_values(schema, model, fields).items()
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def filter_catalog(refresh_interval=300):
+    return FilterCatalog(refresh_interval=refresh_interval)
@@ -0,0 +1,160 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+
+
+@dataclass
+class FilterCube:
+    """
+    The daily components of metrics for every combination of the values of their filter fields, see
+    rollup_query.sql. The values of each field are dictionary encoded, so any filter is answered
+    with boolean masks over the codes and summed by day, without querying the source again.
+    """
+
+    day_numbers: np.ndarray
+    codes: dict
+    dictionaries: dict
+    components: dict
+    empty_values: dict
+
+    @classmethod
+    def from_table(cls, table, fields, empty_values):
+        """
+        A method that encodes the result of the cube query.
+        Args:
+            table: The Arrow table of the cube query, a row per day and combination of values.
+            fields: The filter fields the rows are grouped by.
+            empty_values: The value of each component on a day without rows, see RollupStore.
+        Returns:
+            A FilterCube.
+        """
+        table = table.rename_columns([name.lower() for name in table.column_names])
+
+        day_numbers = pc.cast(table.column("rollup_date"), pa.date32())
+        day_numbers = pc.cast(day_numbers, pa.int32()).to_numpy()
+
+        # Values are compared as text, like the filter options, see options_query.sql
+        codes, dictionaries = {}, {}
+        for name in fields:
+            encoded = pc.cast(table.column(name), pa.string()).combine_chunks()
+            encoded = encoded.dictionary_encode()
+            codes[name] = pc.fill_null(encoded.indices, -1).to_numpy()
+            dictionaries[name] = {
+                value: code for code, value in enumerate(encoded.dictionary.to_pylist())
+            }
+
+        components = {
+            name: pc.cast(table.column(name), pa.float64()).to_numpy()
+            for name in empty_values
+        }
+
+        return cls(day_numbers, codes, dictionaries, components, empty_values)
+
+    def mask(self, filters):
+        """
+        A method that selects the rows that pass the filters.
+        Args:
+            self: The class instance.
+            filters: The filters, each field's values are combined with OR and the fields with AND.
+        Returns:
+            A boolean array with an element per row.
+        """
+        mask = np.ones(len(self.day_numbers), dtype=bool)
+
+        for filter in filters:
+            dictionary = self.dictionaries[filter["field"]]
+            selected = [
+                dictionary[value]
+                for value in filter["filter_values"]
+                if value in dictionary
+            ]
+            mask &= np.isin(self.codes[filter["field"]], selected)
+
+        return mask
+
+    def apply(self, daily, filters):
+        """
+        A method that replaces the components of a daily series with their filtered values.
+        Args:
+            self: The class instance.
+            daily: The unfiltered daily series, see local_grains.daily_series().
+            filters: The filters.
+        Returns:
+            A copy of the daily series with the components summed over the rows that pass the
+            filters, or their empty value on days without such rows.
+        """
+        daily = daily.copy()
+        mask = self.mask(filters)
+
+        day_ids = daily["date_id"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        positions = self.day_numbers[mask] - (day_ids[0] if len(day_ids) else 0)
+        is_in_series = (positions >= 0) & (positions < len(day_ids))
+        positions = positions[is_in_series]
+
+        for name, empty_value in self.empty_values.items():
+            values = self.components[name][mask][is_in_series]
+            is_value = ~np.isnan(values)
+
+            # SUM ignores NULLs and is NULL without values, like the re-aggregated rollups
+            sums = np.bincount(
+                positions[is_value], weights=values[is_value], minlength=len(day_ids)
+            )
+            has_values = np.bincount(positions[is_value], minlength=len(day_ids)) > 0
+            empty_value = np.nan if empty_value is None else empty_value
+            sums = np.where(has_values, sums, empty_value)
+
+            if daily[name].dtype.kind in "iu" and not np.isnan(sums).any():
+                sums = sums.astype(daily[name].dtype)
+
+            daily[name] = sums
+
+        return daily
+
+
+@dataclass
+class FilterCubes:
+    """
+    The encoded filter cubes of the most recent cube queries, rebuilt when the cached query result
+    they were encoded from changes.
+    """
+
+    max_entries: int = 8
+    entries: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def cube(self, key, table, fields, empty_values):
+        """
+        A method that returns the filter cube of a cube query result.
+        Args:
+            self: The class instance.
+            key: The key of the cube query.
+            table: The Arrow table of the cube query.
+            fields: The filter fields the rows are grouped by.
+            empty_values: The value of each component on a day without rows.
+        Returns:
+            A FilterCube.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is table:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        cube = FilterCube.from_table(table, fields, empty_values)
+
+        with self.lock:
+            self.entries[key] = (table, cube)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return cube
+
+
+@st.cache_resource(show_spinner=False)
+def filter_cubes(max_entries=8):
+    return FilterCubes(max_entries=max_entries)
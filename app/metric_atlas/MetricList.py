@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from metric_atlas.helpers.models.Metric import Metric
-from metric_atlas.helpers import helpers
+from metric_atlas.MetricRegistry import metric_registry
 import streamlit as st
 
 
@@ -15,7 +15,7 @@ class MetricList:
 
     def __post_init__(self):
         if self.metrics is None:
-            self.metrics = helpers.get_metric_definition(self.domain)
+            self.metrics = metric_registry().category_definitions(self.domain)
 
     def render(self):
         """
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import threading
+from dataclasses import dataclass, field
+import streamlit as st
+from metric_atlas.helpers.loaders import load_metric_snapshot, load_yaml
+from metric_atlas.helpers.models.Metric import Metric
+
+
+@dataclass
+class MetricRegistry:
+    """
+    The metric definitions of every category in config/, loaded once and indexed by category and
+    name and by model.
+
+    Every lookup first compares the modification time of config.yml and the category files with
+    the ones they were loaded at, and only reloads the files that changed.
+    """
+
+    config_path: str = "config"
+    categories: list[dict] = field(default_factory=list, init=False)
+    definitions: dict = field(default_factory=dict, init=False, repr=False)
+    metrics: dict = field(default_factory=dict, init=False, repr=False)
+    models: dict = field(default_factory=dict, init=False, repr=False)
+    files: dict = field(default_factory=dict, init=False, repr=False)
+    lock: threading.RLock = field(
+        default_factory=threading.RLock, init=False, repr=False
+    )
+
+    def refresh(self):
+        """
+        A method that reloads config.yml and the category files that changed since they were loaded.
+        Args:
+            self: The class instance.
+        Returns:
+            The registry.
+        """
+        with self.lock:
+            changed = False
+
+            config_file = os.path.join(self.config_path, "config.yml")
+            if self.is_changed(config_file):
+                config = load_yaml(self.read(config_file)) or {}
+                self.categories = config.get("metric_categories") or []
+                changed = True
+
+            names = [category["name"] for category in self.categories]
+            names += [name for name in self.definitions if name not in names]
+
+            for name in names:
+                changed = self.load_category(name, missing_ok=True) or changed
+
+            if changed:
+                self.index()
+
+        return self
+
+    def is_changed(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return path in self.files
+
+        return self.files.get(path, (None, None))[0] != mtime
+
+    def read(self, path):
+        """
+        A method that reads a config file and records its modification time and content hash.
+        Args:
+            self: The class instance.
+            path: The path of the file.
+        Returns:
+            bytes, the content of the file.
+        """
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, "rb") as f:
+            content = f.read()
+
+        self.files[path] = (mtime, hashlib.sha256(content).hexdigest())
+
+        return content
+
+    def load_category(self, name, missing_ok=False):
+        """
+        A method that loads the metrics of a category file unless it is unchanged.
+        Args:
+            self: The class instance.
+            name: The name of the category, its metrics are in config/{name}.yml.
+            missing_ok: Whether a missing file drops the category instead of raising
+                FileNotFoundError, e.g. for categories that only have dbt metrics.
+        Returns:
+            Whether the metrics of the category changed.
+        """
+        path = os.path.join(self.config_path, f"{name}.yml")
+
+        if not os.path.exists(path):
+            if not missing_ok:
+                raise FileNotFoundError(path)
+
+            self.files.pop(path, None)
+            return self.definitions.pop(name, None) is not None
+
+        if name in self.definitions and not self.is_changed(path):
+            return False
+
+        metrics = load_metric_snapshot(path, self.read(path))
+        self.definitions[name] = sorted(metrics, key=lambda d: d.label)
+
+        return True
+
+    def index(self):
+        # Build the indexes aside and swap them in, lookups read them without the lock
+        metrics = {}
+        models = {}
+
+        for name, definitions in self.definitions.items():
+            for metric in definitions:
+                metrics[(name, metric.name)] = metric
+                models.setdefault((metric.schema, metric.model), []).append(metric)
+
+        self.metrics, self.models = metrics, models
+
+    def category(self, name) -> dict:
+        """
+        A method that returns the configuration of a category.
+        Args:
+            self: The class instance.
+            name: The name of the category.
+        Returns:
+            The category's entry in config.yml metric_categories, None if there is none.
+        """
+        for category in self.refresh().categories:
+            if category["name"] == name:
+                return category
+
+        return None
+
+    def category_definitions(self, name) -> list[Metric]:
+        """
+        A method that returns the metrics of a category.
+        Args:
+            self: The class instance.
+            name: The name of the category.
+        Returns:
+            A list of the category's metrics sorted by label. Raises FileNotFoundError when the
+            category has no config file.
+        """
+        with self.lock:
+            self.refresh()
+            if name not in self.definitions:
+                if self.load_category(name):
+                    self.index()
+
+            return list(self.definitions[name])
+
+    def metric(self, category, name) -> Metric:
+        """
+        A method that looks up a metric.
+        Args:
+            self: The class instance.
+            category: The name of the metric's category.
+            name: The name of the metric.
+        Returns:
+            The metric, None if the category has no metric with the name.
+        """
+        return self.refresh().metrics.get((category, name))
+
+    def model_metrics(self, schema, model) -> list[Metric]:
+        """
+        A method that returns the metrics computed from a model.
+        Args:
+            self: The class instance.
+            schema: The schema of the model.
+            model: The name of the model.
+        Returns:
+            A list of the metrics of every category that read the model.
+        """
+        return list(self.refresh().models.get((schema, model), []))
+
+    def version(self) -> str:
+        """
+        A method that returns a hash of the loaded config files, the same on every replica that
+        runs the same configuration.
+        Args:
+            self: The class instance.
+        Returns:
+            str, the hash.
+        """
+        with self.lock:
+            self.refresh()
+            digest = hashlib.sha256()
+            for path in sorted(self.files):
+                digest.update(self.files[path][1].encode("utf-8"))
+
+            return digest.hexdigest()
+
+
+@st.cache_resource(show_spinner=False)
+def metric_registry(config_path="config"):
+    return MetricRegistry(config_path=config_path)
@@ -0,0 +1,117 @@
+import threading
+import weakref
+from dataclasses import dataclass, field
+from functools import cached_property
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+import metric_atlas.helpers.helpers as helpers
+from metric_atlas.helpers.models.Metric import Metric
+from metric_atlas.helpers.queries.arrow_tables import to_data_frame
+
+
+@dataclass
+class MetricsTable:
+    """
+    The tables of the Metrics Data and Raw Data tabs for the result of a metric query. The query
+    returns exactly one row per time period, so the Metrics Data table is its transpose, with a
+    column per time period, rather than a pivot that aggregates. Downloads are written from the raw
+    values and the formatted tables are only built when they are displayed.
+    """
+
+    rows: pd.DataFrame
+    metric: Metric
+
+    @classmethod
+    def from_table(cls, table, metric):
+        """
+        A method that reads the result of a metric query.
+        Args:
+            table: The Arrow table of the metric query.
+            metric: The queried metric.
+        Returns:
+            A MetricsTable.
+        """
+        return cls(rows=to_data_frame(table).fillna(0), metric=metric)
+
+    @staticmethod
+    def transpose(rows):
+        """
+        A method that turns the rows of the time periods into columns, in the order of the time
+        periods, with a row per column in alphabetical order.
+        Args:
+            rows: A table with a row per time period.
+        Returns:
+            The transposed table.
+        """
+        rows = rows.sort_values("Time Period", kind="stable").set_index("Time Period")
+
+        return rows[sorted(rows.columns)].T
+
+    @cached_property
+    def pivot(self):
+        return self.transpose(self.rows)
+
+    @cached_property
+    def formatted_rows(self):
+        return helpers.table_format(self.rows, self.metric)["table_data"]
+
+    @cached_property
+    def formatted_pivot(self):
+        return self.transpose(self.formatted_rows)
+
+    @cached_property
+    def pivot_csv(self):
+        return self.pivot.to_csv().encode("utf-8")
+
+    @cached_property
+    def rows_csv(self):
+        return self.rows.to_csv().encode("utf-8")
+
+
+@dataclass
+class MetricsTables:
+    """
+    The metrics tables of metric query results, kept for as long as the result itself.
+    """
+
+    tables: dict = field(default_factory=dict, init=False, repr=False)
+    # Reentrant, a table can be collected and dropped while the lock is held
+    lock: threading.RLock = field(
+        default_factory=threading.RLock, init=False, repr=False
+    )
+
+    def table(self, table: pa.Table, metric) -> MetricsTable:
+        """
+        A method that returns the metrics table of a query result.
+        Args:
+            self: The class instance.
+            table: The Arrow table of the metric query, see queries.run_query().
+            metric: The queried metric.
+        Returns:
+            A MetricsTable.
+        """
+        # Arrow tables aren't hashable, entries are keyed by id and dropped with their table
+        with self.lock:
+            entry = self.tables.get(id(table))
+
+        if entry is not None and entry[0]() is table and entry[1].metric == metric:
+            return entry[1]
+
+        metrics_table = MetricsTable.from_table(table, metric)
+
+        with self.lock:
+            if id(table) not in self.tables:
+                weakref.finalize(table, self.drop, id(table))
+            self.tables[id(table)] = (weakref.ref(table), metrics_table)
+
+        return metrics_table
+
+    def drop(self, key):
+        with self.lock:
+            self.tables.pop(key, None)
+
+
+@st.cache_resource(show_spinner=False)
+def metrics_tables():
+    return MetricsTables()
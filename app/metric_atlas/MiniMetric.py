@@ -1,9 +1,16 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import timedelta
 from dataclasses import dataclass, field
 from metric_atlas.helpers.models.Metric import Metric
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from metric_atlas.helpers import helpers
+from metric_atlas.MetricRegistry import metric_registry
 from metric_atlas.helpers.queries import queries as query_helpers
+from metric_atlas.helpers.metrics import local_grains
 import plotly.graph_objects as go
 
 
@@ -21,28 +28,46 @@ class MiniMetric:
     time_period: str = "last_six_periods"
     show_incomplete_periods: bool = False
     filters: list = field(default_factory=lambda: [])
+    data: dict = field(default_factory=dict, repr=False)
+    errors: dict = field(default_factory=dict, repr=False)
 
     def __post_init__(self):
         # Set Metric from Metric Category and Metric Name
         if self.metric is None:
-            metrics = helpers.get_metric_definition(self.metric_category)
-            metric_list = [
-                metric for metric in metrics if metric.name == self.metric_name
-            ]
-            if len(metric_list) > 0:
-                self.metric = metric_list[0]
+            self.metric = metric_registry().metric(
+                self.metric_category, self.metric_name
+            )
 
         # Set Label
         if self.label is None and self.metric is not None:
             self.label = self.metric.label
 
-    def get_data(self):
+    def data_key(self):
         """
-        A method that returns the data for the metric.
+        A method that returns the key the data of the metric is memoized under.
         Args:
             self: The class instance.
         Returns:
-            A dataframe for the metric.
+            A tuple of the time grain, time period, incomplete periods flag and filters.
+        """
+        filters = tuple(
+            (filter.field, tuple(filter.filter_values)) for filter in self.filters
+        )
+
+        return (
+            self.time_grain,
+            self.time_period,
+            bool(self.show_incomplete_periods),
+            filters,
+        )
+
+    def query_parameters(self):
+        """
+        A method that returns the parameters of the query for the metric.
+        Args:
+            self: The class instance.
+        Returns:
+            A dict with the time grain, query dates and filters of the query.
         """
         time_periods = helpers.standard_periods(self.time_grain)
         time_period = [
@@ -71,26 +96,158 @@ class MiniMetric:
             }
             filters.append(filter_dict)
 
-        # Get Metric Data
-        query = query_helpers.generate_query(
-            self.metric.schema,
-            self.metric.model,
-            self.metric.timestamp,
-            self.time_grain,
-            start_date,
-            query_end_date,
-            metrics=[self.metric],
-            filters=filters,
-            is_mid_period=is_mid_period,
+        return {
+            "time_grain": self.time_grain,
+            "start_date": start_date,
+            "end_date": query_end_date,
+            "is_mid_period": is_mid_period,
+            "filters": filters,
+        }
+
+    @staticmethod
+    def prefetch(mini_metrics, max_workers=4, timeout=30):
+        """
+        A method that fetches the data for several mini metrics concurrently, with one query per
+        source model. Mini metrics that share a schema, model, timestamp and query parameters are
+        computed together and each receives its own columns of the wide result. Queries of different
+        models run at the same time on a bounded thread pool, a mini metric whose query fails or
+        doesn't finish within ``timeout`` seconds keeps the error and renders a placeholder.
+        The data is always fetched again, so a new script run picks up new results, and memoized for
+        get_data().
+        Args:
+            mini_metrics: The mini metrics to fetch data for.
+            max_workers: The maximum number of queries that run at the same time.
+            timeout: The number of seconds to wait for the data of a mini metric.
+        """
+        groups = {}
+        for mini_metric in mini_metrics:
+            if mini_metric.metric is None:
+                continue
+
+            parameters = mini_metric.query_parameters()
+            key = (
+                query_helpers.metric_source_key(mini_metric.metric),
+                repr(parameters),
+            )
+            groups.setdefault(key, (parameters, []))[1].append(mini_metric)
+
+        if len(groups) == 0:
+            return
+
+        # Workers share the script's context so cached resources and connections resolve as usual
+        context = get_script_run_ctx()
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(groups))),
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), context),
+        )
+
+        futures = []
+        for parameters, group in groups.values():
+            metrics = [mini_metric.metric for mini_metric in group]
+            future = executor.submit(MiniMetric.fetch, metrics, parameters)
+            futures.append((future, parameters, group))
+
+        # Queries that time out keep running in the background and still fill the result cache
+        executor.shutdown(wait=False)
+        deadline = time.monotonic() + timeout
+
+        for future, parameters, group in futures:
+            try:
+                data = future.result(timeout=max(0, deadline - time.monotonic()))
+                error = None
+            except FutureTimeoutError:
+                data = None
+                error = f"Timed out after {timeout} seconds."
+            except Exception as e:
+                print(e)
+                data = None
+                error = str(e)
+
+            for mini_metric in group:
+                key = mini_metric.data_key()
+                if data is not None:
+                    mini_metric.data[key] = query_helpers.split_metric_data(
+                        data, mini_metric.metric
+                    )
+                    mini_metric.errors.pop(key, None)
+                else:
+                    mini_metric.data.pop(key, None)
+                    mini_metric.errors[key] = error
+
+    @staticmethod
+    def fetch(metrics, parameters):
+        """
+        A method that runs the query for metrics of the same source model.
+        Args:
+            metrics: The metrics to query.
+            parameters: The query parameters, see query_parameters().
+        Returns:
+            An Arrow table with a column per metric, see query_helpers.split_metric_data().
+        """
+        source = query_helpers.query_source(metrics, parameters["filters"])
+
+        # Every time grain and period is derived from the same cached daily series
+        if local_grains.is_local(metrics):
+            return local_grains.local_metrics(
+                metrics,
+                parameters["time_grain"],
+                parameters["start_date"],
+                parameters["end_date"],
+                filters=parameters["filters"],
+                source=source,
+            )
+
+        query, params = query_helpers.generate_query(
+            metrics[0].schema,
+            metrics[0].model,
+            metrics[0].timestamp,
+            parameters["time_grain"],
+            parameters["start_date"],
+            parameters["end_date"],
+            metrics=metrics,
+            filters=parameters["filters"],
+            is_mid_period=parameters["is_mid_period"],
+            source=source,
         )
 
-        data = query_helpers.run_query(query)
+        descriptor = query_helpers.query_descriptor(
+            "metrics",
+            metrics,
+            parameters["time_grain"],
+            parameters["start_date"],
+            parameters["end_date"],
+            filters=parameters["filters"],
+            is_mid_period=parameters["is_mid_period"],
+            source=source,
+        )
 
-        return data
+        return query_helpers.run_query(
+            query, params, source=source, descriptor=descriptor, arrow=True
+        )
 
-    def create_chart(self):
+    def get_data(self):
+        """
+        A method that returns the data for the metric.
+        Args:
+            self: The class instance.
+        Returns:
+            A dataframe for the metric, fetched once per time grain, time period, incomplete periods
+            flag and filters.
+        """
+        key = self.data_key()
+
+        if key not in self.data:
+            # Get Metric Data
+            data = MiniMetric.fetch([self.metric], self.query_parameters())
+            self.data[key] = query_helpers.split_metric_data(data, self.metric)
+            self.errors.pop(key, None)
+
+        return self.data[key]
+
+    def create_chart(self, data_frame=None):
         metric = self.metric
-        data_frame = self.get_data()
+        if data_frame is None:
+            data_frame = self.get_data()
         time_grain = self.time_grain
 
         time_period = data_frame["Period Started On"]
@@ -145,11 +302,21 @@ class MiniMetric:
 
         mini_metric = st.container()
 
+        if self.metric is not None and self.data_key() in self.errors:
+            with mini_metric:
+                st.markdown(f"##### {self.label}")
+                st.warning(
+                    f"Unable to load this metric. {self.errors[self.data_key()]}"
+                )
+                st.markdown("***")
+
+            return mini_metric
+
         if self.metric is not None:
             data = self.get_data()
 
             # Line Chart
-            line_chart = self.create_chart()
+            line_chart = self.create_chart(data)
 
             # Standard Metrics
             current_value = data[self.metric.label].iloc[0] or 0
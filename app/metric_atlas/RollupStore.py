@@ -0,0 +1,474 @@
+import json
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+import duckdb
+import pandas as pd
+import pyarrow.parquet as pq
+from metric_atlas.Config import Config
+from metric_atlas.helpers import helpers
+from metric_atlas.helpers import rollups
+from metric_atlas.helpers.queries import queries as query_helpers
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+# A rollup table is rebuilt in full when any of these differ from the manifest.
+DEFINITION_KEYS = ["schema", "model", "timestamp", "updated_at", "group_columns"]
+
+# The number of source rows behind each rollup row, see rollup_query.sql.
+ROW_COUNT_COLUMN = "rollup_rows"
+
+
+@dataclass
+class RollupStore:
+    """
+    A Parquet store of daily partial aggregates for the metrics in the config/*.yml metric maps.
+
+    Every source (schema, model and timestamp) gets one rollup table with a row per day and
+    combination of dimension and filter values, and a column per decomposable aggregate of its
+    metrics, see helpers.rollups.decompose_metric_sql(). Queries read a rollup instead of the source
+    when app.enable_rollups is set and the rollup covers the metrics, filters and dimensions.
+    """
+
+    path: str = "db/rollups"
+
+    def definitions(self):
+        """
+        A method that collects the rollup tables needed by the decomposable metrics of every category.
+        Args:
+            self: The class instance.
+        Returns:
+            A dict of rollup table definitions keyed by table name.
+        """
+        definitions = {}
+
+        for category in helpers.get_metric_categories():
+            for metric in helpers.get_metric_definition(category["name"]):
+                decomposed = None
+                if metric.is_pre_aggregated is not True:
+                    decomposed = rollups.decompose_metric_sql(metric.sql)
+
+                if decomposed is None:
+                    logging.info(
+                        f"Skipping {metric.name}, its sql is not decomposable."
+                    )
+                    continue
+
+                name = rollups.rollup_table_name(
+                    metric.schema, metric.model, metric.timestamp
+                )
+                definition = definitions.setdefault(
+                    name,
+                    {
+                        "name": name,
+                        "schema": metric.schema,
+                        "model": metric.model,
+                        "timestamp": metric.timestamp,
+                        "updated_at": metric.updated_at,
+                        "file": f"{name}.parquet",
+                        "group_columns": [],
+                        "components": {},
+                        "metrics": [],
+                    },
+                )
+                definition["group_columns"] = sorted(
+                    set(definition["group_columns"]).union(
+                        rollups.rollup_columns([metric])
+                    )
+                )
+                definition["updated_at"] = definition["updated_at"] or metric.updated_at
+                definition["components"].update(decomposed["components"])
+                definition["metrics"].append(f"{metric.category}.{metric.name}")
+
+        return definitions
+
+    def build(self):
+        """
+        A method that materializes every rollup table and the calendar, then publishes the manifest.
+        Files are written next to their destination and renamed, so readers never see a partial file.
+        Args:
+            self: The class instance.
+        Returns:
+            The manifest of the built rollup tables.
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        tables = {
+            name: self.build_table(definition)
+            for name, definition in self.definitions().items()
+        }
+
+        self.copy_calendar()
+        self.write_manifest(tables)
+
+        return tables
+
+    def refresh(self, late_arriving_days=3):
+        """
+        A method that brings the rollup tables up to date by re-aggregating only the days touched since
+        the last build or refresh. Those are the days from ``late_arriving_days`` before the source's
+        timestamp high-water mark on, plus the days of rows whose ``updated_at`` column, when the
+        metrics define one, is past its high-water mark, plus the days whose number of source rows
+        no longer matches the rollup's, which rows were moved away from or deleted on. The
+        re-aggregated days replace the stored ones. Tables whose definition changed since they were
+        built are rebuilt in full.
+        Args:
+            self: The class instance.
+            late_arriving_days: The number of days before the high-water mark that are re-aggregated
+                to pick up rows that arrive late.
+        Returns:
+            The manifest of the refreshed rollup tables.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        manifest = self.read_manifest()
+        tables = {}
+
+        for name, definition in self.definitions().items():
+            rollup = manifest.get(name)
+
+            if not self.is_refreshable(rollup, definition):
+                tables[name] = self.build_table(definition)
+            else:
+                tables[name] = self.refresh_table(
+                    definition, rollup, late_arriving_days
+                )
+
+        self.copy_calendar()
+        self.write_manifest(tables)
+
+        return tables
+
+    def is_refreshable(self, rollup, definition):
+        """
+        A method that checks whether a stored rollup table can be refreshed for its current definition.
+        Args:
+            self: The class instance.
+            rollup: The manifest entry of the stored table, None if it has not been built.
+            definition: The rollup table definition.
+        Returns:
+            bool, False when the table must be rebuilt in full.
+        """
+        if rollup is None or rollup.get("watermark", {}).get("timestamp") is None:
+            return False
+
+        if not os.path.exists(os.path.join(self.path, rollup["file"])):
+            return False
+
+        if any(rollup.get(key) != definition[key] for key in DEFINITION_KEYS):
+            return False
+
+        # Tables built before the row counts were stored can't tell which days rows left
+        schema = pq.read_schema(os.path.join(self.path, rollup["file"]))
+        if ROW_COUNT_COLUMN not in schema.names:
+            return False
+
+        return set(rollup["components"]) == set(definition["components"])
+
+    def build_table(self, definition):
+        logging.info(f"Building rollup {definition['name']}...")
+
+        # Take the watermark first, rows that land while the rollup is read are picked up next time
+        watermark = self.watermark(definition)
+
+        data = self.query(
+            *query_helpers.generate_rollup_query(
+                definition["schema"],
+                definition["model"],
+                definition["timestamp"],
+                definition["group_columns"],
+                definition["components"],
+            )
+        )
+        self.write_parquet(data, definition["file"])
+
+        empty_row = self.query(
+            *query_helpers.generate_rollup_query(
+                definition["schema"],
+                definition["model"],
+                definition["timestamp"],
+                components=definition["components"],
+                query_type="empty_row",
+            )
+        )
+        empty_row.columns = [column.lower() for column in empty_row.columns]
+
+        components = {
+            component: {
+                "sql": sql,
+                "empty_value": json_value(empty_row[component].iloc[0]),
+            }
+            for component, sql in definition["components"].items()
+        }
+
+        return {
+            **definition,
+            "components": components,
+            "watermark": watermark,
+            "rows": len(data),
+            "built_at": datetime.now(timezone.utc).isoformat(),
+            "refreshed_at": None,
+            "refreshed_days": None,
+        }
+
+    def refresh_table(self, definition, rollup, late_arriving_days=3):
+        logging.info(f"Refreshing rollup {definition['name']}...")
+
+        watermark = self.watermark(definition)
+        since = pd.Timestamp(rollup["watermark"]["timestamp"]).date() - timedelta(
+            days=late_arriving_days
+        )
+        days = self.changed_days(definition, rollup, since)
+
+        data = self.query(
+            *query_helpers.generate_rollup_query(
+                definition["schema"],
+                definition["model"],
+                definition["timestamp"],
+                definition["group_columns"],
+                definition["components"],
+                updated_at=definition["updated_at"],
+                since=since,
+                updated_after=rollup["watermark"]["updated_at"],
+                days=days,
+            )
+        )
+        rows = self.write_parquet(data, definition["file"], since=since, days=days)
+
+        return {
+            **rollup,
+            "metrics": definition["metrics"],
+            "watermark": watermark,
+            "rows": rows,
+            "refreshed_at": datetime.now(timezone.utc).isoformat(),
+            "refreshed_days": len(set(data.iloc[:, 0]).union(days)),
+        }
+
+    def changed_days(self, definition, rollup, since):
+        """
+        A method that finds the days before the late-arriving window whose number of source rows
+        differs from the stored rollup's. A row whose timestamp moved or that was deleted leaves such a
+        day behind, and updated_at only points to the day the row is on now.
+        Args:
+            self: The class instance.
+            definition: The rollup table definition.
+            rollup: The manifest entry of the stored table.
+            since: The start of the late-arriving window.
+        Returns:
+            A sorted list of dates.
+        """
+        source_rows = self.query(
+            *query_helpers.generate_rollup_query(
+                definition["schema"],
+                definition["model"],
+                definition["timestamp"],
+                query_type="day_rows",
+            )
+        )
+        source_rows.columns = [column.lower() for column in source_rows.columns]
+
+        connection = duckdb.connect()
+        try:
+            connection.register("source_rows", source_rows)
+            days = connection.sql(
+                f"""
+                SELECT
+                    COALESCE(source.rollup_date, stored.rollup_date) AS rollup_date
+                FROM (
+                    SELECT
+                        rollup_date::TIMESTAMP::DATE AS rollup_date
+                        , rollup_rows
+                    FROM
+                        source_rows
+                ) AS source
+                FULL OUTER JOIN (
+                    SELECT
+                        rollup_date
+                        , SUM({ROW_COUNT_COLUMN}) AS rollup_rows
+                    FROM
+                        read_parquet('{os.path.join(self.path, rollup["file"])}')
+                    GROUP BY
+                        rollup_date
+                ) AS stored
+                    ON source.rollup_date = stored.rollup_date
+                WHERE
+                    COALESCE(source.rollup_date, stored.rollup_date) < '{since}'::DATE
+                    AND source.rollup_rows IS DISTINCT FROM stored.rollup_rows
+                ORDER BY
+                    1
+                """
+            ).fetchall()
+        finally:
+            connection.close()
+
+        return [day for (day,) in days]
+
+    def watermark(self, definition):
+        """
+        A method that reads the high-water marks of a rollup's source.
+        Args:
+            self: The class instance.
+            definition: The rollup table definition.
+        Returns:
+            A dict with the latest ``timestamp`` and ``updated_at`` of the source as ISO strings.
+        """
+        data = self.query(
+            *query_helpers.generate_rollup_query(
+                definition["schema"],
+                definition["model"],
+                definition["timestamp"],
+                query_type="watermark",
+                updated_at=definition["updated_at"],
+            )
+        )
+        data.columns = [column.lower() for column in data.columns]
+
+        return {
+            "timestamp": iso_value(data["max_timestamp"].iloc[0]),
+            "updated_at": iso_value(data["max_updated_at"].iloc[0])
+            if definition["updated_at"]
+            else None,
+        }
+
+    def query(self, query, params=None):
+        # Read the source directly, the app's query cache could return data from before the last load
+        return query_helpers.execute_query(query, params)
+
+    def copy_calendar(self):
+        logging.info("Copying calendar...")
+        calendar = self.query("SELECT * FROM core.calendar")
+        self.write_parquet(calendar, rollups.CALENDAR_FILE)
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.path, rollups.MANIFEST_FILE), "r") as f:
+                return json.load(f).get("tables", {})
+        except FileNotFoundError:
+            return {}
+
+    def write_parquet(self, data, file, since=None, days=[]):
+        """
+        A method that writes a data frame to a Parquet file of the store.
+        Args:
+            self: The class instance.
+            data: The data frame to write.
+            file: The file name within the store.
+            since: For a rollup refresh, the start of the late-arriving window. The stored rows from
+                this date on and of every day in ``data`` are replaced, the others are kept.
+            days: For a rollup refresh, more days whose stored rows are replaced, including the days
+                left without any rows.
+        Returns:
+            The number of rows in the file.
+        """
+        destination = os.path.join(self.path, file)
+        temporary = f"{destination}.tmp"
+
+        # DATE columns arrive as datetimes in pandas, store them as dates again so they render the same
+        casts = ", ".join(
+            f'"{column}"::TIMESTAMP::DATE AS "{column}"'
+            for column in date_columns(data)
+        )
+        select = (
+            f"SELECT * REPLACE ({casts}) FROM data" if casts else "SELECT * FROM data"
+        )
+
+        if since is not None:
+            replaced_days = ""
+            if days:
+                replaced_days = "AND rollup_date NOT IN ({})".format(
+                    ", ".join(f"'{day}'::DATE" for day in days)
+                )
+
+            select = f"""
+                SELECT
+                    *
+                FROM
+                    read_parquet('{destination}')
+                WHERE
+                    rollup_date < '{since}'::DATE
+                    AND rollup_date NOT IN (SELECT rollup_date FROM ({select}))
+                    {replaced_days}
+                UNION ALL BY NAME
+                {select}
+            """
+
+        connection = duckdb.connect()
+        try:
+            connection.register("data", data)
+            connection.sql(f"COPY ({select}) TO '{temporary}' (FORMAT PARQUET)")
+            rows = connection.sql(
+                f"SELECT COUNT(*) FROM read_parquet('{temporary}')"
+            ).fetchall()[0][0]
+        finally:
+            connection.close()
+
+        os.replace(temporary, destination)
+
+        return rows
+
+    def write_manifest(self, tables):
+        destination = os.path.join(self.path, rollups.MANIFEST_FILE)
+        temporary = f"{destination}.tmp"
+
+        with open(temporary, "w") as f:
+            json.dump({"tables": tables}, f, indent=2)
+
+        os.replace(temporary, destination)
+
+
+def date_columns(data):
+    """
+    Returns the datetime columns of a data frame that only hold dates, i.e. no time of day.
+    """
+    columns = []
+    for column in data.columns:
+        values = data[column]
+        if pd.api.types.is_datetime64_any_dtype(values) or all(
+            isinstance(value, date) for value in values.dropna().head(100)
+        ):
+            values = pd.to_datetime(values.dropna())
+            if len(values) > 0 and (values == values.dt.normalize()).all():
+                columns.append(column)
+
+    return columns
+
+
+def iso_value(value):
+    """
+    Converts a timestamp read from the warehouse into an ISO string, None when the source is empty.
+    """
+    if pd.isna(value):
+        return None
+
+    return pd.Timestamp(value).isoformat()
+
+
+def json_value(value):
+    """
+    Converts a value read from the warehouse into one the manifest can store.
+    """
+    if pd.isna(value):
+        return None
+
+    if isinstance(value, Decimal):
+        return float(value)
+
+    if hasattr(value, "item"):
+        return value.item()
+
+    return value
+
+
+if __name__ == "__main__":
+    configuration = Config()
+    store = RollupStore(path=configuration.rollup_path)
+
+    if "--refresh" in sys.argv:
+        manifest = store.refresh(configuration.rollup_late_arriving_days)
+    else:
+        manifest = store.build()
+
+    for name, table in manifest.items():
+        print(f"{name}: {table['rows']} rows, {len(table['components'])} components")
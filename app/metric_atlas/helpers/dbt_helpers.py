@@ -1,3 +1,4 @@
+import asyncio
 import streamlit as st
 from dbt_metadata_client.client import Client
 from dbt_metadata_client.dbt_metadata_api_schema import MetricNode
@@ -162,3 +163,19 @@ def get_supported_dbt_cloud_metric_definitions(category: str = "") -> List[dict]
         return [metric for metric in supported_metrics if metric.category == category]
     else:
         return supported_metrics
+
+
+async def fetch_supported_dbt_cloud_metric_definitions(
+    category: str = "",
+) -> List[dict]:
+    """
+    Runs get_supported_dbt_cloud_metric_definitions() in a worker thread, so the call to the dbt
+    cloud API can run concurrently with queries, see async_queries.gather().
+
+    Args:
+    category (str, optional): the category to filter the metrics by
+
+    Returns:
+    List[dict]: a list of supported dbt cloud metric definitions
+    """
+    return await asyncio.to_thread(get_supported_dbt_cloud_metric_definitions, category)
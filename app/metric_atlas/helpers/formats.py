@@ -0,0 +1,107 @@
+from decimal import ROUND_HALF_EVEN, Decimal
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from babel import Locale
+from babel.numbers import (
+    format_currency,
+    get_currency_precision,
+    get_currency_symbol,
+    get_decimal_symbol,
+    get_group_symbol,
+)
+
+# The Styler formats of the slice tables, see helpers.slice_by_table_format()
+SLICE_FORMATS = {
+    "currency": "${:,.2f}",
+    "percentage": "{:.2%}",
+    "count": "{:,.0f}",
+}
+
+
+@lru_cache(maxsize=None)
+def currency_pattern(currency="USD", locale="en_US"):
+    """
+    Reads babel's currency pattern of a locale once, see format_currency_values().
+    Params: currency(str), the currency code
+            locale(str), the locale
+    Returns: tuple, the positive and negative prefixes and suffixes, the number of decimals and a
+             translation of "," and "." to the locale's group and decimal symbols
+    """
+    pattern = Locale.parse(locale).currency_formats["standard"]
+    symbol = get_currency_symbol(currency, locale)
+
+    return (
+        tuple(prefix.replace("¤", symbol) for prefix in pattern.prefix),
+        tuple(suffix.replace("¤", symbol) for suffix in pattern.suffix),
+        get_currency_precision(currency),
+        str.maketrans({",": get_group_symbol(locale), ".": get_decimal_symbol(locale)}),
+    )
+
+
+def round_half_even(values, decimals):
+    """
+    Rounds like babel, which rounds the shortest decimal representation of a float half to even.
+    2.675 is rounded to 2.68 where rounding the binary value, 2.67499..., gives 2.67.
+    Params: values(np.ndarray), the values to round
+            decimals(int), the number of decimals to keep
+    Returns: np.ndarray, the rounded values
+    """
+    scale = 10.0**decimals
+    rounded = np.round(values * scale) / scale
+
+    # Only values within a few ulps of a half can round differently, those are rounded exactly
+    scaled = values * scale
+    tolerance = 4 * np.finfo(float).eps * np.maximum(np.abs(scaled), 1)
+    is_near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= tolerance
+
+    exponent = Decimal(1).scaleb(-decimals)
+    for position in np.flatnonzero(is_near_half):
+        rounded[position] = float(
+            Decimal(repr(float(values[position]))).quantize(
+                exponent, rounding=ROUND_HALF_EVEN
+            )
+        )
+
+    return rounded
+
+
+def format_currency_values(values, currency="USD", locale="en_US"):
+    """
+    Formats values like babel's format_currency(), without parsing a pattern per value.
+    Params: values(pd.Series), the values to format
+            currency(str), the currency code
+            locale(str), the locale
+    Returns: pd.Series, the formatted values
+    """
+    prefixes, suffixes, decimals, separators = currency_pattern(currency, locale)
+    numbers = pd.to_numeric(values).to_numpy(dtype=float)
+
+    with np.errstate(invalid="ignore"):
+        magnitudes = np.abs(round_half_even(numbers, decimals))
+
+    number_format = f"{{:,.{decimals}f}}".format
+    text = np.array(
+        [number_format(magnitude).translate(separators) for magnitude in magnitudes],
+        dtype=object,
+    )
+    text = np.where(
+        np.signbit(numbers),
+        prefixes[1] + text + suffixes[1],
+        prefixes[0] + text + suffixes[0],
+    )
+
+    # NaN and infinity are rare, babel has its own spelling for them
+    for position in np.flatnonzero(~np.isfinite(numbers)):
+        text[position] = format_currency(numbers[position], currency, locale=locale)
+
+    return pd.Series(text, index=values.index, name=values.name, dtype=object)
+
+
+def format_percent_values(values):
+    """
+    Formats ratios as percentages rounded to two decimals, e.g. 0.1234 as "12.34%".
+    Params: values(pd.Series), the values to format
+    Returns: pd.Series, the formatted values
+    """
+    return (pd.to_numeric(values) * 100).round(2).astype(str) + "%"
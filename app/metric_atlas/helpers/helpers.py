@@ -1,14 +1,16 @@
-import yaml
 import datetime
-import streamlit as st
 from datetime import date
 from typing import List
 from dateutil.relativedelta import relativedelta
 import pandas as pd
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from babel.numbers import format_currency
-from metric_atlas.helpers import dbt_helpers
-from metric_atlas.helpers.loaders import load_metric_from_yaml
+from metric_atlas.MetricRegistry import metric_registry
+from metric_atlas.helpers import formats
+from metric_atlas.helpers.queries.result_cache import (
+    configured_result_cache,
+    descriptor_key,
+)
 from numerize.numerize import numerize
 
 env = Environment(loader=FileSystemLoader(""), autoescape=select_autoescape())
@@ -44,6 +46,26 @@ def period_start_end_date(input_date, time_grain):
         return (year_start, year_end)
 
 
+def shift_periods(input_date, time_grain, periods):
+    """
+    Function to move a date by a number of periods of a time grain
+    Params: input_date(date), the date to move
+            time_grain(str), the time grain of one period
+            periods(int), the number of periods to move, negative to move back
+    Returns: date, the moved date
+    """
+    if time_grain == "day":
+        return input_date + relativedelta(days=periods)
+    elif time_grain == "week":
+        return input_date + relativedelta(weeks=periods)
+    elif time_grain == "month":
+        return input_date + relativedelta(months=periods)
+    elif time_grain == "quarter":
+        return input_date + relativedelta(months=3 * periods)
+    elif time_grain == "year":
+        return input_date + relativedelta(years=periods)
+
+
 def standard_periods(time_grain):
     today = datetime.date.today()
 
@@ -121,13 +143,7 @@ def get_metric_categories() -> List[str]:
     Returns:
     List[str]: a list of metric categories
     """
-    path = "config/config.yml"
-
-    with open(path, "r") as stream:
-        metric_yml = yaml.safe_load(stream)
-        metric_categories = metric_yml["metric_categories"]
-
-    return metric_categories
+    return list(metric_registry().refresh().categories)
 
 
 def get_metric_definition(
@@ -149,14 +165,17 @@ def get_metric_definition(
     metric_definitions = []
 
     if "dbt_metrics" in metric_source:
+        # Imported on use, the dbt Cloud client pulls in dbt_metadata_client and sgqlc
+        from metric_atlas.helpers import dbt_helpers
+
         dbt_metric_definitions = dbt_helpers.get_supported_dbt_cloud_metric_definitions(
             category_name
         )
         metric_definitions += dbt_metric_definitions
 
     if "metric_map" in metric_source:
-        # load yaml to dataclass
-        yaml_metrics = load_metric_from_yaml(f"config/{category_name}.yml")
+        # metric definitions loaded from the yaml by the registry
+        yaml_metrics = metric_registry().category_definitions(category_name)
 
         # drop metrics already defined in dbt_metrics. TODO: maybe use set operation here instead of list comprehension
         unique_fleetio_metric_definitions = [
@@ -176,7 +195,8 @@ def table_format(table_data, metric_definition):
     Function to format items in tables
     Params: table_data(DataFrame), the data from the DataFrame
             metric_definition(dict), The defintiion of the selected metric
-    Returns: dict, the formatted table with corresponding column options
+    Returns: dict, the formatted table under "table_data" and the unformatted values under
+             "raw_data", for downloads and charts
     """
 
     metric_label = metric_definition.label
@@ -202,22 +222,22 @@ def table_format(table_data, metric_definition):
     standard_date_columns = ["Period Started On", "Period Ended On"]
     columns = list(table_data.keys())
 
+    # Columns are formatted whole, the raw values are kept as they are
+    raw_data = table_data
+    table_data = table_data.copy()
+
     for item in columns:
         if item in standard_date_columns:
             table_data[item] = table_data[item]
         elif item in standard_integer_columns:
             table_data[item] = table_data[item].astype(int)
         elif item in standard_percent_metrics:
-            table_data[item] = round(pd.to_numeric(table_data[item]) * 100, 2)
-            table_data[item] = table_data[item].apply(lambda x: str(x) + "%")
+            table_data[item] = formats.format_percent_values(table_data[item])
         elif item in standard_metrics:
             if metric_type == "currency":
-                table_data[item] = table_data[item].apply(
-                    lambda x: format_currency(x, "USD", locale="en_US")
-                )
+                table_data[item] = formats.format_currency_values(table_data[item])
             elif metric_type == "percentage":
-                table_data[item] = round(pd.to_numeric(table_data[item]) * 100, 2)
-                table_data[item] = table_data[item].apply(lambda x: str(x) + "%")
+                table_data[item] = formats.format_percent_values(table_data[item])
             elif metric_type == "count":
                 table_data[item] = pd.to_numeric(table_data[item]).round().astype(int)
             else:
@@ -225,43 +245,27 @@ def table_format(table_data, metric_definition):
         else:
             table_data[item] = table_data[item]
 
-    return {"table_data": table_data}
+    return {"table_data": table_data, "raw_data": raw_data}
 
 
 def slice_by_table_format(type, dataframe, metric_definition):
     """
     Function to format items in tables
-    Params: table_data(DataFrame), the data from the DataFrame
+    Params: type(str), "metrics" to format every column or "raw" to format the metric's column
+            dataframe(DataFrame), the data from the DataFrame
             metric_definition(dict), The defintiion of the selected metric
-    Returns: dict, the formatted table with corresponding column options
+    Returns: Styler, the table with display formats, its values stay numeric so columns sort by
+             value, the table itself for metric types without a format
     """
-    metric_type = metric_definition.type
     metric_label = metric_definition.label
+    format = formats.SLICE_FORMATS.get(metric_definition.type)
 
-    if type == "metrics":
-        if metric_type == "currency":
-            output_data = dataframe.style.format("${:,.2f}")
-        elif metric_type == "percentage":
-            output_data = dataframe.style.format("{:.2%}")
-        elif metric_type == "count":
-            output_data = dataframe.style.format("{:,.0f}")
-        else:
-            output_data = dataframe
-
+    if format is None:
+        output_data = dataframe
+    elif type == "metrics":
+        output_data = dataframe.style.format(format)
     elif type == "raw":
-        column_format = {}
-
-        if metric_type == "currency":
-            column_format[metric_label] = "${:,.2f}"
-            output_data = dataframe.style.format(column_format)
-        elif metric_type == "percentage":
-            column_format[metric_label] = "{:.2%}"
-            output_data = dataframe.style.format(column_format)
-        elif metric_type == "count":
-            column_format[metric_label] = "{:,.0f}"
-            output_data = dataframe.style.format(column_format)
-        else:
-            output_data = dataframe
+        output_data = dataframe.style.format({metric_label: format})
 
     return output_data
 
@@ -277,12 +281,27 @@ def empty_string_if_error(path_to_value):
     return value
 
 
-@st.cache_data
 def cached_metrics() -> List:
     """
-    Function to cache metrics
+    Function to cache metrics, shared with other processes through the result cache
+    Params: None
+    Returns: List, the search entries of every metric
+    """
+    data = configured_result_cache().get_or_compute(
+        descriptor_key({"cached_metrics": True}),
+        lambda: pd.DataFrame(load_metrics_list()),
+        data_version=metric_registry().version(),
+        is_closed=True,
+    )
+
+    return data.to_pylist()
+
+
+def load_metrics_list() -> List:
+    """
+    Function to load the search entries of every metric, including the dbt metrics of a category
     Params: None
-    Returns: File
+    Returns: List, a dict per metric
     """
     metrics_list = []
     for category in get_metric_categories():
@@ -0,0 +1,109 @@
+import argparse
+import subprocess
+import sys
+
+# The modules the pages start from, see Home.py and pages/
+PAGE_MODULES = [
+    "metric_atlas.helpers.models.MiniMetric",
+    "metric_atlas.SidebarLinks",
+    "metric_atlas.pages.DomainPage",
+    "metric_atlas.pages.MetricsExplorerPage",
+]
+
+# Packages that are only needed by some features and must be imported on use
+LAZY_PACKAGES = [
+    "snowflake",
+    "streamlit_pandas_profiling",
+    "ydata_profiling",
+    "pandas_profiling",
+    "matplotlib",
+    "scipy",
+    "statsmodels",
+    "dbt_metadata_client",
+    "sgqlc",
+]
+
+
+def measure_imports(modules):
+    """
+    Imports modules in a fresh interpreter with -X importtime.
+    Params: modules(list), the modules to import
+    Returns: dict, the cumulative import time in microseconds of every imported module and of
+             "total", all the imports
+    """
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "; ".join(f"import {module}" for module in modules),
+        ],
+        capture_output=True,
+        text=True,
+    )
+
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+
+    timings = {"total": 0}
+    for line in result.stderr.splitlines():
+        # import time:       self [us] |  cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+
+        columns = line[len("import time:") :].split("|")
+        if len(columns) != 3 or not columns[1].strip().isdigit():
+            continue
+
+        timings[columns[2].strip()] = int(columns[1])
+
+        # Nested imports are indented, the top level ones add up to the total
+        if not columns[2][1:].startswith(" "):
+            timings["total"] += int(columns[1])
+
+    return timings
+
+
+def check_import_budget(timings, budget_ms=3000):
+    """
+    Checks the cold import of the pages against a time budget and that none of the lazily
+    imported packages is loaded.
+    Params: timings(dict), the import times, see measure_imports()
+            budget_ms(int), the maximum import time in milliseconds
+    Returns: list, the problems found, empty when the imports are within budget
+    """
+    problems = []
+
+    total_ms = timings["total"] / 1000
+    if total_ms > budget_ms:
+        problems.append(f"Importing the pages took {total_ms:.0f}ms of {budget_ms}ms.")
+
+    for module in timings:
+        if module.split(".")[0] in LAZY_PACKAGES:
+            problems.append(f"{module} is imported when the pages are imported.")
+
+    return problems
+
+
+if __name__ == "__main__":
+    # From the app directory: python -m metric_atlas.helpers.import_time
+    parser = argparse.ArgumentParser(description="Check the import time of the pages.")
+    parser.add_argument("--budget-ms", type=int, default=3000)
+    args = parser.parse_args()
+
+    timings = measure_imports(PAGE_MODULES)
+    packages = {}
+    for module, cumulative in timings.items():
+        if "." not in module and module != "total":
+            packages[module] = cumulative
+
+    print(f"Total: {timings['total'] / 1000:.1f}ms, slowest packages:")
+    for package, cumulative in sorted(packages.items(), key=lambda p: -p[1])[:10]:
+        print(f"{cumulative / 1000:>10.1f}ms {package}")
+
+    problems = check_import_budget(timings, args.budget_ms)
+    for problem in problems:
+        print(problem)
+
+    sys.exit(1 if problems else 0)
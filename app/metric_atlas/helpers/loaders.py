@@ -1,16 +1,115 @@
+import dataclasses
+import hashlib
+import json
+import os
+import tempfile
 from typing import List
 import yaml
 from metric_atlas.helpers.models.Metric import Metric
 from metric_atlas.helpers.models.MetricDimension import MetricDimension
 from metric_atlas.helpers.models.Person import Person
 
+# libyaml's loader is several times faster, fall back to the pure Python one without it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Snapshots of other versions of the models are ignored and written again
+SNAPSHOT_VERSION = "|".join(
+    ",".join(field.name for field in dataclasses.fields(model))
+    for model in (Metric, MetricDimension, Person)
+)
+
+
+def load_yaml(content):
+    """
+    Parses yaml with libyaml when it is available.
+    Params: content(str|bytes|file), the yaml
+    Returns: the parsed yaml
+    """
+    return yaml.load(content, Loader=YamlLoader)
+
 
 def load_metric_from_yaml(yaml_file_path: str) -> List[Metric]:
-    with open(yaml_file_path, "r") as f:
-        metric_dicts = yaml.safe_load(f)
+    with open(yaml_file_path, "rb") as f:
+        content = f.read()
+
+    return load_metric_snapshot(yaml_file_path, content)
+
+
+def snapshot_path(yaml_file_path: str) -> str:
+    directory, file_name = os.path.split(yaml_file_path)
+    return os.path.join(directory, f".{file_name}.json")
+
+
+def load_metric_snapshot(yaml_file_path: str, content: bytes) -> List[Metric]:
+    """
+    Returns the metrics of a category file from the compiled snapshot next to it, e.g.
+    config/.sample.yml.json for config/sample.yml. The snapshot is only used when it was
+    compiled from the same content with the same version of the models, otherwise the yaml is
+    parsed and the snapshot written again. Snapshots are plain JSON of the metrics' fields, so
+    reading one never runs code.
+    Params: yaml_file_path(str), the path of the category file
+            content(bytes), the content of the category file
+    Returns: list[Metric], the metrics of the category
+    """
+    path = snapshot_path(yaml_file_path)
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    try:
+        with open(path, "rb") as f:
+            snapshot = json.load(f)
+
+        is_current = snapshot.get("version") == SNAPSHOT_VERSION
+        if is_current and snapshot.get("hash") == content_hash:
+            return [metric_from_dict(metric) for metric in snapshot["metrics"]]
+    except FileNotFoundError:
+        pass
+    except Exception as error:
+        print(error)
+
+    metrics = load_metrics(load_yaml(content) or {})
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "hash": content_hash,
+        "metrics": [dataclasses.asdict(metric) for metric in metrics],
+    }
+    try:
+        # Write aside and rename, so readers never see a partial snapshot
+        with tempfile.NamedTemporaryFile(
+            "w", dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False
+        ) as f:
+            json.dump(snapshot, f)
+        os.replace(f.name, path)
+    except OSError as error:
+        # e.g. a read-only config directory, the yaml is parsed on every load
+        print(error)
 
+    return metrics
+
+
+def metric_from_dict(metric_dict: dict) -> Metric:
+    """
+    Rebuilds a metric from the dict of its fields in a snapshot, see dataclasses.asdict().
+    Params: metric_dict(dict), the fields of the metric
+    Returns: Metric, the metric
+    """
+    dimensions = metric_dict["dimensions"]
+
+    return Metric(
+        **{
+            **metric_dict,
+            "business_owner": Person(**metric_dict["business_owner"]),
+            "data_team_owner": Person(**metric_dict["data_team_owner"]),
+            "dimensions": None
+            if dimensions is None
+            else [MetricDimension(**dimension) for dimension in dimensions],
+        }
+    )
+
+
+def load_metrics(metric_dicts: dict) -> List[Metric]:
     metrics = []
-    for metric_dict in metric_dicts.get("metrics"):
+    for metric_dict in metric_dicts.get("metrics") or []:
         dimensions = [
             MetricDimension(**dim) for dim in metric_dict.get("dimensions", [])
         ]
@@ -39,7 +138,63 @@ def load_metric_from_yaml(yaml_file_path: str) -> List[Metric]:
             external_package_metric=metric_dict.get("external_package_metric", False),
             is_cumulative_metric=metric_dict.get("is_cumulative", False),
             is_inverted=metric_dict.get("is_inverted", False),
+            updated_at=metric_dict.get("updated_at", None),
         )
         metrics.append(metric)
 
     return metrics
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m metric_atlas.helpers.loaders
+    import time
+
+    def metric_dict(index):
+        return {
+            "name": f"metric_{index}",
+            "label": f"Metric {index}",
+            "type": "number",
+            "category": "benchmark",
+            "schema": "analytics",
+            "model": f"model_{index % 10}",
+            "description": "A metric for the loading benchmark.",
+            "sql": f"count(distinct id_{index})",
+            "timestamp": "created_at",
+            "time_grains": ["day", "week", "month", "quarter", "year"],
+            "business_owner": {"name": "Owner", "email": "owner@example.com"},
+            "data_team_owner": {"name": "Data", "email": "data@example.com"},
+            "dimensions": [
+                {"name": f"dimension_{d}", "label": f"Dimension {d}"} for d in range(5)
+            ],
+        }
+
+    def timed(function, repeat=5):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'metrics':>8} {'SafeLoader':>12} {'CSafeLoader':>12} {'snapshot':>12}")
+        for count in (10, 100, 1000):
+            yaml_file_path = os.path.join(directory, f"benchmark_{count}.yml")
+            content = yaml.safe_dump(
+                {"metrics": [metric_dict(index) for index in range(count)]}
+            ).encode("utf-8")
+            with open(yaml_file_path, "wb") as f:
+                f.write(content)
+
+            python_ms = timed(
+                lambda: load_metrics(yaml.load(content, Loader=yaml.SafeLoader))
+            )
+            libyaml_ms = timed(lambda: load_metrics(load_yaml(content)))
+            load_metric_from_yaml(yaml_file_path)
+            snapshot_ms = timed(lambda: load_metric_from_yaml(yaml_file_path))
+
+            print(
+                f"{count:>8} {python_ms:>10.2f}ms {libyaml_ms:>10.2f}ms"
+                f" {snapshot_ms:>10.2f}ms"
+            )
@@ -0,0 +1,503 @@
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from math import prod
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import metric_atlas.helpers.rollups as rollups
+import metric_atlas.helpers.queries.queries as query_helpers
+from metric_atlas.Config import Config
+from metric_atlas.FilterCatalog import filter_catalog
+from metric_atlas.FilterCube import filter_cubes
+from metric_atlas.helpers.queries.arrow_tables import to_data_frame
+from metric_atlas.helpers.queries.result_cache import query_key
+
+# The calendar columns of each time grain: the period's label, first day, last day and the day
+# number within the period that decides whether a day is period-to-date, see metrics_query.sql
+GRAIN_COLUMNS = {
+    "day": ("date_id", "date_id", "date_id", "day_of_year"),
+    "week": (
+        "week_with_year",
+        "week_started_on",
+        "week_ended_on",
+        "day_of_week_number",
+    ),
+    "month": ("month_with_year", "month_started_on", "month_ended_on", "day_of_month"),
+    "quarter": (
+        "quarter_with_year",
+        "quarter_started_on",
+        "quarter_ended_on",
+        "day_of_quarter",
+    ),
+    "year": ("day_year", "year_started_on", "year_ended_on", "day_of_year"),
+}
+
+LABEL_COLUMNS = sorted({columns[0] for columns in GRAIN_COLUMNS.values()})
+CALENDAR_COLUMNS = sorted(
+    {
+        column
+        for columns in GRAIN_COLUMNS.values()
+        for column in columns[1:]
+        if column != "date_id"
+    }
+)
+
+EXPRESSION_TOKEN = re.compile(
+    r"(?P<space>\s+)"
+    r"|\{(?P<component>c_[0-9a-f]{12})\}"
+    r"|(?P<function>[A-Za-z_][A-Za-z0-9_]*)\s*\("
+    r"|(?P<number>\d+(?:\.\d+)?)"
+    r"|(?P<operator>[-+*/(),])"
+)
+
+
+def is_null(values):
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return np.isnan(values)
+
+    return np.zeros(values.shape, dtype=bool)
+
+
+def sql_functions(div0_value):
+    """
+    Returns NumPy versions of the functions that may wrap a metric's aggregates, see
+    rollups.ROLLUP_SAFE_FUNCTIONS. NaN stands for NULL.
+    Params: div0_value(float), what DIV0 returns for a zero divisor, 0 on Snowflake and NULL in the
+                               sample database
+    Returns: dict, the functions keyed by their sql name
+    """
+
+    def div0(dividend, divisor):
+        dividend = np.asarray(dividend, dtype=float)
+        divisor = np.asarray(divisor, dtype=float)
+        zero_divisor = dividend * 0 + div0_value
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(divisor == 0, zero_divisor, dividend / divisor)
+
+    def zeroifnull(values):
+        return np.where(is_null(values), 0, values)
+
+    def coalesce(values, *others):
+        for other in others:
+            values = np.where(is_null(values), other, values)
+        return values
+
+    def nullif(values, other):
+        return np.where(np.asarray(values) == other, np.nan, values)
+
+    def round_half_away_from_zero(values, digits=0):
+        scale = 10.0**digits
+        values = np.asarray(values, dtype=float)
+        return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+    return {
+        "DIV0": div0,
+        "ZEROIFNULL": zeroifnull,
+        "COALESCE": coalesce,
+        "NULLIF": nullif,
+        "ROUND": round_half_away_from_zero,
+    }
+
+
+@lru_cache(maxsize=None)
+def compile_metric_sql(sql):
+    """
+    Compiles a metric's sql into its daily components and a NumPy expression that re-aggregates
+    them, see rollups.decompose_metric_sql().
+    Params: sql(str), the sql of a metric definition
+    Returns: tuple, the components (name to aggregate sql) and the compiled expression, which reads
+             the summed components from ``components`` and the functions from ``functions``.
+             None when the metric can't be computed from daily components.
+    """
+    decomposed = rollups.decompose_metric_sql(sql)
+    if decomposed is None:
+        return None
+
+    expression = []
+    position = 0
+    template = decomposed["sql"]
+
+    while position < len(template):
+        match = EXPRESSION_TOKEN.match(template, position)
+        if match is None:
+            return None
+
+        if match.group("component"):
+            expression.append(f"components[{match.group('component')!r}]")
+        elif match.group("function"):
+            function = match.group("function").upper()
+            if function not in rollups.ROLLUP_SAFE_FUNCTIONS:
+                return None
+            expression.append(f"functions[{function!r}](")
+        elif match.group("space"):
+            expression.append(" ")
+        else:
+            expression.append(match.group(0))
+
+        position = match.end()
+
+    return decomposed["components"], compile("".join(expression), "<metric>", "eval")
+
+
+def is_local(metrics):
+    """
+    Returns whether the periods and comparisons of metrics can be derived from daily components.
+    Params: metrics(list), the metric definitions, all from one source
+    Returns: bool, False as well when app.enable_local_grains is off
+    """
+    if not Config().enable_local_grains or metrics[0].is_pre_aggregated is True:
+        return False
+
+    return all(compile_metric_sql(metric.sql) is not None for metric in metrics)
+
+
+def daily_series(metrics, end_date, filters=[], source="warehouse"):
+    """
+    Runs the query for the daily components of metrics through the result cache.
+    Params: metrics(list), the metric definitions, all from one source, see is_local()
+            end_date(date), the last day of the series, the series starts at the first row of the
+                            source
+            filters(list), the filters of the query
+            source(str), "warehouse" or "rollup", see queries.query_source()
+    Returns: Arrow table, a row per day with the calendar columns and a column per component
+    """
+    components = {}
+    for metric in metrics:
+        components.update(compile_metric_sql(metric.sql)[0])
+
+    schema, table, date_field = (
+        metrics[0].schema,
+        metrics[0].model,
+        metrics[0].timestamp,
+    )
+
+    if source == "rollup":
+        columns = [x["field"] for x in filters if len(x["filter_values"]) > 0]
+        rollup = query_helpers.rollup_for(metrics, columns)
+        schema, table, date_field = "rollups", rollup["name"], "rollup_date"
+        components = {
+            name: f"SUM({rollups.rollup_component_sql(name, rollup['components'])})"
+            for name in components
+        }
+
+    query, params = query_helpers.generate_daily_query(
+        schema,
+        table,
+        date_field,
+        end_date,
+        components=components,
+        filters=filters,
+        label_columns=LABEL_COLUMNS,
+        calendar_columns=CALENDAR_COLUMNS,
+    )
+
+    descriptor = query_helpers.query_descriptor(
+        "daily", metrics, "day", None, end_date, filters=filters, source=source
+    )
+
+    return query_helpers.run_query(
+        query, params, source=source, descriptor=descriptor, arrow=True
+    )
+
+
+def filter_cube(metrics, fields, days):
+    """
+    Reads the filter cube of metrics, the daily components of every combination of the values of
+    the filter fields, from the rollup that is grouped by them or else the source.
+    Params: metrics(list), the metric definitions, all from one source, see is_local()
+            fields(list), the filter fields
+            days(int), the number of days of the daily series
+    Returns: FilterCube, None when it could have more than app.filter_cube_max_rows rows
+    """
+    configuration = Config()
+
+    components = {}
+    for metric in metrics:
+        components.update(compile_metric_sql(metric.sql)[0])
+
+    schema, table, date_field = (
+        metrics[0].schema,
+        metrics[0].model,
+        metrics[0].timestamp,
+    )
+    rollup = None
+    if configuration.enable_rollups:
+        rollup = query_helpers.rollup_for(metrics, fields)
+
+    if rollup is not None:
+        rows = rollup["rows"]
+        source, schema, table, date_field = (
+            "rollup",
+            "rollups",
+            rollup["name"],
+            "rollup_date",
+        )
+        empty_values = {
+            name: rollup["components"][name]["empty_value"] for name in components
+        }
+        components = {name: f"SUM(metric_source.{name})" for name in components}
+    else:
+        # At most a row per source row, and per day and combination of the fields' values
+        field_values = filter_catalog(
+            configuration.filter_catalog_refresh
+        ).field_values(schema, table, fields)
+        rows = min(
+            sum(field_values[fields[0]].counts),
+            days * prod(len(field_values[name].values) for name in fields),
+        )
+        source = "warehouse"
+        empty_row = query_helpers.run_query(
+            *query_helpers.generate_rollup_query(
+                schema, table, date_field, components=components, query_type="empty_row"
+            )
+        )
+        empty_row.columns = [column.lower() for column in empty_row.columns]
+        empty_values = {
+            name: None if pd.isna(empty_row[name].iloc[0]) else empty_row[name].iloc[0]
+            for name in components
+        }
+
+    if rows > configuration.filter_cube_max_rows:
+        return None
+
+    query, params = query_helpers.generate_rollup_query(
+        schema, table, date_field, group_columns=fields, components=components
+    )
+    cube = query_helpers.run_query(query, params, source=source, arrow=True)
+
+    return filter_cubes().cube(query_key(query, params), cube, fields, empty_values)
+
+
+def lag(values, periods):
+    """
+    Returns LAG(values, periods, 0) over the periods in order.
+    """
+    lagged = np.zeros_like(values)
+    if periods < len(values):
+        lagged[periods:] = values[: len(values) - periods]
+
+    return lagged
+
+
+def comparisons(values, periods_per_year, div0):
+    """
+    Computes a metric's comparisons like macros.comparisons() over periods in order.
+    Params: values(np.ndarray), the metric's value of each period, NaN for NULL
+            periods_per_year(int), the lag of the previous year comparison
+            div0(function), DIV0, see sql_functions()
+    Returns: list, the arrays of the columns in the order of queries.COMPARISON_COLUMN_SUFFIXES
+    """
+    columns = [values]
+
+    for periods in [1, 6, periods_per_year]:
+        previous = lag(values, periods)
+        change = values - previous
+        columns += [previous, change, div0(change, previous)]
+
+    # AVG over the current and two preceding periods ignores NULLs. Each window is summed on its
+    # own, a rolling sum carries rounding from earlier windows and a flat series drifts off its value
+    window = np.full((3, len(values)), np.nan)
+    for periods in range(3):
+        window[2 - periods, periods:] = values[: len(values) - periods]
+    is_value = ~np.isnan(window)
+    sums = np.where(is_value, window, 0).sum(axis=0)
+    with np.errstate(invalid="ignore"):
+        moving_average = sums / is_value.sum(axis=0)
+    change = values - moving_average
+    columns += [moving_average, change, div0(change, moving_average)]
+
+    return columns
+
+
+def date_trunc(time_grain, value):
+    if time_grain == "week":
+        return value - timedelta(days=value.weekday())
+    if time_grain == "month":
+        return value.replace(day=1)
+    if time_grain == "quarter":
+        return date(value.year, 3 * ((value.month - 1) // 3) + 1, 1)
+    if time_grain == "year":
+        return date(value.year, 1, 1)
+
+    return value
+
+
+def arrow_array(values):
+    values = np.asarray(values)
+    if values.dtype.kind == "f":
+        return pa.array(values, from_pandas=True)
+
+    return pa.array(values)
+
+
+def period_metrics(daily, metrics, time_grain, start_date, end_date, div0_value=0):
+    """
+    Buckets the daily components of metrics into periods and computes the comparisons, the same
+    table metrics_query.sql returns for the time grain and dates.
+    Params: daily(pd.DataFrame), the daily series, see daily_series()
+            metrics(list), the metric definitions, see is_local()
+            time_grain(str), the time grain of the periods
+            start_date(date), the start date of the query
+            end_date(date), the end date of the query
+            div0_value(float), what DIV0 returns for a zero divisor, see sql_functions()
+    Returns: Arrow table, a row per displayed period, latest first
+    """
+    periods_per_year = {"day": 365, "week": 52, "month": 12, "quarter": 4, "year": 1}
+    label_column, start_column, end_column, day_column = GRAIN_COLUMNS[time_grain]
+    functions = sql_functions(div0_value)
+
+    days_into_period, source_start_date, _ = query_helpers.query_date_range(
+        time_grain, start_date, end_date
+    )
+
+    day_ids = daily["date_id"].to_numpy().astype("datetime64[D]")
+    is_spine = (day_ids >= np.datetime64(source_start_date)) & (
+        day_ids <= np.datetime64(end_date)
+    )
+    days = daily[is_spine]
+
+    components = {}
+    for metric in metrics:
+        components.update(compile_metric_sql(metric.sql)[0])
+    names = list(components)
+
+    # The full period and, for comparisons of the current period, its first days_into_period days
+    full_periods = days.groupby(start_column, sort=True)
+    full = full_periods[names].sum(min_count=1)
+    is_period_to_date = days[day_column].to_numpy() <= days_into_period
+    period_to_date = (
+        days[is_period_to_date].groupby(start_column, sort=True)[names].sum(min_count=1)
+    )
+
+    started_on = full.index.to_numpy().astype("datetime64[D]")
+    ended_on = full_periods[end_column].first().to_numpy().astype("datetime64[D]")
+    labels = full_periods[f"{label_column}_label"].first().to_numpy()
+    has_period_to_date = full.index.isin(period_to_date.index)
+
+    today = np.datetime64(datetime.now(ZoneInfo("America/Chicago")).date())
+    end = np.datetime64(end_date)
+    is_mid_period = ((started_on <= today) & (today <= ended_on)) | (
+        (started_on <= end) & (end <= ended_on - np.timedelta64(1, "D"))
+    )
+    period_types = np.where(
+        started_on > today,
+        "Period Not Started",
+        np.where(is_mid_period, "Mid Period", "Completed Period"),
+    )
+    is_mid_period = period_types == "Mid Period"
+    is_completed = period_types == "Completed Period"
+
+    is_displayed = ((is_mid_period & has_period_to_date) | is_completed) & (
+        started_on >= np.datetime64(date_trunc(time_grain, start_date))
+    )
+    is_displayed &= started_on <= end
+    displayed = np.flatnonzero(is_displayed)[::-1]
+
+    # Period-to-date values are shown in Mid Period rows, which always have period-to-date days
+    ptd_positions = np.flatnonzero(has_period_to_date)
+    is_mid_displayed = is_mid_period[displayed]
+    mid_ptd_positions = np.searchsorted(ptd_positions, displayed[is_mid_displayed])
+
+    columns = {
+        "Time Period": pa.array(labels[displayed], type=pa.string()),
+        "Period Started On": pa.array(started_on[displayed], type=pa.date32()),
+        "Period Ended On": pa.array(ended_on[displayed], type=pa.date32()),
+        "Period Type": pa.array(period_types[displayed], type=pa.string()),
+        "Days Into Period": pa.array(
+            np.full(len(displayed), days_into_period),
+            mask=~is_mid_displayed,
+            type=pa.int32(),
+        ),
+    }
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for metric in metrics:
+            expression = compile_metric_sql(metric.sql)[1]
+            values = {}
+            for name, sums in [("full", full), ("ptd", period_to_date)]:
+                result = (
+                    eval(  # nosec B307 - the compiled expression only reads these names
+                        expression,
+                        {"__builtins__": {}},
+                        {
+                            "components": {n: sums[n].to_numpy() for n in names},
+                            "functions": functions,
+                        },
+                    )
+                )
+                result = np.broadcast_to(result, len(sums)).copy()
+                if result.dtype.kind == "f":
+                    result[np.isinf(result)] = np.nan
+                values[name] = comparisons(
+                    result, periods_per_year[time_grain], functions["DIV0"]
+                )
+
+            for suffix, full_values, ptd_values in zip(
+                query_helpers.COMPARISON_COLUMN_SUFFIXES, values["full"], values["ptd"]
+            ):
+                column = full_values[displayed].astype(
+                    np.result_type(full_values, ptd_values)
+                )
+                column[is_mid_displayed] = ptd_values[mid_ptd_positions]
+                columns[f"{metric.label}{suffix}"] = arrow_array(column)
+
+    return pa.table(columns)
+
+
+def local_metrics(
+    metrics, time_grain, start_date, end_date, filters=[], source="warehouse"
+):
+    """
+    Computes metrics from their daily series instead of running metrics_query.sql. The series is
+    fetched once up to today and shared by every time grain and date range.
+    Params: metrics(list), the metric definitions, all from one source, see is_local()
+            time_grain(str), the time grain of the periods
+            start_date(date), the start date of the query
+            end_date(date), the end date of the query
+            filters(list), the filters of the query
+            source(str), "warehouse" or "rollup", see queries.query_source()
+    Returns: Arrow table, the same columns and rows as the metrics query
+    """
+    configuration = Config()
+    today = datetime.now(ZoneInfo("America/Chicago")).date()
+
+    fetch_end_date = max(end_date, today)
+
+    # Filters are applied to the daily series in memory while the filter cube is small enough
+    selected_filters = [x for x in filters if len(x["filter_values"]) > 0]
+    is_cube = configuration.enable_filter_cube and len(selected_filters) > 0
+    is_cube = is_cube and all(
+        isinstance(value, str) for x in selected_filters for value in x["filter_values"]
+    )
+
+    daily = None
+    if is_cube:
+        fields = {x["field"] for x in filters}
+        fields.update(x["name"] for x in metrics[0].filters or [])
+        fields = sorted(fields)
+        unfiltered = to_data_frame(
+            daily_series(
+                metrics,
+                fetch_end_date,
+                source=query_helpers.query_source(metrics),
+            )
+        )
+        cube = filter_cube(metrics, fields, len(unfiltered))
+        if cube is not None:
+            daily = cube.apply(unfiltered, selected_filters)
+
+    if daily is None:
+        daily = to_data_frame(daily_series(metrics, fetch_end_date, filters, source))
+
+    return period_metrics(
+        daily,
+        metrics,
+        time_grain,
+        start_date,
+        end_date,
+        div0_value=np.nan if configuration.enable_sample_data_mode else 0,
+    )
@@ -24,6 +24,7 @@ class Metric:
     is_inverted: bool = False
     is_cumulative_metric: bool = False
     external_package_metric: bool = False
+    updated_at: str = None
 
     def __post_init__(self):
         if self.label is None:
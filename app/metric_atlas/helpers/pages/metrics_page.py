@@ -7,7 +7,7 @@ import metric_atlas.helpers.queries.queries as query_helpers
 import metric_atlas.helpers.queries.query_params as query_param_helpers
 import metric_atlas.helpers.formatters as format_helpers
 import pandas as pd
-from streamlit_pandas_profiling import st_profile_report
+from metric_atlas.DimensionProfiler import render_dimension_profile
 
 
 def generate_page():
@@ -149,7 +149,7 @@ def generate_page():
         option_query = query_helpers.generate_options_query(
             metric.schema, metric.model, metric.filters
         )
-        raw_options = query_helpers.run_query(option_query)
+        raw_options = query_helpers.run_query(*option_query)
         sorted_filters = sorted(metric.filters, key=lambda d: d["label"])
 
         filters = []
@@ -198,7 +198,7 @@ def generate_page():
         is_mid_period=is_mid_period,
     )
 
-    data = query_helpers.run_query(query)
+    data = query_helpers.run_query(*query)
 
     st.header(metric.label)
 
@@ -480,7 +480,7 @@ def generate_page():
         st.dataframe(pivot_metrics)
 
     with raw_data:
-        csv_raw_data = format_options.get("table_data").to_csv().encode("utf-8")
+        csv_raw_data = format_options.get("raw_data").to_csv().encode("utf-8")
 
         st.download_button(
             "Download Data as CSV",
@@ -508,7 +508,7 @@ def generate_page():
             filters=filters,
         )
 
-        slice_data = query_helpers.run_query(slice_query)
+        slice_data = query_helpers.run_query(*slice_query)
 
         # Slice Chart
         slice_line_chart = chart_helpers.create_slice_chart(
@@ -576,9 +576,7 @@ def generate_page():
             st.dataframe(slice_raw_data_formatted)
 
         with profiled_data:
-            dim_name = dimension.label
-            pr = slice_data[[dim_name]].profile_report()
-            st_profile_report(pr)
+            render_dimension_profile(slice_data, metric, dimension)
     else:
         st.write("There are no dimensions to slice by for this metric.")
 
@@ -0,0 +1,28 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def to_arrow_table(data) -> pa.Table:
+    """
+    Returns a query result as an Arrow table, converting data frames without their index.
+    """
+    if isinstance(data, pa.Table):
+        return data
+
+    return pa.Table.from_pandas(data, preserve_index=False)
+
+
+def to_data_frame(table: pa.Table) -> pd.DataFrame:
+    """
+    Converts an Arrow query result to the data frame DuckDB's .df() and Snowflake's
+    fetch_pandas_all() return: dates as datetime64 and decimals as floats.
+    Only widgets, charts and the pandas helpers need data frames, convert as late as possible.
+    """
+    for index, column in enumerate(table.schema):
+        if pa.types.is_decimal(column.type):
+            table = table.set_column(
+                index, column.name, pc.cast(table.column(index), pa.float64())
+            )
+
+    return table.to_pandas(date_as_object=False)
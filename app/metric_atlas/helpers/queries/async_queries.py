@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import metric_atlas.helpers.queries.queries as query_helpers
+
+
+async def call(function, *args, **kwargs):
+    """
+    Runs a blocking function in a worker thread, e.g. Database.execute_query() or
+    dbt_helpers.get_supported_dbt_cloud_metric_definitions().
+    Params: function, the function to run
+            args, kwargs, the arguments of the function
+    Returns: the result of the function
+    """
+    # The worker shares the script's context so cached resources and connections resolve as usual
+    context = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(threading.current_thread(), context)
+        return function(*args, **kwargs)
+
+    return await asyncio.to_thread(run)
+
+
+async def execute(
+    query,
+    params=None,
+    data_frame=True,
+    source="warehouse",
+    descriptor=None,
+    arrow=False,
+):
+    """
+    Runs a query in a worker thread through the result cache, see queries.run_query().
+    Params: query(str), the SQL query
+            params(list), the values to bind to the query's placeholders
+            data_frame(bool), whether to return a data frame or a list of rows
+            source(str), "warehouse" or "rollup", see queries.query_source()
+            descriptor(dict), the normalized description of the query, see queries.query_descriptor()
+            arrow(bool), return the cached Arrow table rather than a DataFrame
+    Returns: the result of the query
+    """
+    return await call(
+        query_helpers.run_query,
+        query,
+        params,
+        data_frame=data_frame,
+        source=source,
+        descriptor=descriptor,
+        arrow=arrow,
+    )
+
+
+async def resolve(awaitable):
+    return None if awaitable is None else await awaitable
+
+
+async def gather(*awaitables):
+    """
+    Runs queries concurrently.
+    Params: awaitables, e.g. execute() calls, None for a query that isn't run
+    Returns: list, the results in the order of the awaitables, None for None
+    """
+    return list(await asyncio.gather(*[resolve(awaitable) for awaitable in awaitables]))
+
+
+def run_all(*awaitables):
+    """
+    Runs queries concurrently from synchronous code such as a Streamlit page.
+    Params: awaitables, e.g. execute() calls, None for a query that isn't run
+    Returns: list, the results in the order of the awaitables, None for None
+    """
+    return asyncio.run(gather(*awaitables))
@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import pyarrow as pa
+
+
+def to_arrow_ipc(table: pa.Table) -> bytes:
+    """
+    Serializes an Arrow table to an Arrow IPC stream.
+    """
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+
+    return sink.getvalue().to_pybytes()
+
+
+def from_arrow_ipc(blob: bytes) -> pa.Table:
+    """
+    Reads an Arrow table from an Arrow IPC stream written by to_arrow_ipc().
+    """
+    return pa.ipc.open_stream(blob).read_all()
+
+
+@dataclass
+class SharedCacheBackend(ABC):
+    """
+    The interface of a result store shared by every app process, e.g. the replicas of a deployment.
+
+    Entries are Arrow IPC blobs with the data version and expiry of the result, see ResultCache.
+    Locks are leases: a process that dies while holding one only blocks others until it expires.
+    A networked store (Redis, memcached, S3 with conditional writes...) implements the same methods.
+    """
+
+    @abstractmethod
+    def read(self, key):
+        """
+        A method that reads an entry.
+        Args:
+            self: The class instance.
+            key: The cache key.
+        Returns:
+            A dict with the ``blob``, ``data_version`` and ``expires_at`` of the entry, None if missing.
+        """
+
+    @abstractmethod
+    def write(self, key, blob, data_version=None, expires_at=None):
+        """
+        A method that stores an entry, replacing any previous one. Readers never see a partial entry.
+        Args:
+            self: The class instance.
+            key: The cache key.
+            blob: The Arrow IPC stream of the result, see to_arrow_ipc().
+            data_version: The version of the source data the result was computed from.
+            expires_at: The Unix time after which the entry is stale, None if it doesn't expire.
+        """
+
+    @abstractmethod
+    def acquire(self, key, lease):
+        """
+        A method that takes the lock of a key without waiting.
+        Args:
+            self: The class instance.
+            key: The cache key.
+            lease: The number of seconds after which the lock expires if it is not released.
+        Returns:
+            A token to release the lock with, None if another process holds it.
+        """
+
+    @abstractmethod
+    def release(self, key, token):
+        """
+        A method that releases the lock of a key, unless it expired and another process took it since.
+        Args:
+            self: The class instance.
+            key: The cache key.
+            token: The token returned by acquire().
+        """
+
+
+@dataclass
+class FileSystemCacheBackend(SharedCacheBackend):
+    """
+    Stores each entry as an Arrow IPC file with a JSON sidecar in a directory, e.g. a volume shared
+    by the replicas. Locks are files created exclusively, whose mtime is when their lease expires.
+    """
+
+    path: str = "db/result_cache"
+
+    def __post_init__(self):
+        os.makedirs(self.path, exist_ok=True)
+
+    def read(self, key):
+        destination = os.path.join(self.path, key)
+        try:
+            with open(f"{destination}.json", "r") as f:
+                metadata = json.load(f)
+            with open(f"{destination}.arrow", "rb") as f:
+                blob = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return {"blob": blob, **metadata}
+
+    def write(self, key, blob, data_version=None, expires_at=None):
+        # Write the data before its metadata, an entry without metadata is never read
+        destination = os.path.join(self.path, key)
+        temporary = f"{uuid.uuid4().hex}.tmp"
+
+        with open(f"{destination}.arrow.{temporary}", "wb") as f:
+            f.write(blob)
+        os.replace(f"{destination}.arrow.{temporary}", f"{destination}.arrow")
+
+        with open(f"{destination}.json.{temporary}", "w") as f:
+            json.dump({"data_version": data_version, "expires_at": expires_at}, f)
+        os.replace(f"{destination}.json.{temporary}", f"{destination}.json")
+
+    def acquire(self, key, lease):
+        lock_path = os.path.join(self.path, f"{key}.lock")
+        token = uuid.uuid4().hex
+
+        self.remove_stale_lock(lock_path)
+
+        # The lock is written aside with its expiry as its mtime, then linked in place, which fails
+        # when the lock exists. Others never see a lock without its token and expiry.
+        temporary = f"{lock_path}.{token}.tmp"
+        with open(temporary, "w") as f:
+            f.write(token)
+        expires_at = time.time() + lease
+        os.utime(temporary, (expires_at, expires_at))
+
+        try:
+            os.link(temporary, lock_path)
+        except FileExistsError:
+            return None
+        finally:
+            os.remove(temporary)
+
+        return token
+
+    def remove_stale_lock(self, lock_path):
+        """
+        A method that removes a lock whose lease expired, i.e. whose mtime is in the past. Processes that find the same stale lock race
+        to remove it, so it is renamed away first and only removed when the renamed file is the one
+        found stale. A fresh lock taken in the meantime is put back.
+        Args:
+            self: The class instance.
+            lock_path: The path of the lock file.
+        """
+        aside = f"{lock_path}.{uuid.uuid4().hex}.stale"
+
+        try:
+            # Held open, so the stale file's inode can't be reused while it is compared
+            with open(lock_path, "r") as f:
+                stale = os.fstat(f.fileno())
+                if time.time() <= stale.st_mtime:
+                    return
+
+                # Another process already replaced it, most races end here
+                if not os.path.samestat(os.stat(lock_path), stale):
+                    return
+
+                os.rename(lock_path, aside)
+
+                if not os.path.samestat(os.stat(aside), stale):
+                    # Fails when yet another process took the lock in the meantime
+                    os.link(aside, lock_path)
+        except OSError:
+            pass
+        finally:
+            try:
+                os.remove(aside)
+            except OSError:
+                pass
+
+    def release(self, key, token):
+        lock_path = os.path.join(self.path, f"{key}.lock")
+        try:
+            with open(lock_path, "r") as f:
+                if f.read() != token:
+                    return
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+@dataclass
+class SQLiteCacheBackend(SharedCacheBackend):
+    """
+    Stores entries and locks in one SQLite database, e.g. on a volume shared by the replicas.
+    """
+
+    path: str = "db/result_cache.sqlite"
+    local: threading.local = field(
+        default_factory=threading.local, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self.connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, blob BLOB, data_version TEXT, expires_at REAL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT, expires_at REAL)"
+            )
+
+    def connection(self):
+        # SQLite connections can't be shared between threads, each thread keeps its own
+        connection = getattr(self.local, "connection", None)
+
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+
+        return connection
+
+    def read(self, key):
+        row = (
+            self.connection()
+            .execute(
+                "SELECT blob, data_version, expires_at FROM entries WHERE key = ?",
+                (key,),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            return None
+
+        return {"blob": row[0], "data_version": row[1], "expires_at": row[2]}
+
+    def write(self, key, blob, data_version=None, expires_at=None):
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, blob, data_version, expires_at) VALUES (?, ?, ?, ?)",
+                (key, blob, data_version, expires_at),
+            )
+
+    def acquire(self, key, lease):
+        token = uuid.uuid4().hex
+        now = time.time()
+
+        with self.connection() as connection:
+            connection.execute(
+                "DELETE FROM locks WHERE key = ? AND expires_at < ?", (key, now)
+            )
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO locks (key, token, expires_at) VALUES (?, ?, ?)",
+                (key, token, now + lease),
+            )
+
+        return token if cursor.rowcount == 1 else None
+
+    def release(self, key, token):
+        with self.connection() as connection:
+            connection.execute(
+                "DELETE FROM locks WHERE key = ? AND token = ?", (key, token)
+            )
+
+
+def cache_backend(backend, path):
+    """
+    Creates the shared cache backend configured by app.result_cache_backend.
+    Params: backend(str), "filesystem", "sqlite" or None for a process-local cache
+            path(str), the directory or SQLite file of the backend
+    Returns: SharedCacheBackend, None when no backend is configured
+    """
+    if backend == "filesystem":
+        return FileSystemCacheBackend(path=path or "db/result_cache")
+
+    if backend == "sqlite":
+        return SQLiteCacheBackend(path=path or "db/result_cache.sqlite")
+
+    return None
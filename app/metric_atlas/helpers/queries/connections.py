@@ -0,0 +1,303 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable
+import duckdb
+import streamlit as st
+
+
+@dataclass
+class DuckDBConnectionManager:
+    """
+    A process-wide DuckDB database that hands out one cursor per thread.
+
+    Every Streamlit session runs its script in its own thread, so each session gets its own cursor
+    while sharing the buffer pool, catalog and macros of a single database instance.
+    """
+
+    path: str = "db/sample_data.db"
+    read_only: bool = True
+    connection: duckdb.DuckDBPyConnection = field(default=None, init=False, repr=False)
+    local: threading.local = field(
+        default_factory=threading.local, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        self.connection = duckdb.connect(self.path, read_only=self.read_only)
+
+    def cursor(self):
+        """
+        A method that returns the cursor for the calling thread, creating it on first use.
+        Args:
+            self: The class instance.
+        Returns:
+            A DuckDB cursor bound to the shared database.
+        """
+        cursor = getattr(self.local, "cursor", None)
+
+        if cursor is None:
+            cursor = self.connection.cursor()
+            self.local.cursor = cursor
+
+        return cursor
+
+    def close(self):
+        self.connection.close()
+
+
+@st.cache_resource(show_spinner=False)
+def duckdb_connection_manager(path="db/sample_data.db"):
+    return DuckDBConnectionManager(path=path)
+
+
+@dataclass
+class ConnectionPool:
+    """
+    A fixed-size pool of warehouse connections shared by every Streamlit session.
+
+    Connections are created lazily up to ``size``. Idle connections that have not been used for
+    ``validate_after`` seconds are checked with a ``SELECT 1`` before being handed out and are
+    replaced when the check fails, so a dropped session only affects the caller that finds it.
+    Connections given back after a failed query are checked before their next use.
+    """
+
+    connect: Callable
+    size: int = 4
+    timeout: float = 30
+    validate_after: float = 60
+    idle: queue.LifoQueue = field(default_factory=queue.LifoQueue, init=False)
+    slots: threading.BoundedSemaphore = field(default=None, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    in_use: int = field(default=0, init=False)
+    created: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        self.slots = threading.BoundedSemaphore(self.size)
+
+    def checkout(self):
+        """
+        A method that borrows a healthy connection, waiting up to ``timeout`` seconds for one to free up.
+        Args:
+            self: The class instance.
+        Returns:
+            A connection that must be given back with checkin().
+        Raises:
+            TimeoutError: If every connection is still in use after ``timeout`` seconds.
+        """
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                f"Timed out after {self.timeout}s waiting for one of {self.size} pooled connections."
+            )
+
+        try:
+            connection = self.take_idle()
+            if connection is None:
+                connection = self.connect()
+                with self.lock:
+                    self.created += 1
+        except Exception:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.in_use += 1
+
+        return connection
+
+    def checkin(self, connection, failed=False):
+        """
+        A method that gives a borrowed connection back to the pool. Closed connections are dropped.
+        Args:
+            self: The class instance.
+            connection: The connection returned by checkout().
+            failed: Whether the connection raised while it was borrowed, it is then validated
+                before it is handed out again.
+        """
+        if connection.is_closed():
+            self.discard(connection)
+        else:
+            # A connection returned at -inf is past validate_after, see take_idle()
+            returned_at = float("-inf") if failed else time.monotonic()
+            self.idle.put((connection, returned_at))
+
+        with self.lock:
+            self.in_use -= 1
+
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.checkout()
+        try:
+            yield connection
+        except BaseException:
+            self.checkin(connection, failed=True)
+            raise
+        else:
+            self.checkin(connection)
+
+    def take_idle(self):
+        while True:
+            try:
+                connection, returned_at = self.idle.get_nowait()
+            except queue.Empty:
+                return None
+
+            if connection.is_closed():
+                self.discard(connection)
+            elif time.monotonic() - returned_at < self.validate_after:
+                return connection
+            elif self.is_healthy(connection):
+                return connection
+            else:
+                self.discard(connection)
+
+    def is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute("SELECT 1").fetchall()
+            finally:
+                cursor.close()
+        except Exception as error:
+            print(error)
+            return False
+
+        return True
+
+    def discard(self, connection):
+        with self.lock:
+            self.created -= 1
+
+        try:
+            connection.close()
+        except Exception as error:
+            print(error)
+
+    def stats(self):
+        """
+        A method that reports pool usage.
+        Args:
+            self: The class instance.
+        Returns:
+            dict, the pool size and the number of open, in use and idle connections.
+        """
+        return {
+            "size": self.size,
+            "open": self.created,
+            "in_use": self.in_use,
+            "idle": self.idle.qsize(),
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def snowflake_pool(connection_parameters: dict, size=4, timeout=30):
+    # Imported on use, sample data mode never loads the Snowflake connector
+    import snowflake.connector
+
+    return ConnectionPool(
+        # qmark binds the ? placeholders of rendered queries on the server, see queries.render_query()
+        connect=lambda: snowflake.connector.connect(
+            **connection_parameters,
+            client_session_keep_alive=True,
+            paramstyle="qmark",
+        ),
+        size=size,
+        timeout=timeout,
+    )
+
+
+@dataclass
+class LocalConnection:
+    """
+    A stand-in for a Snowflake connection backed by a local DuckDB database.
+
+    It implements the parts of the ``snowflake.connector`` connection and cursor API used by the
+    app, so ``ConnectionPool`` can be exercised without a warehouse, e.g.
+    ``ConnectionPool(connect=lambda: LocalConnection("db/sample_data.db"))``.
+    """
+
+    path: str = "db/sample_data.db"
+    connection: duckdb.DuckDBPyConnection = field(default=None, init=False, repr=False)
+
+    def __post_init__(self):
+        self.connection = duckdb.connect(self.path, read_only=True)
+
+    def cursor(self, cursor_class=None):
+        return LocalCursor(self.connection.cursor(), as_dict=cursor_class is not None)
+
+    def is_closed(self):
+        try:
+            self.connection.execute("SELECT 1")
+        except duckdb.ConnectionException:
+            return True
+
+        return False
+
+    def close(self):
+        self.connection.close()
+
+
+@dataclass
+class LocalCursor:
+    cursor: duckdb.DuckDBPyConnection
+    as_dict: bool = False
+
+    def execute(self, query, params=None):
+        self.cursor.execute(query, params)
+        return self
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+
+        if self.as_dict:
+            columns = [column[0] for column in self.cursor.description]
+            rows = [dict(zip(columns, row)) for row in rows]
+
+        return rows
+
+    def fetch_pandas_all(self):
+        return self.cursor.df()
+
+    def fetch_arrow_all(self, force_return_table=False):
+        return self.cursor.arrow()
+
+    def close(self):
+        self.cursor.close()
+
+
+def benchmark_duckdb_connections(
+    path="db/sample_data.db",
+    query="SELECT DIV0(COUNT(*), 1) FROM core.calendar",
+    iterations=200,
+):
+    """
+    Compares the latency per query of opening a connection per query against the shared cursor.
+    Params: path(str), the DuckDB database file
+            query(str), the query to run on every iteration
+            iterations(int), the number of queries to time for each approach
+    Returns: dict, the average milliseconds per query for each approach
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        connection = duckdb.connect(path, read_only=True)
+        connection.sql(query).fetchall()
+        connection.close()
+    connect_per_query = (time.perf_counter() - start) / iterations * 1000
+
+    manager = DuckDBConnectionManager(path=path)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        manager.cursor().sql(query).fetchall()
+    shared_cursor = (time.perf_counter() - start) / iterations * 1000
+    manager.close()
+
+    return {"connect_per_query": connect_per_query, "shared_cursor": shared_cursor}
+
+
+if __name__ == "__main__":
+    results = benchmark_duckdb_connections()
+    for name, milliseconds in results.items():
+        print(f"{name}: {milliseconds:.3f} ms/query")
@@ -0,0 +1,69 @@
+{#
+    The daily partial aggregates of metrics on the date spine, with the calendar columns every time
+    grain is bucketed by. See helpers.metrics.local_grains, which derives the periods and comparisons
+    of metrics_query.sql from them.
+#}
+WITH metric_source AS (
+
+            SELECT
+                {{date_field}} as metric_date
+                , *
+            FROM
+                {{schema}}.{{table}}
+            WHERE
+                {{date_field}} < {{ bind(source_end_date) }}::DATE
+                {% for filter in filters %}
+                AND {{filter.field}} IN (
+                            {%- for item in filter.filter_values -%}
+                                {{ bind(item) }}
+                                {%- if not loop.last -%}
+                                ,
+                                {%- endif -%}
+                            {%- endfor -%}
+                    )
+                {% endfor %}
+
+        ), date_spine AS (
+
+            -- Like metrics_query.sql the spine does not start before the first row of the table
+            SELECT
+                *
+            FROM
+                core.calendar
+            WHERE
+                date_id BETWEEN (SELECT MIN({{date_field}}) FROM {{schema}}.{{table}}) AND {{ bind(end_date) }}::DATE
+
+        ), daily_components AS (
+
+            SELECT
+                date_spine.date_id AS metric_date
+            {% for name, sql in components.items() %}
+                , {{sql}} AS {{name}}
+            {% endfor %}
+            FROM
+                date_spine
+            LEFT JOIN
+                metric_source ON metric_source.metric_date::DATE = date_spine.date_id
+            GROUP BY
+                date_spine.date_id
+
+        )
+
+        SELECT
+            -- Quoted lowercase names, Snowflake returns unquoted identifiers in upper case
+            date_spine.date_id AS "date_id"
+        {% for column in label_columns %}
+            , date_spine.{{column}}::text AS "{{column}}_label"
+        {% endfor %}
+        {% for column in calendar_columns %}
+            , date_spine.{{column}} AS "{{column}}"
+        {% endfor %}
+        {% for name in components %}
+            , daily_components.{{name}} AS "{{name}}"
+        {% endfor %}
+        FROM
+            date_spine
+        JOIN
+            daily_components ON daily_components.metric_date = date_spine.date_id
+        ORDER BY
+            date_spine.date_id
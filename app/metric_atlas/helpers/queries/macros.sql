@@ -0,0 +1,64 @@
+{% macro comparisons(column, partition_by=None) -%}
+                , LAG({{column}}, 1, 0 ) OVER ({% if partition_by %}PARTITION BY {{partition_by}} {% endif %}ORDER BY "Period Started On") AS {{column}}_previous_period
+                , {{column}} - {{column}}_previous_period AS {{column}}_previous_period_change
+                , DIV0({{column}}_previous_period_change, {{column}}_previous_period) AS {{column}}_previous_period_pct_change
+
+                , LAG({{column}}, 6, 0 ) OVER ({% if partition_by %}PARTITION BY {{partition_by}} {% endif %}ORDER BY "Period Started On") AS {{column}}_trailing_six_periods
+                , {{column}} - {{column}}_trailing_six_periods AS {{column}}_trailing_six_periods_change
+                , DIV0({{column}}_trailing_six_periods_change, {{column}}_trailing_six_periods) AS {{column}}_trailing_six_periods_pct_change
+
+                , LAG ({{column}}, {{periods_per_year}}, 0 ) OVER ({% if partition_by %}PARTITION BY {{partition_by}} {% endif %}ORDER BY "Period Started On") AS {{column}}_previous_year
+                , {{column}} - {{column}}_previous_year AS {{column}}_previous_year_change
+                , DIV0({{column}}_previous_year_change, {{column}}_previous_year) AS {{column}}_previous_year_pct_change
+
+                -- Three Period Moving Average
+                , AVG({{column}}) OVER ({% if partition_by %}PARTITION BY {{partition_by}} {% endif %}ORDER BY "Period Started On" ROWS BETWEEN 2 PRECEDING AND CURRENT ROW) AS {{column}}_three_period_moving_average
+                , {{column}} - {{column}}_three_period_moving_average AS {{column}}_three_period_moving_average_change
+                , DIV0({{column}}_three_period_moving_average_change, {{column}}_three_period_moving_average) AS {{column}}_three_period_moving_average_pct_change
+{%- endmacro %}
+
+{% macro metric_columns(source, column, label) -%}
+            , {{source}}.{{column}} AS "{{label}}"
+            , {{source}}.{{column}}_previous_period AS "{{label}} Previous Period"
+            , {{source}}.{{column}}_previous_period_change AS "{{label}} Previous Period Change"
+            , {{source}}.{{column}}_previous_period_pct_change AS "{{label}} Previous Period % Change"
+            , {{source}}.{{column}}_trailing_six_periods AS "{{label}} Trailing Six Periods"
+            , {{source}}.{{column}}_trailing_six_periods_change AS "{{label}} Trailing Six Periods Change"
+            , {{source}}.{{column}}_trailing_six_periods_pct_change AS "{{label}} Trailing Six Periods % Change"
+            , {{source}}.{{column}}_previous_year AS "{{label}} Previous Year"
+            , {{source}}.{{column}}_previous_year_change AS "{{label}} Previous Year Change"
+            , {{source}}.{{column}}_previous_year_pct_change AS "{{label}} Previous Year % Change"
+            , {{source}}.{{column}}_three_period_moving_average AS "{{label}} Three Period Moving Average"
+            , {{source}}.{{column}}_three_period_moving_average_change AS "{{label}} Three Period Moving Average Change"
+            , {{source}}.{{column}}_three_period_moving_average_pct_change AS "{{label}} Three Period Moving Average % Change"
+{%- endmacro %}
+
+{#
+    Mid Period rows show the period-to-date value and comparisons, completed periods the full period.
+#}
+{% macro period_metric_columns(source, column, label) -%}
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd ELSE {{source}}.{{column}} END AS "{{label}}"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_period ELSE {{source}}.{{column}}_previous_period END AS "{{label}} Previous Period"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_period_change ELSE {{source}}.{{column}}_previous_period_change END AS "{{label}} Previous Period Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_period_pct_change ELSE {{source}}.{{column}}_previous_period_pct_change END AS "{{label}} Previous Period % Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_trailing_six_periods ELSE {{source}}.{{column}}_trailing_six_periods END AS "{{label}} Trailing Six Periods"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_trailing_six_periods_change ELSE {{source}}.{{column}}_trailing_six_periods_change END AS "{{label}} Trailing Six Periods Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_trailing_six_periods_pct_change ELSE {{source}}.{{column}}_trailing_six_periods_pct_change END AS "{{label}} Trailing Six Periods % Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_year ELSE {{source}}.{{column}}_previous_year END AS "{{label}} Previous Year"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_year_change ELSE {{source}}.{{column}}_previous_year_change END AS "{{label}} Previous Year Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_previous_year_pct_change ELSE {{source}}.{{column}}_previous_year_pct_change END AS "{{label}} Previous Year % Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_three_period_moving_average ELSE {{source}}.{{column}}_three_period_moving_average END AS "{{label}} Three Period Moving Average"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_three_period_moving_average_change ELSE {{source}}.{{column}}_three_period_moving_average_change END AS "{{label}} Three Period Moving Average Change"
+            , CASE WHEN {{source}}."Period Type" = 'Mid Period' THEN {{source}}.{{column}}_ptd_three_period_moving_average_pct_change ELSE {{source}}.{{column}}_three_period_moving_average_pct_change END AS "{{label}} Three Period Moving Average % Change"
+{%- endmacro %}
+
+{#
+    The first day of the date spine. The spine never reaches further back than the source rows the
+    query reads, and, like the source itself, does not start before the first row of the table.
+#}
+{% macro spine_start_date() -%}
+CASE
+                    WHEN EXISTS (SELECT 1 FROM {{schema}}.{{table}} WHERE {{date_field}} < {{ bind(source_start_date) }}::DATE) THEN {{ bind(source_start_date) }}::DATE
+                    ELSE (SELECT MIN({{date_field}}) FROM {{schema}}.{{table}} WHERE {{date_field}} >= {{ bind(source_start_date) }}::DATE)
+                END
+{%- endmacro %}
@@ -1,3 +1,4 @@
+{% import "macros.sql" as macros with context %}
 WITH metric_source AS (
         
             SELECT
@@ -7,30 +8,17 @@ WITH metric_source AS (
                 , CASE
                     WHEN "Period Started On" > CONVERT_TIMEZONE('America/Chicago', CURRENT_TIMESTAMP)::DATE THEN 'Period Not Started'
                     WHEN CONVERT_TIMEZONE('America/Chicago', CURRENT_TIMESTAMP)::DATE BETWEEN "Period Started On" AND "Period Ended On" THEN 'Mid Period' 
-                    WHEN '{{end_date}}'::DATE BETWEEN "Period Started On" AND DATEADD('day', -1, "Period Ended On") THEN 'Mid Period' 
+                    WHEN {{ bind(end_date) }}::DATE BETWEEN "Period Started On" AND DATEADD('day', -1, "Period Ended On") THEN 'Mid Period' 
                     ELSE 'Completed Period' 
                 END as "Period Type"
-                , {{metrics[0].sql}} as metric
-                , LAG(metric, 1, 0 ) OVER (ORDER BY "Period Started On") AS previous_period
-                , metric - previous_period AS previous_period_change
-                , DIV0(previous_period_change, previous_period) AS previous_period_pct_change
-
-                , LAG(metric, 6, 0 ) OVER (ORDER BY "Period Started On") AS trailing_six_periods
-                , metric - trailing_six_periods AS trailing_six_periods_change
-                , DIV0(trailing_six_periods_change, trailing_six_periods) AS trailing_six_periods_pct_change
-
-                , LAG(metric, {{periods_per_year}}, 0 ) OVER (ORDER BY "Period Started On") AS previous_year
-                , metric - previous_year AS previous_year_change
-                , DIV0(previous_year_change, previous_year) AS previous_year_pct_change
-
-                -- Three Period Moving Average
-                , AVG(metric) OVER (ORDER BY "Period Started On" ROWS BETWEEN 2 PRECEDING AND CURRENT ROW) AS three_period_moving_average
-                , metric - three_period_moving_average AS three_period_moving_average_change
-                , DIV0(three_period_moving_average_change, three_period_moving_average) AS three_period_moving_average_pct_change
+            {% for metric in metrics %}
+                , {{metric.sql}} AS metric_{{loop.index}}
+                {{ macros.comparisons("metric_" ~ loop.index) }}
+            {% endfor %}
             FROM
                 {{schema}}.{{table}}
             WHERE
-                period_type = '{{time_grain}}'
+                period_type = {{ bind(time_grain) }}
 
         ),
         final_metrics  AS (
@@ -41,23 +29,13 @@ WITH metric_source AS (
                 , metric_source."Period Ended On"
                 , metric_source."Period Type"
                 , NULL AS "Days Into Period"
-                , metric_source.metric AS "{{metrics[0].label}}"
-                , metric_source.previous_period AS "{{metrics[0].label}} Previous Period"
-                , metric_source.previous_period_change AS "{{metrics[0].label}} Previous Period Change"
-                , metric_source.previous_period_pct_change AS "{{metrics[0].label}} Previous Period % Change"
-                , metric_source.trailing_six_periods AS "{{metrics[0].label}} Trailing Six Periods"
-                , metric_source.trailing_six_periods_change AS "{{metrics[0].label}} Trailing Six Periods Change"
-                , metric_source.trailing_six_periods_pct_change AS "{{metrics[0].label}} Trailing Six Periods % Change"
-                , metric_source.previous_year AS "{{metrics[0].label}} Previous Year"
-                , metric_source.previous_year_change AS "{{metrics[0].label}} Previous Year Change"
-                , metric_source.previous_year_pct_change AS "{{metrics[0].label}} Previous Year % Change"
-                , metric_source.three_period_moving_average AS "{{metrics[0].label}} Three Period Moving Average"
-                , metric_source.three_period_moving_average_change AS "{{metrics[0].label}} Three Period Moving Average Change"
-                , metric_source.three_period_moving_average_pct_change AS "{{metrics[0].label}} Three Period Moving Average % Change"
+            {% for metric in metrics %}
+                {{ macros.metric_columns("metric_source", "metric_" ~ loop.index, metric.label) }}
+            {% endfor %}
             FROM
                 metric_source
             WHERE
-                metric_source."Period Started On" BETWEEN DATE_TRUNC('{{time_grain}}','{{start_date}}'::DATE) AND '{{end_date}}' 
+                metric_source."Period Started On" BETWEEN DATE_TRUNC('{{time_grain}}',{{ bind(start_date) }}::DATE) AND {{ bind(end_date) }} 
         )
 
         SELECT
@@ -1,20 +1,34 @@
-
+{# One scan of the table, a grouping set per filter field #}
 WITH options AS (
+    SELECT
+        CASE
+{% for field in filters %}
+            WHEN GROUPING({{field.name}}) = 0 THEN '{{field.name}}'
+{% endfor %}
+        END AS dimension
+        , COALESCE(
+            CASE
 {% for field in filters %}
-    SELECT DISTINCT
-        '{{field.name}}' AS dimension
-        , COALESCE({{field.name}},'n/a') AS select_option
+                WHEN GROUPING({{field.name}}) = 0 THEN CAST({{field.name}} AS VARCHAR)
+{% endfor %}
+            END
+            , 'n/a'
+        ) AS select_option
+        , COUNT(*) AS row_count
     FROM
         {{schema}}.{{table}}
-{% if not loop.last %}
-   UNION ALL
-{% endif %}
-
+    GROUP BY GROUPING SETS (
+{% for field in filters %}
+        ({{field.name}}){% if not loop.last %},{% endif %}
 {% endfor %}
+    )
 )
 
 SELECT
-    *
+    dimension
+    , select_option
+    , CAST(SUM(row_count) AS BIGINT) AS row_count
 FROM
     options
+GROUP BY dimension, select_option
 ORDER BY dimension ASC, select_option ASC
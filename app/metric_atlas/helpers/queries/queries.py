@@ -1,11 +1,233 @@
+import hashlib
+import os
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import pyarrow as pa
 import streamlit as st
 import metric_atlas.helpers.helpers as helpers
-import snowflake.connector
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-import duckdb
+import metric_atlas.helpers.rollups as rollups
+from jinja2 import Environment, PackageLoader, select_autoescape
 from metric_atlas.Config import Config
+from metric_atlas.helpers.queries.connections import (
+    duckdb_connection_manager,
+    snowflake_pool,
+)
+from metric_atlas.helpers.queries.single_flight import query_flight
+from metric_atlas.helpers.queries.arrow_tables import to_data_frame
+from metric_atlas.helpers.queries.result_cache import (
+    configured_result_cache,
+    descriptor_key,
+    query_key,
+)
 
-env = Environment(loader=FileSystemLoader(""), autoescape=select_autoescape())
+# Templates are read from the package, not the working directory, and compiled once at import.
+env = Environment(
+    loader=PackageLoader("metric_atlas", "helpers/queries"),
+    autoescape=select_autoescape(),
+)
+
+TEMPLATES = {
+    name: env.get_template(name) for name in env.list_templates(extensions=["sql"])
+}
+
+# Cached results are only reused by the templates that computed them.
+TEMPLATE_VERSION = hashlib.sha256(
+    "".join(env.loader.get_source(env, name)[0] for name in sorted(TEMPLATES)).encode(
+        "utf-8"
+    )
+).hexdigest()[:12]
+
+PERIOD_COLUMNS = [
+    "Time Period",
+    "Period Started On",
+    "Period Ended On",
+    "Period Type",
+    "Days Into Period",
+]
+
+COMPARISON_COLUMN_SUFFIXES = [
+    "",
+    " Previous Period",
+    " Previous Period Change",
+    " Previous Period % Change",
+    " Trailing Six Periods",
+    " Trailing Six Periods Change",
+    " Trailing Six Periods % Change",
+    " Previous Year",
+    " Previous Year Change",
+    " Previous Year % Change",
+    " Three Period Moving Average",
+    " Three Period Moving Average Change",
+    " Three Period Moving Average % Change",
+]
+
+
+@dataclass
+class QueryParameters:
+    """
+    Collects the values a template binds with ``{{ bind(value) }}``, in the order their ``?``
+    placeholders are rendered. DuckDB and Snowflake (with paramstyle qmark) bind them in that order.
+    """
+
+    values: list = field(default_factory=list)
+
+    def bind(self, value):
+        self.values.append(value)
+        return "?"
+
+
+def render_query(name, **context):
+    """
+    Renders a precompiled query template with its values as bind parameters.
+    Params: name(str), the file name of the template
+            context, the template variables
+    Returns: tuple, the sql with ? placeholders and the list of values to bind
+    """
+    parameters = QueryParameters()
+    sql = TEMPLATES[name].render(bind=parameters.bind, **context)
+
+    return sql, parameters.values
+
+
+def metric_source_key(metric):
+    """
+    Returns the key of the source a metric is computed from. Metrics with the same key can share one query.
+    """
+    return (
+        metric.schema,
+        metric.model,
+        metric.timestamp,
+        metric.is_pre_aggregated is True,
+    )
+
+
+def group_metrics_by_source(metrics):
+    """
+    Groups metrics that share a schema, model and timestamp so each group can be queried in one pass.
+    Params: metrics(list), the metric definitions
+    Returns: dict, lists of metrics keyed by metric_source_key()
+    """
+    groups = {}
+    for metric in metrics:
+        groups.setdefault(metric_source_key(metric), []).append(metric)
+
+    return groups
+
+
+def split_metric_data(data, metric):
+    """
+    Selects the columns of one metric from the wide result of a multi-metric query.
+    Params: data(DataFrame or Arrow table), the result of a query generated by generate_query()
+            metric(Metric), one of the metrics the query was generated for
+    Returns: DataFrame, the period columns and the comparison columns of the metric
+    """
+    if isinstance(data, pa.Table):
+        names = data.column_names
+    else:
+        names = list(data.columns)
+
+    columns = [column for column in PERIOD_COLUMNS if column in names]
+    columns += [f"{metric.label}{suffix}" for suffix in COMPARISON_COLUMN_SUFFIXES]
+
+    # Only the selected columns of a table are converted
+    if isinstance(data, pa.Table):
+        return to_data_frame(data.select(columns))
+
+    return data[columns].copy()
+
+
+def comparison_lookback_periods(time_grain):
+    """
+    Returns the number of periods before the first displayed period that the comparisons read.
+    Params: time_grain(str), the time grain of the query
+    Returns: int, the largest lookback of the previous period, trailing six periods,
+             previous year and three period moving average comparisons
+    """
+    periods_per_year = {"day": 365, "week": 52, "month": 12, "quarter": 4, "year": 1}
+
+    comparison_lookback = {
+        "previous_period": 1,
+        "trailing_six_periods": 6,
+        "previous_year": periods_per_year[time_grain],
+        "three_period_moving_average": 2,
+    }
+
+    return max(comparison_lookback.values())
+
+
+def query_date_range(time_grain, start_date, end_date):
+    """
+    Returns the dates a metrics query computes its periods and comparisons from.
+    Params: time_grain(str), the time grain of the query
+            start_date(date), the start date of the query
+            end_date(date), the end date of the query
+    Returns: tuple, the number of days into the current period, the first day of the source rows
+             that the displayed periods and their comparisons need, and the day after the end date
+    """
+    # Calculate the number of days into the current period.
+    current_period_start = helpers.period_start_end_date(end_date, time_grain)[0]
+    days_into_current_period = (end_date - current_period_start).days + 1
+
+    # Only read the source rows that the displayed periods and their comparisons need.
+    first_period_start = helpers.period_start_end_date(start_date, time_grain)[0]
+    source_start_date = helpers.period_start_end_date(
+        helpers.shift_periods(
+            first_period_start, time_grain, -comparison_lookback_periods(time_grain)
+        ),
+        time_grain,
+    )[0]
+
+    return days_into_current_period, source_start_date, end_date + timedelta(days=1)
+
+
+def rollup_for(metrics, columns):
+    """
+    Returns the manifest entry of the rollup table that can answer a query for the metrics, or None.
+    """
+    configuration = Config()
+    manifest = rollups.load_manifest(
+        configuration.rollup_path, rollups.manifest_version(configuration.rollup_path)
+    )
+
+    return rollups.rollup_table_for(manifest, metrics, columns)
+
+
+def query_source(metrics, filters=[], dimensions=[]):
+    """
+    Decides where a query for the metrics is computed.
+    Params: metrics(list), the metric definitions of the query, all from one source
+            filters(list), the filters of the query
+            dimensions(list), the dimensions of a slice query
+    Returns: str, "rollup" when rollups are enabled and a built rollup covers every metric, filter
+             and dimension of the query, otherwise "warehouse"
+    """
+    if not Config().enable_rollups:
+        return "warehouse"
+
+    columns = [x["field"] for x in filters if len(x["filter_values"]) > 0]
+    columns += [dimension.name for dimension in dimensions]
+
+    if rollup_for(metrics, columns) is None:
+        return "warehouse"
+
+    return "rollup"
+
+
+def rollup_query_source(metrics, columns):
+    """
+    Points a query at a rollup table: the daily partial aggregates replace the source rows and each
+    metric's aggregates are re-aggregated from them.
+    Returns: tuple, the schema, table, date field and metrics to render the query with
+    """
+    rollup = rollup_for(metrics, columns)
+
+    rollup_metrics = [
+        replace(metric, sql=rollups.rollup_metric_sql(metric.sql, rollup["components"]))
+        for metric in metrics
+    ]
+
+    return "rollups", rollup["name"], "rollup_date", rollup_metrics
 
 
 def generate_query(
@@ -18,23 +240,38 @@ def generate_query(
     metrics=[],
     filters=[],
     is_mid_period=False,
+    source="warehouse",
 ):
+    """
+    Renders one query that computes every metric and its comparisons in a single pass over the source.
+    All metrics must share the schema, model and timestamp of the query, see group_metrics_by_source().
+    With source="rollup", see query_source(), the query reads the metrics' rollup table instead.
+    """
     periods_per_year = {"day": 365, "week": 52, "month": 12, "quarter": 4, "year": 1}
 
-    # Calculate the number of days into the current period.
-    current_period_start = helpers.period_start_end_date(end_date, time_grain)[0]
-    days_into_current_period = (end_date - current_period_start).days + 1
+    if len({metric_source_key(metric) for metric in metrics}) > 1:
+        raise ValueError(
+            "All metrics in one query must share a schema, model and timestamp."
+        )
+
+    days_into_current_period, source_start_date, source_end_date = query_date_range(
+        time_grain, start_date, end_date
+    )
 
     if metrics[0].is_pre_aggregated is True:
-        template = env.get_template(
-            "metric_atlas/helpers/queries/metrics_query_pre_aggregated.sql"
-        )
+        template = "metrics_query_pre_aggregated.sql"
     else:
-        template = env.get_template("metric_atlas/helpers/queries/metrics_query.sql")
+        template = "metrics_query.sql"
 
     non_null_filters = [x for x in filters if len(x["filter_values"]) > 0]
 
-    rendered_template = template.render(
+    if source == "rollup":
+        schema, table, date_field, metrics = rollup_query_source(
+            metrics, [x["field"] for x in non_null_filters]
+        )
+
+    return render_query(
+        template,
         schema=schema,
         table=table,
         date_field=date_field,
@@ -47,9 +284,40 @@ def generate_query(
         filters=non_null_filters,
         is_mid_period=is_mid_period,
         days_into_current_period=days_into_current_period,
+        source_start_date=source_start_date,
+        source_end_date=source_end_date,
     )
 
-    return rendered_template
+
+def generate_daily_query(
+    schema,
+    table,
+    date_field,
+    end_date,
+    components={},
+    filters=[],
+    label_columns=[],
+    calendar_columns=[],
+):
+    """
+    Renders the query for the daily partial aggregates of metrics, see helpers.metrics.local_grains.
+    Params: components(dict), the aggregate sql of each component keyed by its column name
+            label_columns(list), the calendar columns to return as text, the periods' labels
+            calendar_columns(list), the other calendar columns to return
+    Returns: tuple, the rendered query and its bind parameters, see render_query()
+    """
+    return render_query(
+        "daily_query.sql",
+        schema=schema,
+        table=table,
+        date_field=date_field,
+        end_date=end_date,
+        source_end_date=end_date + timedelta(days=1),
+        components=components,
+        filters=[x for x in filters if len(x["filter_values"]) > 0],
+        label_columns=label_columns,
+        calendar_columns=calendar_columns,
+    )
 
 
 def generate_slice_query(
@@ -62,14 +330,30 @@ def generate_slice_query(
     metrics=[],
     dimensions=[],
     filters=[],
+    source="warehouse",
+    top_n=None,
 ):
+    """
+    Renders the query for metrics sliced by dimensions.
+    Params: top_n(int), slice by the top_n dimension values of the first metric over the date range
+                        and group the other values as "Other", every value when None
+    Returns: tuple, the rendered query and its bind parameters, see render_query()
+    """
     periods_per_year = {"day": 365, "week": 52, "month": 12, "quarter": 4, "year": 1}
 
-    template = env.get_template("metric_atlas/helpers/queries/slice_query.sql")
+    # Only read the source rows of the periods that start within the date range.
+    last_period_end = helpers.period_start_end_date(end_date, time_grain)[1]
+    source_end_date = last_period_end + timedelta(days=1)
 
     non_null_filters = [x for x in filters if len(x["filter_values"]) > 0]
 
-    rendered_template = template.render(
+    if source == "rollup":
+        columns = [x["field"] for x in non_null_filters]
+        columns += [dimension.name for dimension in dimensions]
+        schema, table, date_field, metrics = rollup_query_source(metrics, columns)
+
+    return render_query(
+        "slice_query.sql",
         schema=schema,
         table=table,
         date_field=date_field,
@@ -81,51 +365,285 @@ def generate_slice_query(
         filter_count=len(non_null_filters),
         filters=non_null_filters,
         dimensions=dimensions,
+        last_period_end=last_period_end,
+        source_start_date=start_date,
+        source_end_date=source_end_date,
+        top_n=top_n,
     )
 
-    return rendered_template
 
+def label_other_values(data_frame, dimensions, label="Other"):
+    """
+    Names the slice of the dimension values after the top_n, see generate_slice_query(). When a
+    dimension has a value of the same name the slice's name is put in parentheses, so the value and
+    the slice keep their own rows and series.
+    Params: data_frame(pd.DataFrame), the sliced metrics with the "Is Other" column
+            dimensions(list), the dimensions of the slice query
+            label(str), the name the query gives the slice
+    Returns: pd.DataFrame, the sliced metrics without the "Is Other" column
+    """
+    if "Is Other" not in data_frame.columns:
+        return data_frame
 
-@st.cache_resource(show_spinner=False)
-def snowflake_connection():
-    conn = snowflake.connector.connect(
-        **st.secrets["snowflake"], client_session_keep_alive=True
-    )
+    is_other = data_frame["Is Other"].fillna(False).astype(bool).to_numpy()
+    data_frame = data_frame.drop(columns="Is Other")
 
-    return conn
+    for dimension in dimensions:
+        values = set(data_frame.loc[~is_other, dimension.label].dropna())
+        other_label = label
+        while other_label in values:
+            other_label = f"({other_label})"
 
+        is_slice = is_other & (data_frame[dimension.label] == label).to_numpy()
+        data_frame.loc[is_slice, dimension.label] = other_label
 
-@st.cache_data(ttl=600, show_spinner=False)
-def run_query(query, data_frame=True):
+    return data_frame
+
+
+def execute_query(query, params=None, data_frame=True, source="warehouse", arrow=False):
+    """
+    Runs a query on the warehouse, the sample database or the rollup store without caching.
+    ``params`` are bound to the ``?`` placeholders of the query, see render_query().
+    With ``arrow`` the result is fetched as an Arrow table rather than converted to a DataFrame.
+    """
     configuration = Config()
 
-    if configuration.enable_sample_data_mode:
-        connection = duckdb.connect("db/sample_data.db")
+    if source == "rollup" or configuration.enable_sample_data_mode:
+        if source == "rollup":
+            connection = rollups.rollup_connection_manager(
+                configuration.rollup_path,
+                rollups.manifest_version(configuration.rollup_path),
+                warehouse_semantics=not configuration.enable_sample_data_mode,
+            ).cursor()
+        else:
+            connection = duckdb_connection_manager().cursor()
 
-        if data_frame is True:
-            data = connection.sql(query).df()
+        if arrow is True:
+            data = connection.sql(query, params=params).arrow()
+        elif data_frame is True:
+            data = connection.sql(query, params=params).df()
         else:
-            data = connection.sql(query).fetchall()
+            data = connection.sql(query, params=params).fetchall()
 
     else:
-        connection = snowflake_connection()
+        pool = snowflake_pool(
+            dict(st.secrets["snowflake"]),
+            size=configuration.snowflake_pool_size,
+            timeout=configuration.snowflake_pool_timeout,
+        )
 
-        cur = connection.cursor(snowflake.connector.DictCursor)
+        with pool.connection() as connection:
+            import snowflake.connector
 
-        try:
-            if data_frame is True:
-                data = cur.execute(query).fetch_pandas_all()
-            else:
-                data = cur.execute(query).fetchall()
-        finally:
-            cur.close()
+            cur = connection.cursor(snowflake.connector.DictCursor)
+
+            try:
+                if arrow is True:
+                    data = cur.execute(query, params).fetch_arrow_all(
+                        force_return_table=True
+                    )
+                elif data_frame is True:
+                    data = cur.execute(query, params).fetch_pandas_all()
+                else:
+                    data = cur.execute(query, params).fetchall()
+            finally:
+                cur.close()
 
     return data
 
 
+def query_descriptor(
+    query_type,
+    metrics,
+    time_grain,
+    start_date,
+    end_date,
+    filters=[],
+    dimensions=[],
+    is_mid_period=False,
+    source="warehouse",
+    top_n=None,
+):
+    """
+    Describes what a metrics or slice query computes, independent of how its sql is rendered.
+    Params: query_type(str), "metrics" for generate_query() or "slice" for generate_slice_query()
+            metrics(list), the metric definitions of the query, all from one source
+            the remaining parameters are those passed to the query generator
+    Returns: dict, the descriptor to pass to run_query() so equivalent queries share a cache entry
+    """
+    today = datetime.now(ZoneInfo("America/Chicago")).date()
+    last_period_end = helpers.period_start_end_date(end_date, time_grain)[1]
+
+    return {
+        "query_type": query_type,
+        "schema": metrics[0].schema,
+        "model": metrics[0].model,
+        "timestamp": metrics[0].timestamp,
+        "metrics": sorted(
+            [
+                metric.category,
+                metric.name,
+                metric.label,
+                hashlib.sha256(metric.sql.encode("utf-8")).hexdigest()[:12],
+                metric.is_pre_aggregated is True,
+            ]
+            for metric in metrics
+        ),
+        "time_grain": time_grain,
+        "start_date": str(start_date),
+        "end_date": str(end_date),
+        "is_mid_period": is_mid_period,
+        "filters": sorted(
+            [x["field"], sorted(x["filter_values"])]
+            for x in filters
+            if len(x["filter_values"]) > 0
+        ),
+        "dimensions": sorted(dimension.name for dimension in dimensions),
+        "top_n": top_n,
+        "source": source,
+        "template_version": TEMPLATE_VERSION,
+        "is_closed": last_period_end < today,
+    }
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def warehouse_table_version(schema, table):
+    """
+    Returns when a warehouse table last changed, None for views whose data changes are not tracked.
+    """
+    data = execute_query(
+        """
+        SELECT LAST_ALTERED
+        FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = UPPER(?)
+            AND TABLE_NAME = UPPER(?)
+            AND TABLE_TYPE = 'BASE TABLE'
+        """,
+        [schema, table],
+    )
+
+    if len(data) == 0:
+        return None
+
+    return str(data.iloc[0, 0])
+
+
+def data_version(source, schema, table, configuration=None):
+    """
+    Returns the version of the data a query reads. Cached results of completed periods stay valid
+    until it changes.
+    Params: source(str), "warehouse" or "rollup", see query_source()
+            schema(str), the schema of the metric source
+            table(str), the model of the metric source
+            configuration(Config), the app configuration, read from config.yml when not given
+    Returns: str, the data version or None when it cannot be determined
+    """
+    configuration = configuration or Config()
+
+    if source == "rollup":
+        return f"rollup:{rollups.manifest_version(configuration.rollup_path)}"
+
+    if configuration.enable_sample_data_mode:
+        return f"duckdb:{os.path.getmtime(duckdb_connection_manager().path)}"
+
+    version = warehouse_table_version(schema, table)
+
+    return None if version is None else f"snowflake:{version}"
+
+
+def run_query(
+    query,
+    params=None,
+    data_frame=True,
+    source="warehouse",
+    descriptor=None,
+    arrow=False,
+):
+    """
+    Runs a query through the result cache.
+    Params: query(str), the rendered query
+            params(list), the values to bind to the query's placeholders, see render_query()
+            data_frame(bool), return a DataFrame rather than a list of rows
+            source(str), where the query is computed, see query_source()
+            descriptor(dict), what the query computes, see query_descriptor(). Queries without one
+                              are cached on their sql and params and expire after the cache's ttl
+            arrow(bool), return the cached Arrow table itself, see arrow_tables.to_data_frame()
+    Returns: DataFrame or Arrow table, the result of the query
+    """
+    if data_frame is not True:
+        return execute_query(query, params, data_frame=False, source=source)
+
+    configuration = Config()
+    cache = configured_result_cache()
+
+    if descriptor is None:
+        key = query_key(query, params)
+        version = None
+        is_closed = False
+    else:
+        key = descriptor_key(descriptor)
+        version = data_version(
+            source, descriptor["schema"], descriptor["model"], configuration
+        )
+        is_closed = descriptor["is_closed"]
+
+    # Sessions that miss the cache for the same query at the same time share one execution
+    data, _ = query_flight().do(
+        key,
+        lambda: cache.get_or_compute(
+            key,
+            lambda: execute_query(query, params, source=source, arrow=True),
+            data_version=version,
+            is_closed=is_closed,
+        ),
+    )
+
+    # The table is shared with the cache and other sessions, each caller converts its own frame
+    return data if arrow else to_data_frame(data)
+
+
 def generate_options_query(schema, table, filters):
-    template = env.get_template("metric_atlas/helpers/queries/options_query.sql")
+    return render_query(
+        "options_query.sql", schema=schema, table=table, filters=filters
+    )
 
-    rendered_template = template.render(schema=schema, table=table, filters=filters)
 
-    return rendered_template
+def generate_rollup_query(
+    schema,
+    table,
+    date_field,
+    group_columns=[],
+    components={},
+    query_type="rollup",
+    updated_at=None,
+    since=None,
+    updated_after=None,
+    days=[],
+):
+    """
+    Renders the queries that build and refresh a rollup table from the source, see RollupStore.
+    Params: group_columns(list), the dimension and filter columns to group each day by
+            components(dict), the aggregate sql of each component keyed by its column name
+            query_type(str), "rollup" for the daily aggregates, "empty_row" for the components' values
+                             on a day without rows, "watermark" for the source's high-water marks or
+                             "day_rows" for the number of source rows of each day
+            updated_at(str), the optional column that records when a source row last changed
+            since(date), only aggregate the days from this date on, for an incremental refresh
+            updated_after(str), also aggregate the days with rows updated after this timestamp, any
+                               updated row when the source had no updated rows at the last refresh
+            days(list), also aggregate these days, for an incremental refresh
+    Returns: tuple, the rendered query and its bind parameters, see render_query()
+    """
+    return render_query(
+        "rollup_query.sql",
+        schema=schema,
+        table=table,
+        date_field=date_field,
+        group_columns=group_columns,
+        components=components,
+        query_type=query_type,
+        updated_at=updated_at,
+        since=since,
+        updated_after=updated_after,
+        days=days,
+    )
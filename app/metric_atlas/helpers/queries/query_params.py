@@ -1,5 +1,6 @@
 import streamlit as st
 import metric_atlas.helpers.helpers as helpers
+from metric_atlas.MetricRegistry import metric_registry
 
 
 def set_query_params_from_state(session_state, filters):
@@ -29,25 +30,21 @@ def get_param_values(query_params):
         print("Category is not set, setting default values...")
         params = {}
     else:
-        metric_categories = helpers.get_metric_categories()
+        registry = metric_registry()
         metric_category = query_params.get("category")[0]
-        metric_definition = helpers.get_metric_definition(metric_category)
 
         # Category
-        try:
-            category = [x for x in metric_categories if x["name"] == metric_category][0]
-        except Exception as error:
-            category = None
-            print(error)
+        category = registry.category(metric_category)
+        if category is None:
+            print(f"Category {metric_category} is not configured.")
 
         # Metric
-        try:
-            metric = [
-                x for x in metric_definition if x.name == query_params.get("metric")[0]
-            ][0]
-        except Exception as error:
+        metric = registry.metric(metric_category, query_params.get("metric")[0])
+        if metric is None:
             category = None
-            print(error)
+            print(
+                f"Metric {query_params.get('metric')[0]} is not in {metric_category}."
+            )
 
         # Time Period
         try:
@@ -0,0 +1,274 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import pyarrow as pa
+import streamlit as st
+from metric_atlas.Config import Config
+from metric_atlas.helpers.queries.arrow_tables import to_arrow_table
+from metric_atlas.helpers.queries.cache_backends import (
+    SharedCacheBackend,
+    cache_backend,
+    from_arrow_ipc,
+    to_arrow_ipc,
+)
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached query result. Results that only cover completed periods have no expiry and stay valid
+    until the version of the data they were computed from changes.
+    """
+
+    data: pa.Table
+    data_version: str = None
+    expires_at: float = None
+
+    def is_valid(self, data_version):
+        if self.expires_at is not None:
+            return time.time() < self.expires_at
+
+        return self.data_version == data_version
+
+
+@dataclass
+class ResultCache:
+    """
+    A size-bounded LRU cache of query results with an optional tier shared between processes.
+
+    Entries are keyed on a normalized query descriptor, see descriptor_key(). Results of queries
+    over completed periods are kept until the data version of their source changes, everything
+    else expires after ``ttl`` seconds. With a ``backend`` every entry is also stored as Arrow IPC
+    in the shared tier, so restarted processes and other replicas start with the results already
+    computed, and only one process computes a missing result while the others wait for it.
+
+    Results are kept as Arrow tables. They are immutable, so every caller shares the cached table
+    instead of receiving a copy.
+    """
+
+    max_entries: int = 256
+    ttl: float = 600
+    backend: SharedCacheBackend = None
+    lock_timeout: float = 120
+    poll_interval: float = 0.2
+    entries: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    hits: int = field(default=0, init=False)
+    shared_hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+    waits: int = field(default=0, init=False)
+
+    def get(self, key, data_version=None):
+        """
+        A method that looks up a result, first in memory and then in the shared tier.
+        Args:
+            self: The class instance.
+            key: The key of the query, see descriptor_key().
+            data_version: The current version of the query's source data.
+        Returns:
+            The cached Arrow table, or None on a miss.
+        """
+        data, tier = self.lookup(key, data_version)
+
+        with self.lock:
+            if tier == "memory":
+                self.hits += 1
+            elif tier == "shared":
+                self.shared_hits += 1
+            else:
+                self.misses += 1
+
+        return data
+
+    def get_or_compute(self, key, compute, data_version=None, is_closed=False):
+        """
+        A method that returns a cached result or computes and caches it.
+        With a shared backend only the process that takes the key's lock computes a missing result,
+        the others poll the shared tier for it and compute it themselves only after ``lock_timeout``.
+        Args:
+            self: The class instance.
+            key: The key of the query, see descriptor_key().
+            compute: A function without arguments that returns an Arrow table or a data frame.
+            data_version: The current version of the query's source data.
+            is_closed: Whether the result only covers completed periods, see set().
+        Returns:
+            An Arrow table.
+        """
+        data = self.get(key, data_version)
+        if data is not None:
+            return data
+
+        if self.backend is None:
+            return self.set(key, compute(), data_version, is_closed)
+
+        deadline = time.time() + self.lock_timeout
+        waited = False
+
+        while time.time() < deadline:
+            token = self.backend.acquire(key, lease=self.lock_timeout)
+
+            if token is not None:
+                try:
+                    # Another process may have stored the result before the lock was released
+                    data, _ = self.lookup(key, data_version)
+                    if data is None:
+                        data = self.set(key, compute(), data_version, is_closed)
+                    return data
+                finally:
+                    self.backend.release(key, token)
+
+            if not waited:
+                waited = True
+                with self.lock:
+                    self.waits += 1
+
+            time.sleep(self.poll_interval)
+
+            data, _ = self.lookup(key, data_version)
+            if data is not None:
+                return data
+
+        return self.set(key, compute(), data_version, is_closed)
+
+    def lookup(self, key, data_version=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.is_valid(data_version):
+                self.entries.move_to_end(key)
+                return entry.data, "memory"
+
+        entry = self.read_entry(key)
+        if entry is not None and entry.is_valid(data_version):
+            self.remember(key, entry)
+            return entry.data, "shared"
+
+        return None, None
+
+    def set(self, key, data, data_version=None, is_closed=False):
+        """
+        A method that caches a result.
+        Args:
+            self: The class instance.
+            key: The key of the query, see descriptor_key().
+            data: The Arrow table or data frame returned by the query.
+            data_version: The version of the source data the result was computed from.
+            is_closed: Whether the result only covers completed periods. Without a data version to
+                invalidate it, a closed result expires like any other.
+        Returns:
+            The cached Arrow table.
+        """
+        data = to_arrow_table(data)
+
+        if is_closed and data_version is not None:
+            entry = CacheEntry(data, data_version=data_version)
+        else:
+            entry = CacheEntry(data, expires_at=time.time() + self.ttl)
+
+        self.remember(key, entry)
+        self.write_entry(key, entry)
+
+        return data
+
+    def remember(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def read_entry(self, key):
+        if self.backend is None:
+            return None
+
+        try:
+            stored = self.backend.read(key)
+            if stored is None:
+                return None
+
+            return CacheEntry(
+                from_arrow_ipc(stored["blob"]),
+                data_version=stored["data_version"],
+                expires_at=stored["expires_at"],
+            )
+        except Exception as error:
+            print(error)
+            return None
+
+    def write_entry(self, key, entry):
+        if self.backend is None:
+            return
+
+        try:
+            self.backend.write(
+                key,
+                to_arrow_ipc(entry.data),
+                data_version=entry.data_version,
+                expires_at=entry.expires_at,
+            )
+        except Exception as error:
+            print(error)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        A method that reports cache usage.
+        Args:
+            self: The class instance.
+        Returns:
+            dict, the number of entries in memory, the memory and shared tier hits, the misses and
+            the misses that waited for another process to compute the result.
+        """
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "waits": self.waits,
+        }
+
+
+def descriptor_key(descriptor):
+    """
+    Returns the cache key of a query descriptor, the same for descriptors that only differ in the
+    order of their keys. See queries.query_descriptor(), which sorts the lists in a descriptor.
+    """
+    normalized = json.dumps(descriptor, sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def query_key(query, params=None):
+    """
+    Returns the cache key of a query and its bind parameters without a descriptor, insensitive to
+    whitespace outside quotes.
+    """
+    parts = query.split("'")
+    parts[::2] = [" ".join(part.split()) for part in parts[::2]]
+
+    return descriptor_key({"query": "'".join(parts), "params": params or []})
+
+
+def configured_result_cache():
+    """
+    Returns the result cache configured by the app.result_cache_* settings in config.yml.
+    """
+    configuration = Config()
+
+    return result_cache(
+        max_entries=configuration.result_cache_max_entries,
+        ttl=configuration.result_cache_ttl,
+        backend=configuration.result_cache_backend,
+        path=configuration.result_cache_path,
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def result_cache(max_entries=256, ttl=600, backend=None, path=None):
+    return ResultCache(
+        max_entries=max_entries, ttl=ttl, backend=cache_backend(backend, path)
+    )
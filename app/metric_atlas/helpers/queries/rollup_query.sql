@@ -0,0 +1,83 @@
+{% if query_type == "empty_row" %}
+-- The value of every component on a day without source rows, i.e. aggregated over one row of NULLs.
+SELECT
+{% for name, sql in components.items() %}
+    {{sql}} AS {{name}}
+    {%- if not loop.last %},{% endif %}
+{% endfor %}
+FROM
+    (SELECT 1 AS empty_row) AS empty_row
+LEFT JOIN
+    {{schema}}.{{table}} AS metric_source ON 1 = 0
+{% elif query_type == "watermark" %}
+-- The high-water marks of the source, an incremental refresh reads the days touched after them.
+SELECT
+    MAX(metric_source.{{date_field}}) AS max_timestamp
+{% if updated_at %}
+    , MAX(metric_source.{{updated_at}}) AS max_updated_at
+{% endif %}
+FROM
+    {{schema}}.{{table}} AS metric_source
+{% elif query_type == "day_rows" %}
+-- The number of source rows of each day, a day whose count differs from the rollup's lost or gained rows.
+SELECT
+    metric_source.{{date_field}}::DATE AS rollup_date
+    , COUNT(*) AS rollup_rows
+FROM
+    {{schema}}.{{table}} AS metric_source
+WHERE
+    metric_source.{{date_field}} IS NOT NULL
+GROUP BY
+    metric_source.{{date_field}}::DATE
+{% else %}
+-- Daily partial aggregates of every component, grouped by the dimension and filter columns.
+SELECT
+    metric_source.{{date_field}}::DATE AS rollup_date
+{% for column in group_columns %}
+    , metric_source.{{column}}
+{% endfor %}
+{% for name, sql in components.items() %}
+    , {{sql}} AS {{name}}
+{% endfor %}
+    , COUNT(*) AS rollup_rows
+FROM
+    {{schema}}.{{table}} AS metric_source
+WHERE
+    metric_source.{{date_field}} IS NOT NULL
+{% if since %}
+    -- Only the days in the late-arriving window and the days with rows updated since the last refresh
+    AND (
+        metric_source.{{date_field}} >= {{ bind(since) }}::DATE
+    {% if updated_at %}
+        OR metric_source.{{date_field}}::DATE IN (
+            SELECT DISTINCT
+                updated_source.{{date_field}}::DATE
+            FROM
+                {{schema}}.{{table}} AS updated_source
+            WHERE
+            {% if updated_after %}
+                updated_source.{{updated_at}} > {{ bind(updated_after) }}
+            {% else %}
+                updated_source.{{updated_at}} IS NOT NULL
+            {% endif %}
+        )
+    {% endif %}
+    {% if days %}
+        -- The days rows were moved away from or deleted on
+        OR metric_source.{{date_field}}::DATE IN (
+            {%- for day in days -%}
+                {{ bind(day) }}::DATE
+                {%- if not loop.last -%}
+                ,
+                {%- endif -%}
+            {%- endfor -%}
+        )
+    {% endif %}
+    )
+{% endif %}
+GROUP BY
+    metric_source.{{date_field}}::DATE
+{% for column in group_columns %}
+    , metric_source.{{column}}
+{% endfor %}
+{% endif %}
@@ -0,0 +1,76 @@
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+import streamlit as st
+
+
+@dataclass
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within the process.
+
+    The first caller of a key runs the function, callers that arrive while it is running wait on
+    its future and receive the same result, or the same exception.
+    """
+
+    calls: dict = field(default_factory=dict, init=False, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+    executed: int = field(default=0, init=False)
+    coalesced: int = field(default=0, init=False)
+
+    def do(self, key, function):
+        """
+        A method that runs the function once for all concurrent callers of the key.
+        Args:
+            self: The class instance.
+            key: A hashable key that identifies the call.
+            function: A function without arguments.
+        Returns:
+            A tuple of the function's result and whether it was shared with another caller, callers
+            that may mutate a shared result should copy it.
+        """
+        is_leader = False
+
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+            else:
+                future = Future()
+                self.calls[key] = future
+                self.executed += 1
+                is_leader = True
+
+        if not is_leader:
+            return future.result(), True
+
+        try:
+            result = function()
+            future.set_result(result)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
+
+        return result, False
+
+    def stats(self):
+        """
+        A method that reports coalescing.
+        Args:
+            self: The class instance.
+        Returns:
+            dict, the number of calls that ran, that waited for another caller and still running.
+        """
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.calls),
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def query_flight():
+    return SingleFlight()
@@ -1,3 +1,4 @@
+{% import "macros.sql" as macros with context %}
 WITH metric_source AS (
         
             SELECT
@@ -5,22 +6,19 @@ WITH metric_source AS (
                 , *
             FROM
                 {{schema}}.{{table}}
-            {% if filter_count > 0 %}
             WHERE
+                {{date_field}} >= {{ bind(source_start_date) }}::DATE
+                AND {{date_field}} < {{ bind(source_end_date) }}::DATE
                 {% for filter in filters %}
-                    {{filter.field}} IN (
+                AND {{filter.field}} IN (
                             {%- for item in filter.filter_values -%}
-                                '{{item}}'
+                                {{ bind(item) }}
                                 {%- if not loop.last -%}
                                 ,
                                 {%- endif -%}
                             {%- endfor -%}
                     )
-                {% if not loop.last %}
-                AND
-                {% endif %}
                 {% endfor %}
-            {% endif %}
         
         ), date_spine AS (
         
@@ -29,8 +27,32 @@ WITH metric_source AS (
             FROM
                 core.calendar
             WHERE
-                date_id BETWEEN (SELECT MIN({{date_field}}) FROM {{schema}}.{{table}}) AND CONVERT_TIMEZONE('America/Chicago', CURRENT_TIMESTAMP)::DATE
+                date_id BETWEEN {{ macros.spine_start_date() }} AND LEAST({{ bind(last_period_end) }}::DATE, CONVERT_TIMEZONE('America/Chicago', CURRENT_TIMESTAMP)::DATE)
+
+        {% if top_n %}
+        ), dimension_ranks AS (
+
+            -- The dimension values ranked by the first metric over the date range, the values
+            -- after the top {{top_n | int}} are sliced together as Other
+            SELECT
+                {% for dimension in dimensions %}
+                metric_source.{{dimension.name}} AS dimension_{{loop.index}},
+                {% endfor %}
+                ROW_NUMBER() OVER (
+                    ORDER BY
+                        {{metrics[0].sql}} DESC NULLS LAST
+                    {% for dimension in dimensions %}
+                        , metric_source.{{dimension.name}}
+                    {% endfor %}
+                ) AS dimension_rank
+            FROM
+                metric_source
+            GROUP BY
+            {% for dimension in dimensions %}
+                {% if not loop.first %}, {% endif %}metric_source.{{dimension.name}}
+            {% endfor %}
 
+        {% endif %}
         ), final_metrics AS (
         
         SELECT
@@ -67,8 +89,25 @@ WITH metric_source AS (
             {% endif %}
 
             {% for dimension in dimensions %}
+            {% if top_n %}
+                -- Metrics are computed over the source rows of Other, not summed from the values
+                , CASE
+                    WHEN metric_source.{{dimension.name}} IS NULL THEN NULL
+                    WHEN dimension_ranks.dimension_rank <= {{top_n | int}} THEN CAST(metric_source.{{dimension.name}} AS VARCHAR)
+                    ELSE 'Other'
+                END AS "{{dimension.label}}"
+            {% else %}
                 , {{dimension.name}} AS "{{dimension.label}}"
+            {% endif %}
             {% endfor %}
+            {% if top_n %}
+                -- Grouped on as well, a dimension value named Other stays a slice of its own
+                , COALESCE(
+                    dimension_ranks.dimension_rank > {{top_n | int}}
+                    AND ({% for dimension in dimensions %}{% if not loop.first %} OR {% endif %}metric_source.{{dimension.name}} IS NOT NULL{% endfor %}),
+                    FALSE
+                ) AS "Is Other"
+            {% endif %}
 
             -- Metrics
             {% for metric in metrics %}
@@ -80,13 +119,28 @@ WITH metric_source AS (
             date_spine
         LEFT JOIN
             metric_source ON metric_source.metric_date::DATE = date_spine.date_id
+        {% if top_n %}
+        LEFT JOIN
+            dimension_ranks ON
+            {% for dimension in dimensions %}
+                {% if not loop.first %}AND {% endif %}dimension_ranks.dimension_{{loop.index}} IS NOT DISTINCT FROM metric_source.{{dimension.name}}
+            {% endfor %}
+        {% endif %}
         GROUP BY
             "Time Period"
             , "Period Started On"
             , "Period Ended On"
             {% for dimension in dimensions %}
+            {% if top_n %}
+                -- By position, DuckDB resolves the quoted label to the source column of the same name
+                , {{loop.index + 3}}
+            {% else %}
                 , "{{dimension.label}}"
+            {% endif %}
             {% endfor %}
+            {% if top_n %}
+                , {{dimensions | length + 4}}
+            {% endif %}
         ORDER BY
             1 DESC
         )
@@ -96,4 +150,4 @@ WITH metric_source AS (
         FROM
             final_metrics
         WHERE
-            "Period Started On" BETWEEN '{{start_date}}' AND '{{end_date}}'
+            "Period Started On" BETWEEN {{ bind(start_date) }} AND {{ bind(end_date) }}
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import os
+import re
+from typing import List
+import streamlit as st
+from metric_atlas.helpers.queries.connections import DuckDBConnectionManager
+
+# Aggregates whose daily partial results can be re-aggregated into any longer period.
+DECOMPOSABLE_AGGREGATES = ["SUM", "COUNT", "COUNT_IF", "AVG"]
+
+# Functions that may wrap the aggregates of a metric, they are evaluated on the rolled up values.
+ROLLUP_SAFE_FUNCTIONS = ["DIV0", "ZEROIFNULL", "COALESCE", "NULLIF", "ROUND"]
+
+MANIFEST_FILE = "manifest.json"
+CALENDAR_FILE = "calendar.parquet"
+
+FUNCTION_CALL = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+
+
+def closing_parenthesis(sql, open_index):
+    """
+    Returns the index of the parenthesis that closes the one at open_index, skipping quoted strings.
+    """
+    depth = 0
+    quote = None
+    for index in range(open_index, len(sql)):
+        character = sql[index]
+        if quote:
+            if character == quote:
+                quote = None
+        elif character in ("'", '"'):
+            quote = character
+        elif character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+
+    raise ValueError(f"Unbalanced parentheses in metric sql: {sql}")
+
+
+def component_name(aggregate, argument):
+    normalized = f"{aggregate}({' '.join(argument.split())})"
+    return f"c_{hashlib.md5(normalized.encode('utf-8')).hexdigest()[:12]}"
+
+
+def escape_braces(sql):
+    return sql.replace("{", "{{").replace("}", "}}")
+
+
+def decompose_metric_sql(sql: str) -> dict:
+    """Splits a metric's sql into daily partial aggregates and the expression that re-aggregates them.
+
+    Every COUNT, COUNT_IF and SUM becomes one component that is summed over the days of a period, and
+    every AVG becomes a SUM and a COUNT component that are divided after summing. Anything around the
+    aggregates must be arithmetic or one of ROLLUP_SAFE_FUNCTIONS.
+
+    Args:
+        sql(str): The sql of a metric definition, e.g. ``DIV0(SUM(metric_source.x), COUNT_IF(metric_source.y))``.
+
+    Returns:
+        A dict with the ``components`` (component name to the aggregate sql computed per day) and the
+        ``sql`` template that re-aggregates them, where ``{name}`` stands for a rolled up component.
+        None if the metric cannot be decomposed.
+    """
+    if re.search(r"\bOVER\b|\bDISTINCT\b", sql, re.IGNORECASE):
+        return None
+
+    components = {}
+    rollup_sql = ""
+    position = 0
+
+    for match in FUNCTION_CALL.finditer(sql):
+        if match.start() < position:
+            continue
+
+        function = match.group(1).upper()
+        open_index = match.end() - 1
+
+        if function in ROLLUP_SAFE_FUNCTIONS:
+            continue
+
+        if function not in DECOMPOSABLE_AGGREGATES:
+            return None
+
+        close_index = closing_parenthesis(sql, open_index)
+        argument = sql[open_index + 1 : close_index].strip()
+
+        # Nested aggregates and COUNT(*), which counts the rows of days without data, are not decomposable
+        if argument == "*" or any(
+            re.search(rf"\b{aggregate}\s*\(", argument, re.IGNORECASE)
+            for aggregate in DECOMPOSABLE_AGGREGATES
+        ):
+            return None
+
+        if function == "AVG":
+            sum_name = component_name("SUM", argument)
+            count_name = component_name("COUNT", argument)
+            components[sum_name] = f"SUM({argument})"
+            components[count_name] = f"COUNT({argument})"
+            replacement = f"({{{sum_name}}} / NULLIF({{{count_name}}}, 0))"
+        else:
+            name = component_name(function, argument)
+            components[name] = f"{function}({argument})"
+            replacement = f"{{{name}}}"
+
+        rollup_sql += escape_braces(sql[position : match.start()]) + replacement
+        position = close_index + 1
+
+    rollup_sql += escape_braces(sql[position:])
+
+    if not components or "metric_source." in rollup_sql:
+        return None
+
+    return {"components": components, "sql": rollup_sql}
+
+
+def sql_literal(value):
+    if value is None:
+        return "NULL"
+
+    return repr(value)
+
+
+def rollup_metric_sql(sql: str, rollup_components: dict) -> str:
+    """Renders a metric's sql against a rollup table.
+
+    Days without rollup rows come from the LEFT JOIN of the date spine with all columns NULL. On the
+    source those days contribute the aggregate of a row of NULLs, which was recorded as the component's
+    ``empty_value`` when the rollup was built, so the rolled up values match the source exactly.
+
+    Args:
+        sql(str): The sql of a metric definition.
+        rollup_components(dict): The components of the rollup table, name to ``sql`` and ``empty_value``.
+
+    Returns:
+        The sql of the metric over the rollup table aliased as ``metric_source``.
+    """
+    decomposed = decompose_metric_sql(sql)
+
+    rolled_up = {
+        name: f"SUM({rollup_component_sql(name, rollup_components)})"
+        for name in decomposed["components"]
+    }
+
+    return decomposed["sql"].format(**rolled_up)
+
+
+def rollup_component_sql(name: str, rollup_components: dict) -> str:
+    """
+    Returns the sql of a component's value on a row of the date spine joined to a rollup table,
+    its ``empty_value`` on days without rollup rows, see rollup_metric_sql().
+    """
+    empty_value = sql_literal(rollup_components[name]["empty_value"])
+
+    return f"CASE WHEN metric_source.rollup_date IS NULL THEN {empty_value} ELSE metric_source.{name} END"
+
+
+def rollup_columns(metrics) -> List[str]:
+    """
+    Returns the dimension and filter columns a rollup of the metrics must be grouped by.
+    """
+    columns = []
+    for metric in metrics:
+        for dimension in metric.dimensions or []:
+            columns.append(dimension.name)
+        for filter in metric.filters or []:
+            columns.append(filter["name"])
+
+    return sorted(set(columns))
+
+
+def rollup_table_name(schema, model, timestamp):
+    return f"{schema}__{model}__{timestamp}"
+
+
+def manifest_version(path):
+    """
+    Returns the modification time of the rollup manifest, or None when no rollups have been built.
+    """
+    try:
+        return os.path.getmtime(os.path.join(path, MANIFEST_FILE))
+    except OSError:
+        return None
+
+
+@st.cache_data(show_spinner=False)
+def load_manifest(path, version):
+    """
+    Loads the rollup manifest. The version argument re-reads the file whenever a build replaces it.
+    Params: path(str), the directory of the rollup store
+            version(float), the value of manifest_version() for the path
+    Returns: dict, the rollup tables keyed by name
+    """
+    if version is None:
+        return {}
+
+    with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+        return json.load(f).get("tables", {})
+
+
+def rollup_table_for(manifest, metrics, columns):
+    """
+    Finds the rollup table that can answer a query for the metrics.
+    Params: manifest(dict), the rollup tables returned by load_manifest()
+            metrics(list), the metric definitions of the query, all from one source
+            columns(list), the filter and dimension columns the query groups or filters by
+    Returns: dict, the manifest entry of the rollup table or None if the query must read the source
+    """
+    metric = metrics[0]
+    if metric.is_pre_aggregated is True:
+        return None
+
+    rollup = manifest.get(
+        rollup_table_name(metric.schema, metric.model, metric.timestamp)
+    )
+    if rollup is None or not set(columns) <= set(rollup["group_columns"]):
+        return None
+
+    for metric in metrics:
+        decomposed = decompose_metric_sql(metric.sql)
+        if decomposed is None or not set(decomposed["components"]) <= set(
+            rollup["components"]
+        ):
+            return None
+
+    return rollup
+
+
+def rollup_macros(warehouse_semantics=True):
+    """
+    Returns the macros the metric sql relies on, defined for the DuckDB instance that reads rollups.
+    Snowflake's DIV0 returns 0 for a zero divisor, the sample database's macro returns NULL.
+    """
+    div0 = "0" if warehouse_semantics else "NULL"
+
+    return [
+        f"CREATE OR REPLACE MACRO DIV0(x, y) AS CASE WHEN y = 0 THEN {div0} ELSE x / y END;",
+        "CREATE OR REPLACE MACRO ZEROIFNULL(x) AS COALESCE(x, 0);",
+        "CREATE OR REPLACE MACRO CONVERT_TIMEZONE(tz, ts) AS TIMEZONE(tz, ts);",
+    ]
+
+
+@st.cache_resource(show_spinner=False)
+def rollup_connection_manager(path, version, warehouse_semantics=True):
+    """
+    An in-memory DuckDB database with a view over every rollup Parquet file of the store.
+    Rebuilds replace the files atomically, so open views always read a complete rollup.
+    Params: path(str), the directory of the rollup store
+            version(float), the value of manifest_version(), a new manager is created after each build
+            warehouse_semantics(bool), whether DIV0 follows Snowflake rather than the sample database
+    Returns: DuckDBConnectionManager, hands out one cursor per thread
+    """
+    manager = DuckDBConnectionManager(path=":memory:", read_only=False)
+    connection = manager.connection
+
+    for macro in rollup_macros(warehouse_semantics):
+        connection.sql(macro)
+
+    connection.sql("CREATE SCHEMA IF NOT EXISTS core")
+    connection.sql("CREATE SCHEMA IF NOT EXISTS rollups")
+    connection.sql(
+        f"CREATE OR REPLACE VIEW core.calendar AS SELECT * FROM read_parquet('{os.path.join(path, CALENDAR_FILE)}')"
+    )
+
+    for name, rollup in load_manifest(path, version).items():
+        connection.sql(
+            f"CREATE OR REPLACE VIEW rollups.{name} AS SELECT * FROM read_parquet('{os.path.join(path, rollup['file'])}')"
+        )
+
+    return manager
@@ -2,15 +2,20 @@ import streamlit as st
 from streamlit_extras import app_logo
 import metric_atlas.Formatters as Formatters
 from metric_atlas.Config import Config
+from metric_atlas.DimensionProfiler import render_dimension_profile
+from metric_atlas.FilterCatalog import filter_catalog
+from metric_atlas.MetricsTable import metrics_tables
 import pandas as pd
-from streamlit_pandas_profiling import st_profile_report
 from dataclasses import dataclass, field
 
 import metric_atlas.helpers.helpers as helpers
 import metric_atlas.helpers.metrics.standard_metrics as metrics_helpers
 import metric_atlas.helpers.charts.charts as chart_helpers
 import metric_atlas.helpers.queries.queries as query_helpers
+import metric_atlas.helpers.queries.async_queries as async_queries
+import metric_atlas.helpers.metrics.local_grains as local_grains
 import metric_atlas.helpers.queries.query_params as query_param_helpers
+from metric_atlas.helpers.queries.arrow_tables import to_data_frame
 
 
 @dataclass
@@ -20,6 +25,154 @@ class MetricsExplorerPage:
     def __post_init__(self):
         self.metric_categories = Config().metric_categories
 
+    def data_queries(
+        self,
+        metric,
+        time_grain,
+        start_date,
+        end_date,
+        filters,
+        is_mid_period,
+        dimension=None,
+        top_n=None,
+    ):
+        """
+        A method that builds the metric query and, for metrics with dimensions, the sliced query.
+        Args:
+            self: The class instance.
+            metric: The metric to query.
+            time_grain: The time grain of the query.
+            start_date: The start date of the query.
+            end_date: The end date of the query.
+            filters: The selected filters.
+            is_mid_period: Whether the end date is in the middle of a period.
+            dimension: The dimension to slice the metric by.
+            top_n: The number of dimension values to slice by, the rest are grouped as Other.
+        Returns:
+            A list with the arguments of async_queries.execute() for each query, the metric query
+            first and the sliced query second. Without dimensions the sliced query is None.
+            A metric query that is derived from the daily series has the arguments of
+            local_grains.local_metrics() under "local" instead.
+        """
+        source = query_helpers.query_source([metric], filters)
+
+        if local_grains.is_local([metric]):
+            queries = [
+                {
+                    "local": {
+                        "metrics": [metric],
+                        "time_grain": time_grain,
+                        "start_date": start_date,
+                        "end_date": end_date,
+                        "filters": filters,
+                        "source": source,
+                    }
+                }
+            ]
+        else:
+            query, params = query_helpers.generate_query(
+                metric.schema,
+                metric.model,
+                metric.timestamp,
+                time_grain,
+                start_date,
+                end_date,
+                metrics=[metric],
+                filters=filters,
+                is_mid_period=is_mid_period,
+                source=source,
+            )
+
+            queries = [
+                {
+                    "query": query,
+                    "params": params,
+                    "source": source,
+                    "descriptor": query_helpers.query_descriptor(
+                        "metrics",
+                        [metric],
+                        time_grain,
+                        start_date,
+                        end_date,
+                        filters=filters,
+                        is_mid_period=is_mid_period,
+                        source=source,
+                    ),
+                }
+            ]
+
+        if dimension is None or len(metric.dimensions) < 1:
+            return queries + [None]
+
+        slice_source = query_helpers.query_source([metric], filters, [dimension])
+
+        slice_query, slice_params = query_helpers.generate_slice_query(
+            metric.schema,
+            metric.model,
+            metric.timestamp,
+            time_grain,
+            start_date,
+            end_date,
+            metrics=[metric],
+            dimensions=[dimension],
+            filters=filters,
+            source=slice_source,
+            top_n=top_n,
+        )
+
+        queries.append(
+            {
+                "query": slice_query,
+                "params": slice_params,
+                "source": slice_source,
+                "descriptor": query_helpers.query_descriptor(
+                    "slice",
+                    [metric],
+                    time_grain,
+                    start_date,
+                    end_date,
+                    filters=filters,
+                    dimensions=[dimension],
+                    source=slice_source,
+                    top_n=top_n,
+                ),
+            }
+        )
+
+        return queries
+
+    def run_queries(self, data_queries, option_source=None):
+        """
+        A method that looks up the filter options and runs the data queries concurrently.
+        Args:
+            self: The class instance.
+            data_queries: The metric and sliced queries, see data_queries().
+            option_source: The schema, model and filter fields to look up the options of.
+        Returns:
+            A tuple of the filter values keyed by field, see FilterCatalog.field_values(), and the
+            metric data and the sliced data as Arrow tables, None for a query that is None.
+        """
+        configuration = Config()
+        catalog = filter_catalog(configuration.filter_catalog_refresh)
+
+        def run(query):
+            if query is None:
+                return None
+            if "local" in query:
+                return async_queries.call(local_grains.local_metrics, **query["local"])
+            return async_queries.execute(**query, arrow=True)
+
+        return tuple(
+            async_queries.run_all(
+                (
+                    async_queries.call(catalog.field_values, *option_source)
+                    if option_source
+                    else None
+                ),
+                *[run(query) for query in data_queries],
+            )
+        )
+
     def render(self):
         configuration = Config()
 
@@ -153,28 +306,89 @@ class MetricsExplorerPage:
             args=("slice_by",),
         )
 
-        # Get Filter Options
-        st.sidebar.write("### Filters")
+        # Slice Values Number Input
+        slice_top_n = st.sidebar.number_input(
+            "Top Values:",
+            min_value=1,
+            value=Config().slice_top_n,
+            step=1,
+            help="The values with the largest metric over the date range, the rest are grouped as Other.",
+            on_change=callback_state,
+            key="slice_top_n",
+            args=("slice_top_n",),
+        )
+
+        end_of_period = helpers.period_start_end_date(end_date, time_grain)
+
+        is_mid_period = False if end_of_period[1] == end_date else True
+
+        # Filters Selected in the Previous Run
+        sorted_filters = sorted(metric.filters, key=lambda d: d["label"])
         if len(metric.filters) > 1:
-            option_query = query_helpers.generate_options_query(
-                metric.schema, metric.model, metric.filters
+            selected_filters = [
+                {
+                    "field": filter["name"],
+                    "label": filter["label"],
+                    "filter_values": list(st.session_state.get(filter["name"]) or []),
+                }
+                for filter in sorted_filters
+            ]
+        else:
+            selected_filters = []
+
+        # Get Filter Options, Metric Data and Sliced Data Concurrently
+        data_queries = self.data_queries(
+            metric,
+            time_grain,
+            start_date,
+            end_date,
+            selected_filters,
+            is_mid_period,
+            dimension,
+            slice_top_n,
+        )
+
+        if len(metric.filters) > 1:
+            option_source = (
+                metric.schema,
+                metric.model,
+                [filter["name"] for filter in metric.filters],
             )
-            raw_options = query_helpers.run_query(option_query)
-            sorted_filters = sorted(metric.filters, key=lambda d: d["label"])
+        else:
+            option_source = None
 
-            print(raw_options)
+        field_values, data, slice_data = self.run_queries(data_queries, option_source)
 
+        # Get Filter Options
+        st.sidebar.write("### Filters")
+        if field_values is not None:
             filters = []
 
             for filter in sorted_filters:
-                filtered_data = raw_options[raw_options["dimension"] == filter["name"]]
-                filter_options = filtered_data["select_option"].tolist()
+                values = field_values[filter["name"]]
+                selected_values = st.session_state.get(filter["name"])
 
                 # Remove items from session state if they are not in the filter options
-                if st.session_state.get(filter["name"]) is not None:
-                    for value in st.session_state[filter["name"]]:
-                        if value not in filter_options:
-                            st.session_state[filter["name"]].remove(value)
+                if selected_values is not None:
+                    for value in list(selected_values):
+                        if value not in values.value_set:
+                            selected_values.remove(value)
+
+                # Fields with many values are searched by prefix instead of listed in full
+                if len(values.values) > configuration.filter_option_limit:
+                    prefix = st.sidebar.text_input(
+                        f"Search {filter['label']}", key=f"{filter['name']}_search"
+                    )
+                    filter_options = values.search(
+                        prefix, configuration.filter_option_limit
+                    )
+                    filter_options += [
+                        value
+                        for value in selected_values or []
+                        if value not in filter_options
+                    ]
+                else:
+                    filter_options = values.values
 
                 filters.append(
                     {
@@ -192,25 +406,23 @@ class MetricsExplorerPage:
         else:
             filters = []
 
-        # Get Metric Data
-        end_of_period = helpers.period_start_end_date(end_date, time_grain)
-
-        is_mid_period = False if end_of_period[1] == end_date else True
-
-        # Get Metric Data
-        query = query_helpers.generate_query(
-            metric.schema,
-            metric.model,
-            metric.timestamp,
-            time_grain,
-            start_date,
-            end_date,
-            metrics=[metric],
-            filters=filters,
-            is_mid_period=is_mid_period,
-        )
+        # Query Again if Selected Values Were Removed from the Filter Options
+        if filters != selected_filters:
+            data_queries = self.data_queries(
+                metric,
+                time_grain,
+                start_date,
+                end_date,
+                filters,
+                is_mid_period,
+                dimension,
+                slice_top_n,
+            )
+            _, data, slice_data = self.run_queries(data_queries)
 
-        data = query_helpers.run_query(query)
+        # The results are shared Arrow tables, convert them where they are displayed
+        metrics_table = metrics_tables().table(data, metric)
+        data = to_data_frame(data)
 
         st.header(metric.label)
 
@@ -471,61 +683,37 @@ class MetricsExplorerPage:
 
         # Metric Table
         pivot_data, raw_data = st.tabs(["Metrics Data", "Raw Data"])
-        table_data = data
-        table_data.fillna(0, inplace=True)
-
-        format_options = helpers.table_format(table_data, metric)
 
         with pivot_data:
-            pivot_metrics = pd.pivot_table(
-                format_options.get("table_data"),
-                columns="Time Period",
-                dropna=False,
-                aggfunc=lambda x: " ".join(str(v) for v in x),
-            )
-            csv_pivot_data = pivot_metrics.to_csv().encode("utf-8")
-
             st.download_button(
                 "Download Data as CSV",
-                csv_pivot_data,
+                metrics_table.pivot_csv,
                 f"{metric.name}_metrics_pivot.csv",
                 "text/csv",
                 key="download-pivot-csv",
             )
 
-            st.dataframe(pivot_metrics)
+            st.dataframe(metrics_table.formatted_pivot)
 
         with raw_data:
-            csv_raw_data = format_options.get("table_data").to_csv().encode("utf-8")
-
             st.download_button(
                 "Download Data as CSV",
-                csv_raw_data,
+                metrics_table.rows_csv,
                 f"{metric.name}_metrics_raw.csv",
                 "text/csv",
                 key="download-raw-csv",
             )
 
-            st.dataframe(format_options.get("table_data"))
+            st.dataframe(metrics_table.formatted_rows)
 
         if len(metric.dimensions) >= 1:
             # Sliced Data
             st.header(f"{metric.label} by {dimension.label}")
 
-            slice_query = query_helpers.generate_slice_query(
-                metric.schema,
-                metric.model,
-                metric.timestamp,
-                time_grain,
-                start_date,
-                end_date,
-                metrics=[metric],
-                dimensions=[dimension],
-                filters=filters,
+            slice_data = query_helpers.label_other_values(
+                to_data_frame(slice_data), [dimension]
             )
 
-            slice_data = query_helpers.run_query(slice_query)
-
             # Slice Chart
             slice_line_chart = chart_helpers.create_slice_chart(
                 "line", slice_data, metric, time_grain, dimension=dimension
@@ -546,8 +734,8 @@ class MetricsExplorerPage:
             with slice_by_bar_chart:
                 st.plotly_chart(slice_bar_chart, use_container_width=True)
 
-            slice_by_metrics_data, slice_by_raw_data = st.tabs(
-                ["Metrics Data", "Raw Data"]
+            slice_by_metrics_data, slice_by_raw_data, profiled_data = st.tabs(
+                ["Metrics Data", "Raw Data", "Dimension Profiling"]
             )
 
             # Slice Table
@@ -593,10 +781,8 @@ class MetricsExplorerPage:
 
                 st.dataframe(slice_raw_data_formatted)
 
-            # with profiled_data:
-            #     dim_name = dimension.label
-            #     pr = slice_data[[dim_name]].profile_report()
-            #     st_profile_report(pr)
+            with profiled_data:
+                render_dimension_profile(slice_data, metric, dimension)
         else:
             st.write("There are no dimensions to slice by for this metric.")
 
@@ -742,7 +928,7 @@ def generate_page():
         option_query = query_helpers.generate_options_query(
             metric.schema, metric.model, metric.filters
         )
-        raw_options = query_helpers.run_query(option_query)
+        raw_options = query_helpers.run_query(*option_query)
         sorted_filters = sorted(metric.filters, key=lambda d: d["label"])
 
         filters = []
@@ -791,7 +977,7 @@ def generate_page():
         is_mid_period=is_mid_period,
     )
 
-    data = query_helpers.run_query(query)
+    data = query_helpers.run_query(*query)
 
     st.header(metric.label)
 
@@ -1073,7 +1259,7 @@ def generate_page():
         st.dataframe(pivot_metrics)
 
     with raw_data:
-        csv_raw_data = format_options.get("table_data").to_csv().encode("utf-8")
+        csv_raw_data = format_options.get("raw_data").to_csv().encode("utf-8")
 
         st.download_button(
             "Download Data as CSV",
@@ -1101,7 +1287,7 @@ def generate_page():
             filters=filters,
         )
 
-        slice_data = query_helpers.run_query(slice_query)
+        slice_data = query_helpers.run_query(*slice_query)
 
         # Slice Chart
         slice_line_chart = chart_helpers.create_slice_chart(
@@ -1169,9 +1355,7 @@ def generate_page():
             st.dataframe(slice_raw_data_formatted)
 
         with profiled_data:
-            dim_name = dimension.label
-            pr = slice_data[[dim_name]].profile_report()
-            st_profile_report(pr)
+            render_dimension_profile(slice_data, metric, dimension)
     else:
         st.write("There are no dimensions to slice by for this metric.")
 
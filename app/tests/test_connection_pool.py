@@ -0,0 +1,105 @@
+from dataclasses import dataclass
+import pytest
+from metric_atlas.helpers.queries.connections import ConnectionPool, LocalConnection
+
+# Run from the app directory against the sample database: python -m pytest tests
+DATABASE = "db/sample_data.db"
+
+
+@dataclass
+class FlakyConnection(LocalConnection):
+    """
+    A LocalConnection whose session can be dropped without closing it, like a Snowflake session
+    that expired on the server.
+    """
+
+    is_dropped: bool = False
+
+    def cursor(self, cursor_class=None):
+        if self.is_dropped:
+            raise ConnectionError("Session no longer exists.")
+
+        return super().cursor(cursor_class)
+
+
+def flaky_pool(**kwargs):
+    return ConnectionPool(connect=lambda: FlakyConnection(DATABASE), **kwargs)
+
+
+def run_query(connection):
+    return connection.cursor().execute("SELECT ?::INT AS x", [1]).fetchall()
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted():
+    pool = flaky_pool(size=1, timeout=0.1)
+    connection = pool.checkout()
+
+    with pytest.raises(TimeoutError):
+        pool.checkout()
+
+    pool.checkin(connection)
+    assert pool.checkout() is connection
+
+
+def test_stale_connection_is_reconnected_on_checkout():
+    pool = flaky_pool(size=1, validate_after=0)
+
+    with pool.connection() as connection:
+        run_query(connection)
+    connection.is_dropped = True
+
+    with pool.connection() as replacement:
+        assert replacement is not connection
+        assert run_query(replacement) == [(1,)]
+
+    assert pool.stats()["open"] == 1
+
+
+def test_closed_connection_is_dropped_on_checkin():
+    pool = flaky_pool(size=1)
+
+    with pool.connection() as connection:
+        connection.close()
+
+    assert pool.stats() == {"size": 1, "open": 0, "in_use": 0, "idle": 0}
+
+
+def test_failed_connection_is_discarded_when_its_session_dropped():
+    # Long enough that only a failed checkin triggers the validation
+    pool = flaky_pool(size=1, validate_after=3600)
+
+    with pytest.raises(ConnectionError):
+        with pool.connection() as connection:
+            connection.is_dropped = True
+            run_query(connection)
+
+    with pool.connection() as replacement:
+        assert replacement is not connection
+        assert run_query(replacement) == [(1,)]
+
+    assert connection.is_closed()
+    assert pool.stats()["open"] == 1
+
+
+def test_failed_connection_with_a_live_session_is_reused():
+    pool = flaky_pool(size=1, validate_after=3600)
+
+    with pytest.raises(Exception):
+        with pool.connection() as connection:
+            connection.cursor().execute("SELECT * FROM missing_table")
+
+    with pool.connection() as reused:
+        assert reused is connection
+
+
+def test_stats_report_connections_in_use_and_idle():
+    pool = flaky_pool(size=3)
+
+    first, second = pool.checkout(), pool.checkout()
+    assert pool.stats() == {"size": 3, "open": 2, "in_use": 2, "idle": 0}
+
+    pool.checkin(first)
+    assert pool.stats() == {"size": 3, "open": 2, "in_use": 1, "idle": 1}
+
+    pool.checkin(second)
+    assert pool.stats() == {"size": 3, "open": 2, "in_use": 0, "idle": 2}
@@ -0,0 +1,120 @@
+from datetime import date
+import pandas as pd
+import pytest
+import metric_atlas.helpers.helpers as helpers
+import metric_atlas.helpers.queries.queries as query_helpers
+from metric_atlas.Config import Config
+from metric_atlas.FilterCatalog import FilterCatalog, FilterValues
+from metric_atlas.helpers.metrics import local_grains
+from metric_atlas.helpers.queries.arrow_tables import to_data_frame
+
+# Run from the app directory against the sample database: python -m pytest tests
+FIELDS = ["industry", "market_segment", "sales_rep_name"]
+
+
+def selected(field, *values):
+    return {"field": field, "label": field, "filter_values": list(values)}
+
+
+@pytest.mark.parametrize(
+    "time_grain, filters",
+    [
+        ("month", [selected("market_segment", "Mid-Market")]),
+        ("week", [selected("industry", "Construction", "Other", "Bogus")]),
+        (
+            "quarter",
+            [
+                selected("industry", "Business Services"),
+                selected("market_segment", "SMB", "Enterprise"),
+                selected("sales_rep_name", "Robert Haynes"),
+            ],
+        ),
+        ("day", [selected("industry", "Bogus")]),
+    ],
+)
+def test_filter_cube_matches_the_filtered_query(monkeypatch, time_grain, filters):
+    metrics = helpers.get_metric_definition("sample")
+    start_date, end_date = date(2022, 3, 1), date(2023, 6, 30)
+    filters = filters + [
+        selected(field)
+        for field in FIELDS
+        if field not in [x["field"] for x in filters]
+    ]
+
+    cubes = []
+    filter_cube = local_grains.filter_cube
+    monkeypatch.setattr(
+        local_grains,
+        "filter_cube",
+        lambda *args: cubes.append(filter_cube(*args)) or cubes[-1],
+    )
+
+    local = to_data_frame(
+        local_grains.local_metrics(metrics, time_grain, start_date, end_date, filters)
+    )
+    is_mid_period = helpers.period_start_end_date(end_date, time_grain)[1] != end_date
+    queried = query_helpers.execute_query(
+        *query_helpers.generate_query(
+            "sales",
+            "opportunities",
+            "close_date",
+            time_grain,
+            start_date,
+            end_date,
+            metrics=metrics,
+            filters=filters,
+            is_mid_period=is_mid_period,
+        ),
+        arrow=True,
+    )
+
+    # The filters were applied to the cube's codes, not by a filtered query
+    assert len(cubes) == 1 and cubes[0] is not None
+    pd.testing.assert_frame_equal(to_data_frame(queried), local, rtol=1e-9)
+
+
+def test_catalog_reads_the_values_again_when_the_data_version_changes(monkeypatch):
+    versions = iter(["v1", "v1", "v2"])
+    monkeypatch.setattr(query_helpers, "data_version", lambda *args: next(versions))
+    catalog = FilterCatalog(refresh_interval=0)
+
+    first = catalog.field_values("sales", "opportunities", FIELDS)
+    assert catalog.field_values("sales", "opportunities", FIELDS) is first
+
+    changed = catalog.field_values("sales", "opportunities", FIELDS)
+    assert changed is not first
+    assert changed["industry"].values == first["industry"].values
+    assert "Construction" in changed["industry"].value_set
+
+
+def test_catalog_checks_the_data_version_once_per_refresh_interval(monkeypatch):
+    checks = []
+    monkeypatch.setattr(
+        query_helpers, "data_version", lambda *args: checks.append(args) or "v1"
+    )
+    catalog = FilterCatalog(refresh_interval=300)
+
+    first = catalog.field_values("sales", "opportunities", FIELDS)
+    assert catalog.field_values("sales", "opportunities", FIELDS) is first
+    assert len(checks) == 1
+
+
+def test_prefix_search_of_fields_above_the_option_limit():
+    limit = Config().filter_option_limit
+    values = FilterValues(
+        values=[
+            *[f"Vendor {index:05d}" for index in range(limit * 2)],
+            "vendor lowercase",
+            "Other",
+        ],
+        counts=[1] * (limit * 2 + 2),
+    )
+    assert len(values.values) > limit
+
+    matches = values.search("VENDOR 0", limit)
+    assert len(matches) == limit
+    assert matches == sorted(matches) and matches[0] == "Vendor 00000"
+
+    assert values.search("vendor l", limit) == ["vendor lowercase"]
+    assert values.search("oth") == ["Other"]
+    assert values.search("missing", limit) == []
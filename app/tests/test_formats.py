@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from babel.numbers import format_currency
+from metric_atlas.helpers.formats import format_currency_values
+
+# Values a few ulps off a half, which round away from the half, and exact halves, which round to even
+VALUES = [
+    -142.22500000000002,
+    -237.82500000000005,
+    360.52500000000003,
+    1657.3749999999995,
+    2.675,
+    0.125,
+    -0.005,
+    1234567.885,
+]
+
+
+def test_format_currency_values_matches_babel():
+    rng = np.random.default_rng(0)
+    values = pd.Series(
+        [
+            *VALUES,
+            *np.round(rng.uniform(-5000, 5000, 2000), 3),
+            *rng.uniform(-5000, 5000, 2000),
+        ]
+    )
+
+    expected = [format_currency(value, "USD", locale="en_US") for value in values]
+
+    assert format_currency_values(values).tolist() == expected
@@ -0,0 +1,29 @@
+from metric_atlas.helpers.import_time import (
+    LAZY_PACKAGES,
+    PAGE_MODULES,
+    check_import_budget,
+    measure_imports,
+)
+
+# Run from the app directory: python -m pytest tests
+IMPORT_BUDGET_MS = 3000
+
+
+def test_pages_import_within_budget_without_lazy_packages():
+    timings = measure_imports(PAGE_MODULES)
+
+    imported = sorted(
+        module for module in timings if module.split(".")[0] in LAZY_PACKAGES
+    )
+    assert imported == []
+    assert timings["total"] / 1000 < IMPORT_BUDGET_MS
+
+
+def test_check_import_budget_reports_slow_and_eager_imports():
+    timings = {"total": 3_500_000, "pandas": 400_000, "snowflake.connector": 900_000}
+
+    assert check_import_budget(timings, budget_ms=3000) == [
+        "Importing the pages took 3500ms of 3000ms.",
+        "snowflake.connector is imported when the pages are imported.",
+    ]
+    assert check_import_budget({"total": 1_000_000, "pandas": 400_000}) == []
@@ -0,0 +1,115 @@
+import threading
+import time
+import pyarrow as pa
+import pytest
+from metric_atlas.helpers.queries.cache_backends import (
+    FileSystemCacheBackend,
+    SQLiteCacheBackend,
+)
+from metric_atlas.helpers.queries.result_cache import ResultCache, descriptor_key
+
+KEY = descriptor_key({"query_type": "metrics", "metrics": [["sample", "win_rate"]]})
+TABLE = pa.table({"Time Period": ["2023-01"], "Win Rate": [0.5]})
+
+
+@pytest.fixture(params=["filesystem", "sqlite"])
+def make_backend(request, tmp_path):
+    # Every call stands for another process, with its own backend on the same store
+    def make_backend():
+        if request.param == "filesystem":
+            return FileSystemCacheBackend(path=str(tmp_path / "result_cache"))
+
+        return SQLiteCacheBackend(path=str(tmp_path / "result_cache.sqlite"))
+
+    return make_backend
+
+
+def test_hit_after_set(make_backend):
+    cache = ResultCache(backend=make_backend())
+    cache.set(KEY, TABLE)
+
+    assert cache.get(KEY).equals(TABLE)
+
+    # Another process finds the result in the shared tier
+    other = ResultCache(backend=make_backend())
+    assert other.get(KEY).equals(TABLE)
+    assert (cache.stats()["hits"], other.stats()["shared_hits"]) == (1, 1)
+
+
+def test_closed_entry_is_dropped_when_the_data_version_changes(make_backend):
+    cache = ResultCache(ttl=0, backend=make_backend())
+    cache.set(KEY, TABLE, data_version="v1", is_closed=True)
+
+    # Closed entries don't expire with the ttl
+    assert cache.get(KEY, data_version="v1").equals(TABLE)
+    assert cache.get(KEY, data_version="v2") is None
+    assert ResultCache(backend=make_backend()).get(KEY, data_version="v2") is None
+
+
+def test_open_entry_expires_after_the_ttl(make_backend):
+    cache = ResultCache(ttl=0.2, backend=make_backend())
+    cache.set(KEY, TABLE, data_version="v1")
+
+    assert cache.get(KEY, data_version="v1").equals(TABLE)
+
+    time.sleep(0.3)
+    assert cache.get(KEY, data_version="v1") is None
+    assert ResultCache(backend=make_backend()).get(KEY, data_version="v1") is None
+
+
+def test_waits_for_the_process_holding_the_lease(make_backend):
+    holder = ResultCache(backend=make_backend())
+    token = holder.backend.acquire(KEY, lease=10)
+    assert token is not None
+
+    waiter = ResultCache(lock_timeout=10, poll_interval=0.05, backend=make_backend())
+    computed = []
+    results = []
+
+    def compute():
+        computed.append(True)
+        return TABLE
+
+    thread = threading.Thread(
+        target=lambda: results.append(waiter.get_or_compute(KEY, compute))
+    )
+    thread.start()
+
+    time.sleep(0.3)
+    holder.set(KEY, TABLE)
+    holder.backend.release(KEY, token)
+    thread.join(timeout=5)
+
+    assert results[0].equals(TABLE)
+    assert computed == []
+    assert waiter.stats()["waits"] == 1
+
+
+def test_stale_lock_is_taken_over(make_backend):
+    # A process that died while holding the lock never releases it
+    dead = make_backend()
+    stale_token = dead.acquire(KEY, lease=0.2)
+    assert stale_token is not None
+
+    backend = make_backend()
+    assert backend.acquire(KEY, lease=0.2) is None
+
+    time.sleep(0.3)
+    token = backend.acquire(KEY, lease=10)
+    assert token is not None
+
+    # A late release of the stale lock leaves the new lock alone
+    dead.release(KEY, stale_token)
+    assert make_backend().acquire(KEY, lease=10) is None
+
+    backend.release(KEY, token)
+    assert make_backend().acquire(KEY, lease=10) is not None
+
+
+def test_computes_after_a_stale_lock(make_backend):
+    make_backend().acquire(KEY, lease=0.2)
+    time.sleep(0.3)
+
+    cache = ResultCache(lock_timeout=0.2, poll_interval=0.05, backend=make_backend())
+    assert cache.get_or_compute(KEY, lambda: TABLE).equals(TABLE)
+    assert ResultCache(backend=make_backend()).get(KEY).equals(TABLE)
@@ -0,0 +1,202 @@
+import dataclasses
+import glob
+import os
+import shutil
+from datetime import date
+import duckdb
+import pandas as pd
+import pytest
+import metric_atlas.helpers.helpers as helpers
+import metric_atlas.helpers.queries.queries as query_helpers
+from metric_atlas.helpers import rollups
+from metric_atlas.helpers.queries.connections import DuckDBConnectionManager
+from metric_atlas.RollupStore import RollupStore
+
+# Run from the app directory against the sample database: python -m pytest tests
+DATABASE = "db/sample_data.db"
+
+
+def test_decomposes_sum_and_count_if_inside_div0():
+    decomposed = rollups.decompose_metric_sql(
+        "DIV0(SUM(metric_source.revenue_dollars), COUNT_IF(metric_source.is_won = TRUE))"
+    )
+    total = rollups.component_name("SUM", "metric_source.revenue_dollars")
+    won = rollups.component_name("COUNT_IF", "metric_source.is_won = TRUE")
+
+    assert decomposed == {
+        "components": {
+            total: "SUM(metric_source.revenue_dollars)",
+            won: "COUNT_IF(metric_source.is_won = TRUE)",
+        },
+        "sql": f"DIV0({{{total}}}, {{{won}}})",
+    }
+
+
+def test_decomposes_avg_into_a_sum_and_a_count():
+    decomposed = rollups.decompose_metric_sql("AVG(metric_source.days)")
+    total = rollups.component_name("SUM", "metric_source.days")
+    count = rollups.component_name("COUNT", "metric_source.days")
+
+    assert decomposed == {
+        "components": {
+            total: "SUM(metric_source.days)",
+            count: "COUNT(metric_source.days)",
+        },
+        "sql": f"({{{total}}} / NULLIF({{{count}}}, 0))",
+    }
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "COUNT(*)",
+        "COUNT(DISTINCT metric_source.sales_rep_id)",
+        "SUM(metric_source.revenue_dollars) OVER (PARTITION BY metric_source.industry)",
+        "MEDIAN(metric_source.revenue_dollars)",
+        "SUM(metric_source.revenue_dollars) / metric_source.revenue_dollars",
+    ],
+)
+def test_rejects_metrics_that_are_not_decomposable(sql):
+    assert rollups.decompose_metric_sql(sql) is None
+
+
+@pytest.fixture
+def sample_database(tmp_path, monkeypatch):
+    """
+    A copy of the sample database with an updated_at column, read by the queries of the app.
+    Yields a function that runs a statement on the copy.
+    """
+    path = str(tmp_path / "sample_data.db")
+    shutil.copy(DATABASE, path)
+
+    state = {}
+
+    def execute(statement):
+        if state.get("manager"):
+            state.pop("manager").close()
+
+        connection = duckdb.connect(path)
+        try:
+            connection.sql(statement)
+        finally:
+            connection.close()
+
+    def manager():
+        if not state.get("manager"):
+            state["manager"] = DuckDBConnectionManager(path=path)
+
+        return state["manager"]
+
+    execute(
+        "ALTER TABLE sales.opportunities ADD COLUMN updated_at TIMESTAMP DEFAULT TIMESTAMP '2024-01-01'"
+    )
+
+    # Copies of the metrics, the registry's definitions are shared with the other tests
+    get_metric_definition = helpers.get_metric_definition
+    monkeypatch.setattr(
+        helpers,
+        "get_metric_definition",
+        lambda *args, **kwargs: [
+            dataclasses.replace(metric, updated_at="updated_at")
+            for metric in get_metric_definition(*args, **kwargs)
+        ],
+    )
+    monkeypatch.setattr(query_helpers, "duckdb_connection_manager", manager)
+
+    yield execute
+
+    if state.get("manager"):
+        state["manager"].close()
+
+
+def read_rollups(path):
+    return {
+        os.path.basename(file): duckdb.sql(
+            f"SELECT * FROM read_parquet('{file}') ORDER BY ALL"
+        ).df()
+        for file in glob.glob(os.path.join(path, "*.parquet"))
+    }
+
+
+def test_refresh_after_changes_equals_a_full_build(sample_database, tmp_path):
+    refreshed = RollupStore(path=str(tmp_path / "refreshed"))
+    refreshed.build()
+
+    # A moved, a changed, a deleted and a new row, and a day left without rows
+    sample_database(
+        """
+        UPDATE sales.opportunities
+        SET close_date = '2023-06-20', updated_at = TIMESTAMP '2025-01-01'
+        WHERE OPPORUNITY_ID = '01b004e3-6c91-48f9-8299-f31d5226a209';
+
+        UPDATE sales.opportunities
+        SET revenue_dollars = revenue_dollars + 1000, updated_at = TIMESTAMP '2025-01-01'
+        WHERE OPPORUNITY_ID = '151c5690-c1ba-4fbe-86c9-96a72c57e1a2';
+
+        DELETE FROM sales.opportunities
+        WHERE OPPORUNITY_ID = 'd474d951-55f9-42a8-a772-88f374dd2ba5';
+
+        DELETE FROM sales.opportunities WHERE close_date = '2022-08-03';
+
+        INSERT INTO sales.opportunities
+        SELECT * REPLACE (
+            'new-opportunity' AS OPPORUNITY_ID,
+            DATE '2022-11-02' AS CLOSE_DATE,
+            TIMESTAMP '2025-01-01' AS updated_at
+        )
+        FROM sales.opportunities
+        WHERE OPPORUNITY_ID = '94c1baab-36d3-4772-ac96-5d65bd7530a2';
+        """
+    )
+
+    manifest = refreshed.refresh(late_arriving_days=3)
+    assert all(table["refreshed_at"] for table in manifest.values())
+
+    built = RollupStore(path=str(tmp_path / "built"))
+    built.build()
+
+    refreshed_tables = read_rollups(refreshed.path)
+    built_tables = read_rollups(built.path)
+
+    assert refreshed_tables.keys() == built_tables.keys()
+    for name, table in built_tables.items():
+        pd.testing.assert_frame_equal(refreshed_tables[name], table, check_dtype=False)
+
+
+@pytest.mark.parametrize("time_grain", ["day", "week", "month", "quarter", "year"])
+def test_rollup_results_match_the_source(sample_database, tmp_path, time_grain):
+    path = str(tmp_path / "rollups")
+    RollupStore(path=path).build()
+    connection = rollups.rollup_connection_manager(
+        path, rollups.manifest_version(path), warehouse_semantics=False
+    ).cursor()
+
+    metrics = helpers.get_metric_definition("sample")
+    for filters in [
+        [],
+        [
+            {
+                "field": "market_segment",
+                "label": "Market Segment",
+                "filter_values": ["Mid-Market"],
+            }
+        ],
+    ]:
+        arguments = (
+            "sales",
+            "opportunities",
+            "close_date",
+            time_grain,
+            date(2022, 3, 1),
+            date(2023, 6, 30),
+        )
+        source = query_helpers.execute_query(
+            *query_helpers.generate_query(*arguments, metrics=metrics, filters=filters)
+        )
+        rolled_up = connection.execute(
+            *query_helpers.generate_query(
+                *arguments, metrics=metrics, filters=filters, source="rollup"
+            )
+        ).df()
+
+        pd.testing.assert_frame_equal(source, rolled_up, check_dtype=False)
@@ -0,0 +1,79 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from metric_atlas.helpers.queries.single_flight import SingleFlight
+
+CALLERS = 20
+
+
+@dataclass
+class SlowConnection:
+    """
+    A fake connection whose queries take ``latency`` seconds, so concurrent callers overlap.
+    """
+
+    latency: float = 0.5
+    executed: int = 0
+    error: Exception = None
+
+    def execute(self, query):
+        self.executed += 1
+        time.sleep(self.latency)
+
+        if self.error is not None:
+            raise self.error
+
+        return [(query,)]
+
+
+def call_concurrently(flight, connection, callers=CALLERS):
+    barrier = threading.Barrier(callers)
+
+    def call(_):
+        barrier.wait()
+        try:
+            return flight.do("SELECT 1", lambda: connection.execute("SELECT 1"))
+        except Exception as error:
+            return error
+
+    with ThreadPoolExecutor(max_workers=callers) as executor:
+        return list(executor.map(call, range(callers)))
+
+
+def test_concurrent_callers_share_one_query():
+    connection = SlowConnection()
+    flight = SingleFlight()
+
+    results = call_concurrently(flight, connection)
+
+    assert connection.executed == 1
+    assert flight.stats() == {
+        "executed": 1,
+        "coalesced": CALLERS - 1,
+        "in_flight": 0,
+    }
+    assert len({id(result) for result, _ in results}) == 1
+    assert sorted(is_shared for _, is_shared in results) == [False] + [True] * (
+        CALLERS - 1
+    )
+
+
+def test_followers_get_the_leaders_exception():
+    error = RuntimeError("warehouse unavailable")
+    connection = SlowConnection(error=error)
+    flight = SingleFlight()
+
+    results = call_concurrently(flight, connection)
+
+    assert connection.executed == 1
+    assert flight.stats()["coalesced"] == CALLERS - 1
+    assert all(result is error for result in results)
+
+    # The failed call is forgotten, the next caller runs the query again
+    connection.error = None
+    assert flight.do("SELECT 1", lambda: connection.execute("SELECT 1")) == (
+        [("SELECT 1",)],
+        False,
+    )
+    assert connection.executed == 2
@@ -0,0 +1,86 @@
+from datetime import date
+import pandas as pd
+import metric_atlas.helpers.helpers as helpers
+import metric_atlas.helpers.queries.queries as query_helpers
+
+# Run from the app directory against the sample database: python -m pytest tests
+START_DATE, END_DATE = date(2022, 1, 1), date(2023, 6, 30)
+
+
+def sample_metric(name):
+    return [m for m in helpers.get_metric_definition("sample") if m.name == name][0]
+
+
+def dimension_of(metric, name):
+    return [d for d in metric.dimensions if d.name == name][0]
+
+
+def slice_data(metric, dimension, top_n=None):
+    return query_helpers.execute_query(
+        *query_helpers.generate_slice_query(
+            metric.schema,
+            metric.model,
+            metric.timestamp,
+            "month",
+            START_DATE,
+            END_DATE,
+            metrics=[metric],
+            dimensions=[dimension],
+            top_n=top_n,
+        )
+    )
+
+
+def test_top_values_keep_a_real_other_value_apart_from_the_other_slice():
+    metric = sample_metric("average_sales_cycle")
+    industry = dimension_of(metric, "industry")
+
+    full = slice_data(metric, industry)
+    top = slice_data(metric, industry, top_n=10)
+
+    # The sample data has an industry named Other, which ranks within the top 10
+    real_other = top[(top["Industry"] == "Other") & ~top["Is Other"]]
+    expected = full[full["Industry"] == "Other"]
+    assert len(real_other) > 0
+    pd.testing.assert_series_equal(
+        real_other.set_index("Time Period")[metric.label].sort_index(),
+        expected.set_index("Time Period")[metric.label].sort_index(),
+    )
+    assert real_other.set_index("Time Period").loc["2023-03", metric.label] == 102.5
+
+    # The slice of the other values is the metric over their rows, not a sum of their values
+    top_values = set(top.loc[~top["Is Other"], "Industry"].dropna())
+    other_values = sorted(set(full["Industry"].dropna()) - top_values)
+    metric_data = query_helpers.execute_query(
+        *query_helpers.generate_query(
+            metric.schema,
+            metric.model,
+            metric.timestamp,
+            "month",
+            START_DATE,
+            END_DATE,
+            metrics=[metric],
+            filters=[{"field": "industry", "label": "", "filter_values": other_values}],
+        )
+    ).set_index("Time Period")[metric.label]
+    other_slice = top[top["Is Other"]].set_index("Time Period")[metric.label]
+    assert len(other_slice) > 0
+    pd.testing.assert_series_equal(
+        other_slice.sort_index(),
+        metric_data[other_slice.index].sort_index(),
+        check_names=False,
+    )
+
+
+def test_the_other_slice_is_renamed_when_a_value_has_its_name():
+    metric = sample_metric("average_sales_cycle")
+    industry = dimension_of(metric, "industry")
+
+    data = query_helpers.label_other_values(
+        slice_data(metric, industry, top_n=10), [industry]
+    )
+
+    assert "Is Other" not in data.columns
+    assert {"Other", "(Other)"} <= set(data["Industry"])
+    for _, rows in data.groupby("Time Period"):
+        assert rows["Industry"].dropna().is_unique